@@ -1,3 +1,4 @@
+from celery.signals import worker_process_init
 from app.web import create_app
 from app.logging import configure_logging, get_module_logger
 from app.logging.config import ProductionConfig
@@ -24,3 +25,16 @@ if "celery" not in flask_app.extensions:
 celery_app = flask_app.extensions["celery"]
 
 logger.info("Celery worker initialized with colorful logging")
+
+
+@worker_process_init.connect
+def warm_up_worker(**kwargs):
+    """
+    Start loading the model in each worker process after the fork. It runs
+    in a thread: the parent gives a child worker_proc_alive_timeout (4 s)
+    to come up, which a model load can exceed. Tasks started before it
+    finishes load what they need themselves.
+    """
+    from app.chat.warmup import start_warm_up
+
+    start_warm_up()
@@ -1,4 +1,11 @@
 from .create_embeddings import create_embeddings_for_pdf
 from .score import score_conversation, get_scores
 from .chat import build_chat
+from .answer_cache import (
+    lookup_answer,
+    store_answer,
+    invalidate_answers,
+    stream_cached_answer,
+)
 from .models import ChatArgs
+from .chains.executor import StreamRejected
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from typing import Iterator, Optional
+
+import numpy as np
+
+from app.chat.embeddings.openai import get_embeddings
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.answer_cache")
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_PER_PDF = int(os.getenv("ANSWER_CACHE_MAX_PER_PDF", "200"))
+
+
+class _MemoryBackend:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def entries(self, pdf_id):
+        with self._lock:
+            return list(self._entries.get(pdf_id, {}).items())
+
+    def add(self, pdf_id, entry_id, entry):
+        with self._lock:
+            self._entries.setdefault(pdf_id, {})[entry_id] = entry
+
+    def remove(self, pdf_id, entry_ids):
+        with self._lock:
+            for entry_id in entry_ids:
+                self._entries.get(pdf_id, {}).pop(entry_id, None)
+
+    def clear(self, pdf_id):
+        with self._lock:
+            self._entries.pop(pdf_id, None)
+
+
+class _RedisBackend:
+    """One Redis hash per PDF, so the Celery worker can invalidate it"""
+
+    def __init__(self, url):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.1)
+
+    def _key(self, pdf_id):
+        return f"answer_cache:{pdf_id}"
+
+    def entries(self, pdf_id):
+        raw = self._redis.hgetall(self._key(pdf_id))
+        return [(k.decode(), json.loads(v)) for k, v in raw.items()]
+
+    def add(self, pdf_id, entry_id, entry):
+        pipe = self._redis.pipeline()
+        pipe.hset(self._key(pdf_id), entry_id, json.dumps(entry))
+        pipe.expire(self._key(pdf_id), ANSWER_CACHE_TTL)
+        pipe.execute()
+
+    def remove(self, pdf_id, entry_ids):
+        if entry_ids:
+            self._redis.hdel(self._key(pdf_id), *entry_ids)
+
+    def clear(self, pdf_id):
+        self._redis.delete(self._key(pdf_id))
+
+
+_backend = None
+
+
+def _get_backend():
+    global _backend
+    if _backend is None:
+        redis_url = os.getenv("REDIS_URI")
+        _backend = _RedisBackend(redis_url) if redis_url else _MemoryBackend()
+    return _backend
+
+
+def _embed(question: str) -> np.ndarray:
+    vector = np.asarray(get_embeddings().embed_query(question), dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def lookup_answer(pdf_id: str, question: str) -> Optional[str]:
+    """
+    Returns a cached answer for a standalone question about the given PDF if
+    a previously answered question is at least ANSWER_CACHE_THRESHOLD cosine
+    similar and younger than ANSWER_CACHE_TTL seconds.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    try:
+        backend = _get_backend()
+        entries = backend.entries(pdf_id)
+        if not entries:
+            return None
+
+        now = time.time()
+        expired = [k for k, e in entries if now - e["created"] > ANSWER_CACHE_TTL]
+        entries = [(k, e) for k, e in entries if now - e["created"] <= ANSWER_CACHE_TTL]
+        backend.remove(pdf_id, expired)
+        if not entries:
+            return None
+
+        query = _embed(question)
+        vectors = np.asarray([e["vector"] for _, e in entries], dtype=np.float32)
+        scores = vectors @ query
+        best = int(np.argmax(scores))
+        if scores[best] < ANSWER_CACHE_THRESHOLD:
+            return None
+
+        logger.info(f"Answer cache hit for PDF {pdf_id} (similarity {scores[best]:.3f})")
+        return entries[best][1]["answer"]
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed: {e}")
+        return None
+
+
+def store_answer(pdf_id: str, question: str, answer: str) -> None:
+    if not ANSWER_CACHE_ENABLED or not answer:
+        return
+    try:
+        backend = _get_backend()
+        entry = {
+            "question": question,
+            "vector": _embed(question).tolist(),
+            "answer": answer,
+            "created": time.time(),
+        }
+        backend.add(pdf_id, str(uuid.uuid4()), entry)
+
+        entries = backend.entries(pdf_id)
+        if len(entries) > ANSWER_CACHE_MAX_PER_PDF:
+            entries.sort(key=lambda item: item[1]["created"])
+            overflow = len(entries) - ANSWER_CACHE_MAX_PER_PDF
+            backend.remove(pdf_id, [k for k, _ in entries[:overflow]])
+    except Exception as e:
+        logger.warning(f"Answer cache store failed: {e}")
+
+
+def invalidate_answers(pdf_id: str) -> None:
+    """Drops every cached answer for a PDF; call on re-ingest and delete"""
+    try:
+        _get_backend().clear(pdf_id)
+    except Exception as e:
+        logger.warning(f"Answer cache invalidation failed for PDF {pdf_id}: {e}")
+
+
+def stream_cached_answer(answer: str) -> Iterator[str]:
+    """Yields a cached answer word by word, like the streaming chain does"""
+    for token in re.findall(r"\s*\S+|\s+", answer):
+        yield token
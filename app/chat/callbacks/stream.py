@@ -1,15 +1,105 @@
-from langchain.callbacks.base import BaseCallbackHandler
+import os
+from queue import Full
+from threading import Event
+from langchain.callbacks.base import BaseCallbackHandler, AsyncCallbackHandler
+
+STREAM_TOKEN_QUEUE_SIZE = int(os.getenv("STREAM_TOKEN_QUEUE_SIZE", "256"))
+
+# The chain inside ConversationalRetrievalChain that produces the answer. The
+# question-condensing LLMChain runs outside of it, so its tokens are dropped.
+ANSWER_CHAIN_NAME = "StuffDocumentsChain"
+
+
+class StreamCancelled(Exception):
+    """Raised inside the chain run to abort it once the client has gone"""
+
+
+class AnswerRunTracker:
+    """Remembers the answer chain's run and every run started beneath it"""
+
+    def __init__(self, answer_chain_name=ANSWER_CHAIN_NAME):
+        self.answer_chain_name = answer_chain_name
+        self.answer_runs = set()
+
+    def track(self, run_id, parent_run_id, name=None):
+        if name == self.answer_chain_name or parent_run_id in self.answer_runs:
+            self.answer_runs.add(run_id)
+
+    def is_answer(self, run_id):
+        return run_id in self.answer_runs
+
+
+def _chain_name(serialized, kwargs):
+    return kwargs.get("name") or (serialized or {}).get("name")
 
 
 class StreamingHandler(BaseCallbackHandler):
-    def __init__(self, queue):
+    # Let StreamCancelled propagate out of the LLM call instead of being
+    # logged and swallowed by the callback manager
+    raise_error = True
+
+    def __init__(self, queue, answer_chain_name=ANSWER_CHAIN_NAME):
         self.queue = queue
+        self.cancelled = Event()
+        self.runs = AnswerRunTracker(answer_chain_name)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _check_cancelled(self):
+        if self.cancelled.is_set():
+            raise StreamCancelled()
+
+    def put(self, item):
+        # The queue is bounded: block while the client is slow to read, but
+        # give up as soon as the stream has been cancelled
+        while True:
+            self._check_cancelled()
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._check_cancelled()
+        self.runs.track(run_id, parent_run_id, _chain_name(serialized, kwargs))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._check_cancelled()
+        self.runs.track(run_id, parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._check_cancelled()
+        self.runs.track(run_id, parent_run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if self.runs.is_answer(run_id):
+            self.put(token)
+        else:
+            self._check_cancelled()
+
+
+class AsyncStreamingHandler(AsyncCallbackHandler):
+    """
+    Async counterpart of StreamingHandler for chain.astream. Backpressure
+    comes from awaiting the bounded asyncio queue, and cancellation from
+    cancelling the task running the chain, so no cancel flag is needed.
+    """
+
+    def __init__(self, queue, answer_chain_name=ANSWER_CHAIN_NAME):
+        self.queue = queue
+        self.runs = AnswerRunTracker(answer_chain_name)
+
+    async def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self.runs.track(run_id, parent_run_id, _chain_name(serialized, kwargs))
 
-    def on_llm_new_token(self, token, **kwargs):
-        self.queue.put(token)
+    async def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self.runs.track(run_id, parent_run_id)
 
-    def on_llm_end(self, response, **kwargs):
-        self.queue.put(None)
+    async def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self.runs.track(run_id, parent_run_id)
 
-    def on_llm_error(self, error, **kwargs):
-        self.queue.put(None)
+    async def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if self.runs.is_answer(run_id):
+            await self.queue.put(token)
@@ -0,0 +1,88 @@
+import os
+import re
+
+# always      - condense every follow-up question before retrieval (legacy)
+# fast        - skip condensing when there is no history or the question looks
+#               self-contained; otherwise retrieve with the raw question while
+#               condensing and keep those documents if condensing changed little
+CONDENSE_MODE = os.getenv("CONDENSE_MODE", "fast")
+# Share of content words two questions must have in common for documents
+# retrieved with one to stand in for the other
+CONDENSE_REUSE_OVERLAP = float(os.getenv("CONDENSE_REUSE_OVERLAP", "0.8"))
+CONDENSE_MIN_WORDS = int(os.getenv("CONDENSE_MIN_WORDS", "5"))
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+# Words that point back into the conversation: a question using them can't be
+# understood, or retrieved for, on its own
+_REFERENCES = {
+    "it", "its", "it's", "they", "them", "their", "theirs", "this", "that",
+    "these", "those", "he", "him", "his", "she", "her", "hers", "there",
+    "above", "previous", "previously", "earlier", "former", "latter",
+    "same", "else", "more", "again", "elaborate", "continue", "one", "ones",
+}
+_CONTINUATIONS = ("and ", "but ", "so ", "also ", "what about", "how about", "why not")
+
+_STOP_WORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "is", "are",
+    "was", "were", "be", "do", "does", "did", "what", "which", "who", "how",
+    "why", "when", "where", "can", "could", "would", "should", "about", "with",
+    "by", "from", "as", "at", "me", "you", "please", "tell", "explain",
+}
+
+
+def _words(text: str):
+    return _WORD.findall(text.lower())
+
+
+def is_self_contained(question: str) -> bool:
+    """
+    Cheap check for a follow-up that needs no rewriting: long enough to stand
+    alone, not opening like a continuation and free of words that refer back
+    to earlier turns. Errs towards condensing.
+    """
+    words = _words(question)
+    if len(words) < CONDENSE_MIN_WORDS:
+        return False
+    if question.strip().lower().startswith(_CONTINUATIONS):
+        return False
+    return not _REFERENCES.intersection(words)
+
+
+def content_words(text: str) -> set:
+    # Reference words are left out, so replacing "it" with what it refers to
+    # counts as one added word rather than one changed word
+    return {
+        word
+        for word in _words(text)
+        if word not in _STOP_WORDS and word not in _REFERENCES
+    }
+
+
+def can_reuse_docs(question: str, condensed: str) -> bool:
+    """
+    True if documents retrieved for question are good enough for condensed,
+    i.e. condensing kept nearly all of the content words and added few.
+    """
+    original, rewritten = content_words(question), content_words(condensed)
+    if not original or not rewritten:
+        return False
+    overlap = len(original & rewritten) / len(original | rewritten)
+    return overlap >= CONDENSE_REUSE_OVERLAP
+
+
+def reuse_plausible(question: str) -> bool:
+    """
+    Whether can_reuse_docs has a chance to pass once question is condensed.
+
+    Condensing usually adds at least one content word per word referring
+    back to the conversation, so a question needs enough content words of
+    its own for the overlap to stay above CONDENSE_REUSE_OVERLAP. Below
+    that, retrieving with the raw question up front would be wasted.
+    """
+    if CONDENSE_REUSE_OVERLAP >= 1:
+        return False
+    words = _words(question)
+    references = max(1, sum(word in _REFERENCES for word in words))
+    needed = references * CONDENSE_REUSE_OVERLAP / (1 - CONDENSE_REUSE_OVERLAP)
+    return len(content_words(question)) >= needed
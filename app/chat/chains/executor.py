@@ -0,0 +1,64 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.chat import metrics
+
+STREAM_MAX_WORKERS = int(os.getenv("STREAM_MAX_WORKERS", "16"))
+STREAM_MAX_QUEUED = int(os.getenv("STREAM_MAX_QUEUED", "32"))
+
+
+class StreamRejected(Exception):
+    """Raised when every worker is busy and the wait queue is full"""
+
+
+class StreamExecutor:
+    """
+    Size-limited pool for chain runs. At most max_workers chains run at once
+    and at most max_queued more wait for a worker; anything beyond that is
+    rejected immediately instead of spawning another thread.
+    """
+
+    def __init__(self, max_workers: int, max_queued: int):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="chain-stream"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            metrics.incr("streams.rejected")
+            raise StreamRejected("Too many concurrent streams")
+
+        metrics.gauge("streams.queued", 1)
+
+        def run():
+            metrics.gauge("streams.queued", -1)
+            metrics.gauge("streams.active", 1)
+            try:
+                return fn(*args)
+            finally:
+                metrics.gauge("streams.active", -1)
+                self._slots.release()
+
+        try:
+            return self._pool.submit(run)
+        except Exception:
+            metrics.gauge("streams.queued", -1)
+            self._slots.release()
+            raise
+
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def get_stream_executor() -> StreamExecutor:
+    global _executor, _executor_pid
+    with _lock:
+        # Worker threads don't survive a fork, so each process needs its own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = StreamExecutor(STREAM_MAX_WORKERS, STREAM_MAX_QUEUED)
+            _executor_pid = os.getpid()
+        return _executor
@@ -1,8 +1,224 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from langchain.callbacks.base import BaseCallbackHandler
 from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForChainRun,
+    CallbackManagerForChainRun,
+)
+
+from app.chat import metrics
 from app.chat.chains.streamable import StreamableChain
+from app.chat.chains.condense import (
+    CONDENSE_MODE,
+    can_reuse_docs,
+    is_self_contained,
+    reuse_plausible,
+)
+
+SPECULATIVE_RETRIEVAL_WORKERS = int(os.getenv("SPECULATIVE_RETRIEVAL_WORKERS", "16"))
+
+_lock = threading.Lock()
+_speculation_pool = None
+_speculation_pool_pid = None
+
+
+def _get_speculation_pool() -> ThreadPoolExecutor:
+    global _speculation_pool, _speculation_pool_pid
+    with _lock:
+        if _speculation_pool is None or _speculation_pool_pid != os.getpid():
+            _speculation_pool = ThreadPoolExecutor(
+                max_workers=SPECULATIVE_RETRIEVAL_WORKERS,
+                thread_name_prefix="speculative-retrieval",
+            )
+            _speculation_pool_pid = os.getpid()
+        return _speculation_pool
+
+
+class _FirstTokenTimer(BaseCallbackHandler):
+    """Records the time from the start of the chain run to the first answer token"""
+
+    run_inline = True
+
+    def __init__(self, path: str, started: float):
+        self.path = path
+        self.started = started
+        self.seen = False
+
+    def on_llm_new_token(self, token, **kwargs):
+        if not self.seen:
+            self.seen = True
+            metrics.observe(
+                f"chain.ttft_ms.{self.path}", (time.perf_counter() - self.started) * 1000
+            )
 
 
 class StreamingConversationalRetrievalChain(
     StreamableChain, ConversationalRetrievalChain
 ):
-    pass
+    """
+    ConversationalRetrievalChain that avoids the question-condensing LLM
+    call on the critical path where it can (see condense.CONDENSE_MODE).
+
+    Each run takes one path, counted as chain.condense.<path> and timed to
+    the first answer token as chain.ttft_ms.<path>:
+
+        no_history        - first turn, nothing to condense
+        self_contained    - follow-up that reads fine on its own
+        speculative_hit   - condensed, raw-question documents were reused
+        speculative_miss  - condensed, documents fetched again afterwards
+        condensed         - CONDENSE_MODE=always, or the question too short
+                            for raw-question documents to be reused
+    """
+
+    condense_mode: str = CONDENSE_MODE
+
+    def _plan(self, inputs):
+        question = inputs["question"]
+        get_chat_history = self.get_chat_history or _get_chat_history
+        chat_history_str = get_chat_history(inputs["chat_history"])
+        if not chat_history_str:
+            path = "no_history"
+        elif self.condense_mode != "fast":
+            path = "condensed"
+        elif is_self_contained(question):
+            path = "self_contained"
+        elif not reuse_plausible(question):
+            # A speculative retrieval can't be cancelled once it is running,
+            # so only start one when its documents may be kept
+            path = "condensed"
+        else:
+            path = "speculative"
+        return question, chat_history_str, path
+
+    def _answer_inputs(self, inputs, question, chat_history_str, docs):
+        output: Dict[str, Any] = {}
+        if self.response_if_no_docs_found is not None and len(docs) == 0:
+            output[self.output_key] = self.response_if_no_docs_found
+            return output, None
+        new_inputs = inputs.copy()
+        if self.rephrase_question:
+            new_inputs["question"] = question
+        new_inputs["chat_history"] = chat_history_str
+        return output, new_inputs
+
+    def _finish(self, output, docs, new_question):
+        if self.return_source_documents:
+            output["source_documents"] = docs
+        if self.return_generated_question:
+            output["generated_question"] = new_question
+        return output
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question, chat_history_str, path = self._plan(inputs)
+
+        if path in ("no_history", "self_contained"):
+            new_question = question
+            docs = self._get_docs(question, inputs, run_manager=_run_manager)
+        elif path == "condensed":
+            new_question = self._condense(question, chat_history_str, _run_manager)
+            docs = self._get_docs(new_question, inputs, run_manager=_run_manager)
+        else:
+            # Retrieve with the raw question while the LLM condenses it
+            speculative = _get_speculation_pool().submit(
+                contextvars.copy_context().run,
+                self._get_docs,
+                question,
+                inputs,
+                run_manager=_run_manager,
+            )
+            try:
+                new_question = self._condense(question, chat_history_str, _run_manager)
+            except BaseException:
+                speculative.cancel()
+                raise
+            if can_reuse_docs(question, new_question):
+                path = "speculative_hit"
+                docs = speculative.result()
+            else:
+                path = "speculative_miss"
+                speculative.cancel()
+                docs = self._get_docs(new_question, inputs, run_manager=_run_manager)
+
+        metrics.incr(f"chain.condense.{path}")
+        output, new_inputs = self._answer_inputs(inputs, new_question, chat_history_str, docs)
+        if new_inputs is not None:
+            callbacks = _run_manager.get_child()
+            callbacks.add_handler(_FirstTokenTimer(path, started))
+            output[self.output_key] = self.combine_docs_chain.run(
+                input_documents=docs, callbacks=callbacks, **new_inputs
+            )
+        return self._finish(output, docs, new_question)
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        question, chat_history_str, path = self._plan(inputs)
+
+        if path in ("no_history", "self_contained"):
+            new_question = question
+            docs = await self._aget_docs(question, inputs, run_manager=_run_manager)
+        elif path == "condensed":
+            new_question = await self._acondense(question, chat_history_str, _run_manager)
+            docs = await self._aget_docs(new_question, inputs, run_manager=_run_manager)
+        else:
+            speculative = asyncio.ensure_future(
+                self._aget_docs(question, inputs, run_manager=_run_manager)
+            )
+            try:
+                new_question = await self._acondense(
+                    question, chat_history_str, _run_manager
+                )
+                if can_reuse_docs(question, new_question):
+                    path = "speculative_hit"
+                    docs = await speculative
+                else:
+                    path = "speculative_miss"
+                    speculative.cancel()
+                    docs = await self._aget_docs(
+                        new_question, inputs, run_manager=_run_manager
+                    )
+            finally:
+                if not speculative.done():
+                    speculative.cancel()
+
+        metrics.incr(f"chain.condense.{path}")
+        output, new_inputs = self._answer_inputs(inputs, new_question, chat_history_str, docs)
+        if new_inputs is not None:
+            callbacks = _run_manager.get_child()
+            callbacks.add_handler(_FirstTokenTimer(path, started))
+            output[self.output_key] = await self.combine_docs_chain.arun(
+                input_documents=docs, callbacks=callbacks, **new_inputs
+            )
+        return self._finish(output, docs, new_question)
+
+    def _condense(self, question, chat_history_str, run_manager):
+        return self.question_generator.run(
+            question=question,
+            chat_history=chat_history_str,
+            callbacks=run_manager.get_child(),
+        )
+
+    async def _acondense(self, question, chat_history_str, run_manager):
+        return await self.question_generator.arun(
+            question=question,
+            chat_history=chat_history_str,
+            callbacks=run_manager.get_child(),
+        )
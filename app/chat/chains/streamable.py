@@ -1,23 +1,167 @@
-from app.chat.callbacks.stream import StreamingHandler
-from queue import Queue
-from threading import Thread
+import time
+import asyncio
+from queue import Queue, Empty
 from flask import current_app
+from app.chat import metrics
+from app.chat.callbacks.stream import (
+    StreamingHandler,
+    AsyncStreamingHandler,
+    StreamCancelled,
+    STREAM_TOKEN_QUEUE_SIZE,
+)
+from app.chat.chains.executor import get_stream_executor
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.chains.streamable")
+
+_END = object()
+
+
+class StreamFailed(Exception):
+    """The chain run behind an async stream failed before its answer was complete"""
+
+
+class TokenStream:
+    """
+    Iterator over the answer tokens of one chain run. Closing it, even
+    before the first token was read, cancels the run.
+
+    failed is set once the run failed or was cancelled, before the stream
+    ends, so the tokens read are only a complete answer if it isn't.
+    """
+
+    def __init__(self, queue, handler):
+        self.queue = queue
+        self.handler = handler
+        self.failed = False
+        self.started = time.perf_counter()
+        self.first_token_at = None
+
+    def _received(self, token):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            metrics.observe(
+                "streams.ttft_ms", (self.first_token_at - self.started) * 1000
+            )
+        return token
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = self.queue.get()
+        if token is _END:
+            self.close()
+            raise StopIteration
+        return self._received(token)
+
+    def poll(self, interval: float):
+        """
+        Like iterating, but yields None whenever no token arrived within
+        interval seconds, so consumers can flush on a timer.
+        """
+        while True:
+            try:
+                token = self.queue.get(timeout=interval)
+            except Empty:
+                yield None
+                continue
+            if token is _END:
+                self.close()
+                return
+            yield self._received(token)
+
+    def close(self):
+        self.handler.cancel()
+
+    def __del__(self):
+        self.close()
 
 
 class StreamableChain:
 
     def stream(self, input):
-        queue = Queue()
+        """
+        Starts the chain on the shared stream executor and returns a
+        TokenStream of the final answer's tokens. Raises StreamRejected
+        right away when the executor is saturated. Closing the stream (e.g.
+        the client disconnected) cancels the run, which aborts the upstream
+        LLM request.
+        """
+        queue = Queue(maxsize=STREAM_TOKEN_QUEUE_SIZE)
         handler = StreamingHandler(queue)
+        token_stream = TokenStream(queue, handler)
 
         def task(app_context):
             app_context.push()
-            self(input, callbacks=[handler])
+            try:
+                self(input, callbacks=[handler])
+            except StreamCancelled:
+                token_stream.failed = True
+                metrics.incr("streams.cancelled")
+                logger.info("Stream cancelled, chain run aborted")
+            except Exception:
+                token_stream.failed = True
+                logger.exception("Streaming chain run failed")
+            finally:
+                app_context.pop()
+                # The end marker is only pushed once the whole chain is done,
+                # never on an intermediate LLM call finishing
+                try:
+                    handler.put(_END)
+                except StreamCancelled:
+                    pass
 
-        Thread(target=task, args=[current_app.app_context()]).start()
+        get_stream_executor().submit(task, current_app.app_context())
 
-        while True:
-            token = queue.get()
-            if token is None:
-                break
-            yield token
+        return token_stream
+
+    async def astream(self, input, poll_interval=None):
+        """
+        Async generator of the final answer's tokens, driving the chain with
+        ainvoke on the running event loop instead of a worker thread. With
+        poll_interval set, yields None whenever no token arrived within that
+        many seconds. Closing or cancelling the generator cancels the run.
+        Raises StreamFailed after the last token if the run failed, so a
+        partial answer isn't mistaken for a complete one.
+        """
+        queue = asyncio.Queue(maxsize=STREAM_TOKEN_QUEUE_SIZE)
+        handler = AsyncStreamingHandler(queue)
+        failed = False
+
+        async def run():
+            nonlocal failed
+            try:
+                await self.ainvoke(input, config={"callbacks": [handler]})
+            except Exception:
+                failed = True
+                logger.exception("Streaming chain run failed")
+            await queue.put(_END)
+
+        started = time.perf_counter()
+        first_token = True
+        task = asyncio.ensure_future(run())
+        metrics.gauge("streams.async_active", 1)
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(queue.get(), poll_interval)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if token is _END:
+                    if failed:
+                        raise StreamFailed("Streaming chain run failed")
+                    break
+                if first_token:
+                    first_token = False
+                    metrics.observe(
+                        "streams.ttft_ms", (time.perf_counter() - started) * 1000
+                    )
+                yield token
+        finally:
+            metrics.gauge("streams.async_active", -1)
+            if not task.done():
+                task.cancel()
+                metrics.incr("streams.cancelled")
+                logger.info("Stream cancelled, chain run aborted")
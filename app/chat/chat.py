@@ -1,24 +1,21 @@
 from app.chat.models import ChatArgs
-from app.chat.vector_stores.pinecone import build_retriever
-from app.chat.llms.chatopenai import build_llm
-from app.chat.chains.retrieval import StreamingConversationalRetrievalChain
+from app.chat.registry import build_chat_from_registry
 
 
 def build_chat(chat_args: ChatArgs):
     """
     :param chat_args: ChatArgs object containing
-        conversation_id, pdf_id, metadata, and streaming flag.
+        conversation_id, pdf_id, metadata, and streaming flag, plus the
+        optional llm/retriever/memory component names of the conversation.
 
     :return: A chain
 
+    The LLM client and prompt chains come from a shared template in
+    app.chat.registry; only the retriever and metadata are bound per call.
+
     Example Usage:
 
         chain = build_chat(chat_args)
     """
 
-    retriever = build_retriever(chat_args)
-    llm = build_llm(chat_args)
-
-    return StreamingConversationalRetrievalChain.from_llm(
-        llm=llm, retriever=retriever, return_source_documents=True
-    )
+    return build_chat_from_registry(chat_args)
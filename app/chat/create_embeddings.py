@@ -1,9 +1,8 @@
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from app.chat.vector_stores.pinecone import vector_store
+from app.chat.ingestion.pipeline import run_ingestion
+from app.chat.answer_cache import invalidate_answers
 
 
-def create_embeddings_for_pdf(pdf_id: str, pdf_path: str):
+def create_embeddings_for_pdf(pdf_id: str, pdf_path: str, resume=None, on_checkpoint=None):
     """
     Generate and store embeddings for the given pdf
 
@@ -12,32 +11,29 @@ def create_embeddings_for_pdf(pdf_id: str, pdf_path: str):
     3. Generate an embedding for each chunk.
     4. Persist the generated embeddings.
 
+    Extraction runs page-parallel in a process pool while earlier chunks are
+    being embedded and upserted in batches (see app.chat.ingestion.pipeline).
+
     :param pdf_id: The unique identifier for the PDF.
     :param pdf_path: The file path to the PDF.
+    :param resume: Checkpoint of an interrupted run to continue from.
+    :param on_checkpoint: Called with a Checkpoint after each durable batch.
+
+    :return: IngestionStats with pages/sec and chunks/sec
 
     Example Usage:
 
     create_embeddings_for_pdf('123456', '/path/to/pdf')
     """
 
-    # 1. Extract text from the specified PDF
     print(f"Processing PDF: {pdf_id}, Path: {pdf_path}")
 
-    # 2. Divide the extracted text into manageable chunks.
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-    loader = PyPDFLoader(pdf_path)
-
-    docs = loader.load_and_split(text_splitter)
+    # Answers cached for a previous version of this PDF are no longer valid
+    invalidate_answers(pdf_id)
 
-    for doc in docs:
-        doc.metadata = {
-            "page": doc.metadata["page"],
-            "text": doc.page_content,
-            "pdf_id": pdf_id,
-        }
+    stats = run_ingestion(pdf_id, pdf_path, resume=resume, on_checkpoint=on_checkpoint)
 
-    # print(f"Extracted {len(docs)} chunks from PDF {pdf_id}")
-    # print(docs)
+    # A question asked while ingestion ran was answered from a partial index
+    invalidate_answers(pdf_id)
 
-    # 3. Generate an embedding for each chunk.
-    vector_store.add_documents(docs)
+    return stats
@@ -0,0 +1,344 @@
+import os
+import time
+import hashlib
+import sqlite3
+import unicodedata
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.embeddings.cache")
+
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join("instance", "embedding_cache.sqlite3")
+)
+EMBEDDING_CACHE_MAX_BYTES = int(
+    os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024))
+)
+# A hit only refreshes last_used once it is this many seconds old, and the
+# refreshes are written in batches, so lookups stay reads; eviction order
+# is approximate to about this much
+EMBEDDING_CACHE_TOUCH_INTERVAL = int(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "600"))
+EMBEDDING_CACHE_TOUCH_BATCH = 500
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+QUERY_EMBEDDING_CACHE_TTL = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+QUERY_EMBEDDING_CACHE_REDIS = (
+    os.getenv("QUERY_EMBEDDING_CACHE_REDIS", "false").lower() == "true"
+)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(text: str, model_name: str) -> str:
+    payload = f"{model_name}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of embedding vectors.
+
+    Vectors are keyed by a hash of the normalized text plus the model name, so
+    identical chunks are only encoded once across PDFs and re-ingests. The
+    store is a SQLite file (WAL mode, safe to share between the web and Celery
+    processes) and is trimmed back to 90% of max_bytes, least recently used
+    first, whenever it grows past max_bytes. The total size is kept in the
+    file itself by triggers, so it holds across every process sharing it.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        # Last total size read from the file, for stats
+        self._size = None
+        # key -> time of a hit whose last_used update isn't written yet
+        self._touched = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not be shared across a fork
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used "
+                "ON embeddings (last_used)"
+            )
+            conn.executescript(
+                """
+                BEGIN IMMEDIATE;
+                CREATE TABLE IF NOT EXISTS embeddings_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO embeddings_size (id, bytes)
+                    SELECT 0, COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings;
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_insert
+                    AFTER INSERT ON embeddings BEGIN
+                    UPDATE embeddings_size SET bytes = bytes + LENGTH(NEW.vector);
+                END;
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_update
+                    AFTER UPDATE OF vector ON embeddings BEGIN
+                    UPDATE embeddings_size
+                    SET bytes = bytes + LENGTH(NEW.vector) - LENGTH(OLD.vector);
+                END;
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_delete
+                    AFTER DELETE ON embeddings BEGIN
+                    UPDATE embeddings_size SET bytes = bytes - LENGTH(OLD.vector);
+                END;
+                COMMIT;
+                """
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+            self._touched = {}
+        return self._conn
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            stale = now - EMBEDDING_CACHE_TOUCH_INTERVAL
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    "SELECT key, vector, last_used FROM embeddings "
+                    f"WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob, last_used in rows:
+                    found[key] = array("f", blob).tolist()
+                    if last_used < stale:
+                        self._touched[key] = now
+            if len(self._touched) >= EMBEDDING_CACHE_TOUCH_BATCH:
+                self._flush_touched(conn)
+                conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return [found.get(key) for key in keys]
+
+    def _flush_touched(self, conn: sqlite3.Connection) -> None:
+        if self._touched:
+            conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def set_many(self, keys: List[str], vectors: List[List[float]]) -> None:
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in zip(keys, vectors)]
+        with self._lock:
+            conn = self._connect()
+            # An upsert rather than INSERT OR REPLACE, whose delete doesn't
+            # fire the size trigger
+            conn.executemany(
+                "INSERT INTO embeddings (key, vector, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "vector = excluded.vector, last_used = excluded.last_used",
+                rows,
+            )
+            # Written now, so recently hit vectors aren't evicted as unused
+            self._flush_touched(conn)
+            conn.commit()
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        self._size = conn.execute("SELECT bytes FROM embeddings_size").fetchone()[0]
+        if self._size <= self.max_bytes:
+            return
+
+        # Size check and deletes in one write transaction, so processes
+        # evicting at the same time don't each free the whole excess
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            size = conn.execute("SELECT bytes FROM embeddings_size").fetchone()[0]
+            target = int(self.max_bytes * 0.9)
+            freed, keys = 0, []
+            if size > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"
+                )
+                for key, length in rows:
+                    if size - freed <= target:
+                        break
+                    keys.append((key,))
+                    freed += length
+                conn.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._size = size - freed
+        self.evictions += len(keys)
+        logger.debug(f"Evicted {len(keys)} cached embeddings ({freed} bytes)")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends cache misses to the underlying model.
+    Used for both ingestion (embed_documents) and queries (embed_query).
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache: EmbeddingCache):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(text, self.model_name) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Encode each distinct missing text once, even if repeated in the batch
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            computed = self.underlying.embed_documents(list(unique.values()))
+            by_key = dict(zip(unique.keys(), computed))
+            self.cache.set_many(list(by_key.keys()), list(by_key.values()))
+            for i in missing:
+                vectors[i] = by_key[keys[i]]
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(text, self.model_name)
+        vector = self.cache.get_many([key])[0]
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self.cache.set_many([key], [vector])
+        return vector
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded in-process LRU of query embeddings, optionally backed by Redis so
+    that all web workers share repeat questions. Redis failures are treated as
+    misses; the query is then encoded locally.
+    """
+
+    def __init__(self, max_size: int, redis_url: Optional[str] = None, ttl: int = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url:
+            import redis
+
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.05)
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        if self._redis is not None:
+            try:
+                blob = self._redis.get(f"query_embedding:{key}")
+            except Exception as e:
+                logger.debug(f"Redis query embedding lookup failed: {e}")
+                blob = None
+            if blob is not None:
+                vector = array("f", blob).tolist()
+                self._remember(key, vector)
+                with self._lock:
+                    self.redis_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, vector: List[float]) -> None:
+        self._remember(key, vector)
+        if self._redis is not None:
+            try:
+                self._redis.set(
+                    f"query_embedding:{key}",
+                    array("f", vector).tobytes(),
+                    ex=self.ttl or None,
+                )
+            except Exception as e:
+                logger.debug(f"Redis query embedding store failed: {e}")
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        hits = self.hits + self.redis_hits
+        total = hits + self.misses
+        return {
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+
+class QueryCachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that answers repeated embed_query calls from a
+    QueryEmbeddingCache. Document embedding is passed straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache: QueryEmbeddingCache):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(text, self.model_name)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
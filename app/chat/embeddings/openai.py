@@ -1,12 +1,103 @@
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
+import threading
 from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from app.chat.embeddings.cache import (
+    CachedEmbeddings,
+    EmbeddingCache,
+    QueryCachedEmbeddings,
+    QueryEmbeddingCache,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_BYTES,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_TTL,
+    QUERY_EMBEDDING_CACHE_REDIS,
+)
+from app.chat.embeddings.server import EmbeddingClient, EMBEDDING_SERVER_URL
 
 # Load environment variables
 load_dotenv()
 
-# Use HuggingFace embeddings (dimension 384) for the new Pinecone index
-print("Using HuggingFace embeddings (dimension 384)")
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+
+_lock = threading.Lock()
+_model = None
+_embeddings = None
+
+
+def load_embedding_model():
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    # Use HuggingFace embeddings (dimension 384) for the new Pinecone index
+    print("Using HuggingFace embeddings (dimension 384)")
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+def get_embedding_model():
+    """
+    Returns the raw model, loading it on first use rather than at import time
+    so that CLI commands and forks don't pay for it. When EMBEDDING_SERVER_URL
+    is set this is a thin client of the shared embedding server instead.
+    """
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                if EMBEDDING_SERVER_URL:
+                    _model = EmbeddingClient(EMBEDDING_SERVER_URL)
+                else:
+                    _model = load_embedding_model()
+    return _model
+
+
+def get_embeddings():
+    """Returns the process-wide embeddings object, with its caches in front"""
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                _embeddings = _build_embeddings()
+    return _embeddings
+
+
+def _build_embeddings():
+    # The model itself is only loaded when a cache miss needs it
+    embeddings = _LazyModel()
+
+    # Put the content-addressed cache in front of the model so that ingestion and
+    # query-time embedding both skip texts that were already encoded
+    if EMBEDDING_CACHE_ENABLED:
+        embeddings = CachedEmbeddings(
+            embeddings,
+            model_name=EMBEDDING_MODEL_NAME,
+            cache=EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES),
+        )
+
+    # Repeat questions ("summarize this") skip the encode entirely
+    return QueryCachedEmbeddings(
+        embeddings,
+        model_name=EMBEDDING_MODEL_NAME,
+        cache=QueryEmbeddingCache(
+            QUERY_EMBEDDING_CACHE_SIZE,
+            redis_url=os.getenv("REDIS_URI") if QUERY_EMBEDDING_CACHE_REDIS else None,
+            ttl=QUERY_EMBEDDING_CACHE_TTL,
+        ),
+    )
+
+
+class _LazyModel(Embeddings):
+    def embed_documents(self, texts):
+        return get_embedding_model().embed_documents(texts)
+
+    def embed_query(self, text):
+        return get_embedding_model().embed_query(text)
+
+
+def get_cache_stats():
+    """Hit/miss counters of the query LRU and the on-disk embedding cache"""
+    embeddings = get_embeddings()
+    stats = {"query": embeddings.cache.stats()}
+    if isinstance(embeddings.underlying, CachedEmbeddings):
+        stats["content"] = embeddings.underlying.cache.stats()
+    return stats
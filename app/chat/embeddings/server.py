@@ -0,0 +1,239 @@
+"""
+Shared embedding service.
+
+One process owns the sentence-transformers model and serves encode requests
+to every web and Celery worker on the box, so each of them no longer holds
+its own copy of the model. Concurrent requests are merged into a single
+forward pass (dynamic micro-batching): the batcher waits at most
+EMBEDDING_SERVER_MAX_WAIT_MS after the first pending request, or until
+EMBEDDING_SERVER_MAX_BATCH texts are queued.
+
+Run it with:
+
+    python -m app.chat.embeddings.server
+
+and point the workers at it with EMBEDDING_SERVER_URL, e.g.
+http://127.0.0.1:8765 or unix:///tmp/embeddings.sock
+"""
+import os
+import json
+import time
+import base64
+import socket
+import threading
+import http.client
+import socketserver
+from array import array
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue, Empty
+from typing import List
+from urllib.parse import urlparse
+
+from langchain_core.embeddings import Embeddings
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.embeddings.server")
+
+EMBEDDING_SERVER_URL = os.getenv("EMBEDDING_SERVER_URL")
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "128"))
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "30"))
+
+
+def _encode_vectors(vectors: List[List[float]]) -> dict:
+    dim = len(vectors[0]) if vectors else 0
+    data = array("f", [value for vector in vectors for value in vector]).tobytes()
+    return {"dim": dim, "vectors": base64.b64encode(data).decode("ascii")}
+
+
+def _decode_vectors(payload: dict) -> List[List[float]]:
+    flat = array("f", base64.b64decode(payload["vectors"]))
+    dim = payload["dim"]
+    return [flat[i : i + dim].tolist() for i in range(0, len(flat), dim)] if dim else []
+
+
+class MicroBatcher:
+    """Merges concurrent encode requests into batched model calls"""
+
+    def __init__(self, model, max_batch: int, max_wait_ms: float):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = Queue()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self.queue.put((texts, future))
+        return future
+
+    def _run(self):
+        while True:
+            pending = [self.queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            texts = [text for request_texts, _ in pending for text in request_texts]
+            try:
+                vectors = self.model.embed_documents(texts)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for request_texts, future in pending:
+                future.set_result(vectors[offset : offset + len(request_texts)])
+                offset += len(request_texts)
+
+
+def _make_handler(batcher: MicroBatcher):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._send(404, {"message": "Not found"})
+            self._send(200, {"batches": batcher.batches, "texts": batcher.texts})
+
+        def do_POST(self):
+            if self.path != "/embed":
+                return self._send(404, {"message": "Not found"})
+            length = int(self.headers.get("Content-Length", 0))
+            texts = json.loads(self.rfile.read(length))["texts"]
+            try:
+                vectors = batcher.submit(texts).result(timeout=EMBEDDING_SERVER_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Embedding request failed: {e}", exc_info=True)
+                return self._send(500, {"message": str(e)})
+            self._send(200, _encode_vectors(vectors))
+
+        def address_string(self):
+            # Unix socket peers have no (host, port) address
+            return str(self.client_address or "unix")
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+        self.server_name, self.server_port = "localhost", 0
+
+
+def serve(url: str = EMBEDDING_SERVER_URL or "http://127.0.0.1:8765"):
+    from app.chat.embeddings.openai import load_embedding_model
+
+    model = load_embedding_model()
+    model.embed_query("warm up")
+    handler = _make_handler(
+        MicroBatcher(model, EMBEDDING_SERVER_MAX_BATCH, EMBEDDING_SERVER_MAX_WAIT_MS)
+    )
+
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        server = _UnixHTTPServer(parsed.path, handler)
+    else:
+        server = _TCPHTTPServer((parsed.hostname, parsed.port or 80), handler)
+
+    logger.info(f"Embedding server listening on {url}")
+    server.serve_forever()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class EmbeddingClient(Embeddings):
+    """
+    Thin client for the embedding server. Keeps one keep-alive connection per
+    thread and reconnects once if the server closed it.
+    """
+
+    def __init__(self, url: str, timeout: float = EMBEDDING_SERVER_TIMEOUT):
+        self.url = urlparse(url)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self, fresh=False) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or fresh or self._local.pid != os.getpid():
+            if self.url.scheme == "unix":
+                connection = _UnixHTTPConnection(self.url.path, self.timeout)
+            else:
+                connection = http.client.HTTPConnection(
+                    self.url.hostname, self.url.port or 80, timeout=self.timeout
+                )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _post(self, body: bytes, fresh=False):
+        connection = self._connection(fresh)
+        connection.request(
+            "POST", "/embed", body=body, headers={"Content-Type": "application/json"}
+        )
+        return connection.getresponse()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        body = json.dumps({"texts": texts}).encode("utf-8")
+        try:
+            response = self._post(body)
+        except (http.client.HTTPException, ConnectionError):
+            response = self._post(body, fresh=True)
+
+        payload = json.loads(response.read())
+        if response.status >= 400:
+            raise RuntimeError(f"Embedding server error: {payload.get('message')}")
+        return _decode_vectors(payload)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,208 @@
+import os
+import re
+import uuid
+import hashlib
+import threading
+from typing import Callable, Optional, Tuple
+
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.ingestion.ocr")
+
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "--psm 3")
+# Tesseract's own threads per page; pages are already OCR'd in parallel
+OCR_THREADS_PER_PAGE = os.getenv("OCR_THREADS_PER_PAGE", "1")
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join("instance", "ocr_cache"))
+# The cache is trimmed back to 90% of this, least recently used first
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Text layers shorter than this are too short to judge as garbage
+OCR_MIN_CHARS = int(os.getenv("OCR_MIN_CHARS", "32"))
+# Share of letters and digits among the visible characters below which a
+# text layer is garbage (broken font encodings, glyph soup)
+OCR_MIN_TEXT_RATIO = float(os.getenv("OCR_MIN_TEXT_RATIO", "0.5"))
+
+_CID = re.compile(r"\(cid:\d+\)")
+# Runs of one symbol, like the leader dots of a table of contents
+_REPEATS = re.compile(r"([^\w\s\ufffd])\1+")
+
+_unavailable = False
+# PyMuPDF isn't thread-safe. Where pages are OCR'd on threads (inside a
+# Celery worker) rendering takes turns; tesseract still runs in parallel.
+_render_lock = threading.Lock()
+
+
+def needs_ocr(text: str, has_text_objects: Callable[[], bool]) -> Optional[str]:
+    """
+    Why a page's extracted text can't be used: "empty" when the page has no
+    text objects at all, "garbage" when they don't extract to readable
+    text. None for a usable text layer, which is what born-digital pages
+    have, title and figure pages with a few words included.
+
+    has_text_objects is only called for pages with no text extracted, as
+    it parses the page's content streams; other pages pay nothing extra.
+    """
+    stripped = text.strip()
+    if not stripped:
+        return "garbage" if has_text_objects() else "empty"
+    if len(stripped) < OCR_MIN_CHARS:
+        return None
+    # Unmapped glyphs come out of pypdf as (cid:NN)
+    visible = _REPEATS.sub(r"\1", _CID.sub("\ufffd", "".join(stripped.split())))
+    if sum(ch.isalnum() for ch in visible) / len(visible) < OCR_MIN_TEXT_RATIO:
+        return "garbage"
+    return None
+
+
+def image_key(samples: bytes, width: int, height: int) -> str:
+    """Cache key of a rendered page: its pixels plus the OCR settings"""
+    digest = hashlib.sha256(
+        f"{OCR_DPI}\0{OCR_LANG}\0{OCR_TESSERACT_CONFIG}\0{width}x{height}\0".encode()
+    )
+    digest.update(samples)
+    return digest.hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, key[:2], f"{key}.txt")
+
+
+def cached_text(key: str) -> Optional[str]:
+    path = _cache_path(key)
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        # The modification time is what prune_cache orders by
+        os.utime(path)
+    except OSError:
+        pass
+    return text
+
+
+def cache_text(key: str, text: str) -> None:
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Workers may OCR the same image at once; the rename makes it atomic
+    staging = f"{path}.{uuid.uuid4().hex}"
+    with open(staging, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(staging, path)
+
+
+def prune_cache(max_bytes: int = OCR_CACHE_MAX_BYTES) -> int:
+    """
+    Trims the OCR cache to 90% of max_bytes once it is over, least recently
+    used first. Returns the number of entries removed.
+    """
+    entries = []
+    total = 0
+    for directory, _, names in os.walk(OCR_CACHE_DIR):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0
+
+    target = int(max_bytes * 0.9)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    logger.info(f"Pruned {removed} OCR cache entries")
+    return removed
+
+
+def _tesseract(samples: bytes, width: int, height: int) -> Optional[str]:
+    global _unavailable
+    if _unavailable:
+        return None
+    try:
+        import pytesseract
+        from PIL import Image
+    except ImportError as e:
+        _unavailable = True
+        logger.warning(f"OCR unavailable, using the PDF's text layer: {e}")
+        return None
+    try:
+        os.environ.setdefault("OMP_THREAD_LIMIT", OCR_THREADS_PER_PAGE)
+        image = Image.frombytes("L", (width, height), samples)
+        return pytesseract.image_to_string(image, lang=OCR_LANG, config=OCR_TESSERACT_CONFIG)
+    except pytesseract.TesseractNotFoundError as e:
+        # The binary is missing: say so once per process and keep the text
+        # layer. Other errors only concern the page at hand.
+        _unavailable = True
+        logger.warning(f"OCR unavailable, using the PDF's text layer: {e}")
+        return None
+    except Exception as e:
+        logger.warning(f"OCR failed for a page, using its text layer: {e}")
+        return None
+
+
+class PageOCR:
+    """
+    OCRs pages of one PDF. The PDF is only opened with PyMuPDF once a page
+    needs OCR, and only those pages are rendered.
+    """
+
+    def __init__(self, pdf_path: str):
+        self.pdf_path = pdf_path
+        self._document = None
+
+    def _page(self, page_number: int):
+        if self._document is None:
+            import pymupdf
+
+            self._document = pymupdf.open(self.pdf_path)
+        return self._document[page_number]
+
+    def recognize(self, page_number: int, reason: str) -> Tuple[Optional[str], str]:
+        """
+        Returns (text, method) for a page needs_ocr flagged. text is None
+        when the page should keep its text layer: method "blank" for an
+        empty page with no images (nothing to read), "ocr_unavailable" if
+        tesseract couldn't read it. Otherwise method is "ocr" or "ocr_cached";
+        the text can still be empty if tesseract found nothing to read.
+        """
+        import pymupdf
+
+        with _render_lock:
+            page = self._page(page_number)
+            if reason == "empty" and not page.get_images(full=False):
+                return None, "blank"
+            if _unavailable:
+                # Don't render pages this process can't OCR anyway
+                return None, "ocr_unavailable"
+            pixmap = page.get_pixmap(dpi=OCR_DPI, colorspace=pymupdf.csGRAY, alpha=False)
+            samples, width, height = pixmap.samples, pixmap.width, pixmap.height
+        key = image_key(samples, width, height)
+        text = cached_text(key)
+        if text is not None:
+            return text, "ocr_cached"
+
+        text = _tesseract(samples, width, height)
+        if text is None:
+            return None, "ocr_unavailable"
+        cache_text(key, text)
+        return text, "ocr"
+
+    def close(self):
+        if self._document is not None:
+            with _render_lock:
+                self._document.close()
+            self._document = None
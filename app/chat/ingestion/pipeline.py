@@ -0,0 +1,454 @@
+import os
+import re
+import time
+import multiprocessing
+import heapq
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from queue import Queue
+from threading import Thread
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from pypdf import PdfReader
+
+from app.chat.embeddings.openai import get_embeddings
+from app.chat.ingestion.ocr import OCR_ENABLED, PageOCR, needs_ocr, prune_cache
+from app.chat.ingestion.splitter import iter_chunks
+from app.chat.retrievers.bm25 import BM25_INDEX_SHARED, BM25Builder
+from app.chat.vector_stores.pinecone import (
+    add_embeddings,
+    persist_embeddings,
+    vector_id,
+)
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.ingestion.pipeline")
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+UPSERT_QUEUE_SIZE = int(os.getenv("UPSERT_QUEUE_SIZE", "4"))
+# How many of the slowest pages IngestionStats keeps
+SLOWEST_PAGES = 5
+
+
+class CheckpointMismatch(Exception):
+    """The PDF no longer splits into the chunks recorded in the checkpoint"""
+
+
+@dataclass
+class Checkpoint:
+    """
+    How far ingestion has got: every chunk of pages [0, pages_done) is in
+    the vector store. chunk_counts holds the chunks per page of every page
+    that has had chunks sent to the vector store, which can run past
+    pages_done; it is saved before a batch is sent, so the IDs it covers
+    include any vector an interrupted run may have left behind.
+    """
+
+    pages_done: int = 0
+    pages_total: int = 0
+    chunk_counts: List[int] = field(default_factory=list)
+
+    @property
+    def chunks(self) -> int:
+        """Chunks of the pages done"""
+        return sum(self.chunk_counts[: self.pages_done])
+
+
+@dataclass
+class IngestionStats:
+    pages: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    # Number of chunks written for each page, indexed by page number
+    chunk_counts: List[int] = field(default_factory=list)
+    # Pages that were already ingested by an earlier, interrupted run
+    resumed_pages: int = 0
+    # Time spent per page, summed over pages (extraction runs in parallel,
+    # so these can exceed seconds), pages per extraction method and the
+    # slowest pages as (ms, page, method)
+    extract_seconds: float = 0.0
+    ocr_seconds: float = 0.0
+    page_methods: Dict[str, int] = field(default_factory=Counter)
+    slowest_pages: List[Tuple[float, int, str]] = field(default_factory=list)
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.pages / self.seconds if self.seconds else 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "seconds": round(self.seconds, 2),
+            "pages_per_sec": round(self.pages_per_sec, 2),
+            "chunks_per_sec": round(self.chunks_per_sec, 2),
+            "resumed_pages": self.resumed_pages,
+            "extract_seconds": round(self.extract_seconds, 2),
+            "ocr_seconds": round(self.ocr_seconds, 2),
+            "page_methods": dict(self.page_methods),
+            "slowest_pages": [
+                {"page": page, "ms": round(ms, 1), "method": method}
+                for ms, page, method in sorted(self.slowest_pages, reverse=True)
+            ],
+        }
+
+    def record_page(self, page: "ExtractedPage"):
+        self.extract_seconds += page.extract_ms / 1000
+        self.ocr_seconds += page.ocr_ms / 1000
+        self.page_methods[page.method] += 1
+        entry = (page.extract_ms + page.ocr_ms, page.page, page.method)
+        if len(self.slowest_pages) < SLOWEST_PAGES:
+            heapq.heappush(self.slowest_pages, entry)
+        else:
+            heapq.heappushpop(self.slowest_pages, entry)
+
+
+# BT begins a text object in a content stream
+_BEGIN_TEXT = re.compile(rb"(?:^|[\s\]\)>])BT(?=[\s\[\(</]|$)")
+
+
+def _has_text_objects(page, depth: int = 0) -> bool:
+    """Whether a pypdf page (or form XObject) draws any text, however little"""
+    contents = page.get_contents() if depth == 0 else page
+    if contents is not None and _BEGIN_TEXT.search(contents.get_data()):
+        return True
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if not xobjects or depth >= 3:
+        return False
+    for xobject in xobjects.get_object().values():
+        xobject = xobject.get_object()
+        if xobject.get("/Subtype") == "/Form" and _has_text_objects(xobject, depth + 1):
+            return True
+    return False
+
+
+class ExtractedPage(NamedTuple):
+    page: int
+    text: str
+    # "text" for a usable text layer, else the OCR outcome (see PageOCR), or
+    # "ocr_empty" when OCR found no text and the text layer was kept
+    method: str
+    extract_ms: float
+    ocr_ms: float
+
+
+def _extract_pages(pdf_path: str, start: int, stop: int) -> List[ExtractedPage]:
+    """
+    Runs in a worker: extract the text of pages [start, stop). Pages whose
+    text layer is missing or garbage are rendered and OCR'd; the others
+    never touch the OCR code.
+    """
+    reader = PdfReader(pdf_path)
+    ocr = PageOCR(pdf_path)
+    pages = []
+    try:
+        for n in range(start, stop):
+            started = time.perf_counter()
+            page = reader.pages[n]
+            text = page.extract_text() or ""
+            extracted = time.perf_counter()
+            method = "text"
+            reason = needs_ocr(text, lambda: _has_text_objects(page)) if OCR_ENABLED else None
+            if reason:
+                ocr_text, method = ocr.recognize(n, reason)
+                if ocr_text is not None and ocr_text.strip():
+                    text = ocr_text
+                elif ocr_text is not None:
+                    # Nothing read; whatever the text layer has beats nothing
+                    method = "ocr_empty"
+            finished = time.perf_counter()
+            pages.append(
+                ExtractedPage(
+                    n,
+                    text,
+                    method,
+                    (extracted - started) * 1000,
+                    (finished - extracted) * 1000,
+                )
+            )
+    finally:
+        ocr.close()
+    return pages
+
+
+def _page_count(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def _pool_size(page_count: int) -> int:
+    tasks = -(-page_count // INGEST_PAGES_PER_TASK)
+    return max(0, min(INGEST_WORKERS, tasks))
+
+
+def _executor(workers: int):
+    # Celery's prefork pool runs tasks in daemonic processes, which are not
+    # allowed to have children. Threads still parallelize OCR there, as
+    # tesseract runs in a subprocess; without OCR, extraction stays in the
+    # current thread.
+    if multiprocessing.current_process().daemon:
+        return ThreadPoolExecutor(max_workers=workers) if OCR_ENABLED else None
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def iter_pages(pdf_path: str, stats: IngestionStats = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) in page order, extracting (and where needed
+    OCRing) pages in a pool with a bounded number of page ranges in flight.
+    Per-page timings are recorded in stats.
+    """
+    page_count = _page_count(pdf_path)
+    ranges = [
+        (start, min(start + INGEST_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, INGEST_PAGES_PER_TASK)
+    ]
+
+    def emit(pages):
+        for page in pages:
+            if stats is not None:
+                stats.record_page(page)
+            if page.method != "text":
+                logger.debug(
+                    f"Page {page.page}: {page.method}, extract {page.extract_ms:.0f} ms, "
+                    f"OCR {page.ocr_ms:.0f} ms"
+                )
+            yield page.page, page.text
+
+    workers = _pool_size(page_count)
+    executor = _executor(workers) if workers > 1 else None
+    if executor is None:
+        for start, stop in ranges:
+            yield from emit(_extract_pages(pdf_path, start, stop))
+        return
+
+    with executor as pool:
+        pending = deque()
+        ranges = iter(ranges)
+        for start, stop in ranges:
+            pending.append(pool.submit(_extract_pages, pdf_path, start, stop))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append(pool.submit(_extract_pages, pdf_path, *next_range))
+            yield from emit(pages)
+
+
+class _Upserter:
+    """
+    Upserts embedded batches from a background thread so that encoding of
+    later pages overlaps with network writes. The queue is bounded so that
+    a slow vector store applies backpressure instead of buffering the PDF.
+    Batches are written in order, so after each one the pages it completes
+    are durable; pages_done tracks that for checkpoints.
+    """
+
+    def __init__(self, pages_done: int = 0):
+        self.queue = Queue(maxsize=UPSERT_QUEUE_SIZE)
+        self.error = None
+        self.pages_done = pages_done
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if self.error:
+                continue
+            try:
+                texts, vectors, metadatas, ids, pages_done = batch
+                for i in range(0, len(texts), UPSERT_BATCH_SIZE):
+                    add_embeddings(
+                        texts[i : i + UPSERT_BATCH_SIZE],
+                        vectors[i : i + UPSERT_BATCH_SIZE],
+                        metadatas[i : i + UPSERT_BATCH_SIZE],
+                        ids[i : i + UPSERT_BATCH_SIZE],
+                    )
+                self.pages_done = pages_done
+            except Exception as e:
+                self.error = e
+
+    def put(self, texts, vectors, metadatas, ids, pages_done):
+        if self.error:
+            raise self.error
+        self.queue.put((texts, vectors, metadatas, ids, pages_done))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+
+def iter_batches(
+    pdf_id: str,
+    pages: Iterable[Tuple[int, str]],
+    stats: IngestionStats,
+    lexical_index: BM25Builder = None,
+    batch_size: int = EMBED_BATCH_SIZE,
+    resume: Optional[Checkpoint] = None,
+) -> Iterator[Tuple[List[str], List[dict], List[str], int]]:
+    """
+    Yields (texts, metadatas, ids, pages_done) batches of up to batch_size
+    chunks as the pages are split, so no more than one batch is held at a
+    time. pages_done is the number of pages whose chunks are all in this or
+    an earlier batch. Counts pages and chunks per page into stats and feeds
+    lexical_index.
+
+    With resume, the pages the checkpoint covers are split again, for the
+    lexical index and so the text carried across page breaks is the same,
+    but their chunks are not yielded. CheckpointMismatch is raised if they
+    don't split into the chunk counts the checkpoint recorded.
+    """
+    texts, metadatas, ids = [], [], []
+    skip_pages = resume.pages_done if resume else 0
+    checked = resume is None
+
+    def close_pages(up_to):
+        # Every page gets an entry in chunk_counts, blank ones included
+        while len(stats.chunk_counts) < up_to:
+            stats.chunk_counts.append(0)
+
+    def check_resume():
+        if stats.chunk_counts[:skip_pages] != resume.chunk_counts[:skip_pages]:
+            raise CheckpointMismatch(
+                f"PDF {pdf_id} no longer matches its checkpoint at page {skip_pages}"
+            )
+
+    for chunk in iter_chunks(_counted(pages, stats)):
+        close_pages(chunk.page + 1)
+        if not checked and chunk.page >= skip_pages:
+            check_resume()
+            checked = True
+        stats.chunk_counts[chunk.page] += 1
+        id = vector_id(pdf_id, chunk.page, chunk.chunk_no)
+        # start_index and token_count let retrieval merge overlapping chunks
+        # and pack context without re-tokenizing. The text itself travels
+        # next to the metadata, not in it.
+        metadata = {
+            "page": chunk.page,
+            "chunk_no": chunk.chunk_no,
+            "pdf_id": pdf_id,
+            "start_index": chunk.start_index,
+            "token_count": chunk.token_count,
+        }
+        if lexical_index is not None:
+            lexical_index.add(id, chunk.text, metadata)
+        if chunk.page < skip_pages:
+            continue
+        texts.append(chunk.text)
+        metadatas.append(metadata)
+        ids.append(id)
+        if len(texts) >= batch_size:
+            yield texts, metadatas, ids, chunk.page
+            texts, metadatas, ids = [], [], []
+    close_pages(stats.pages)
+    if not checked:
+        check_resume()
+    if texts:
+        yield texts, metadatas, ids, stats.pages
+
+
+def _counted(pages: Iterable[Tuple[int, str]], stats: IngestionStats):
+    for page in pages:
+        stats.pages += 1
+        yield page
+
+
+def run_ingestion(
+    pdf_id: str,
+    pdf_path: str,
+    resume: Optional[Checkpoint] = None,
+    on_checkpoint: Optional[Callable[[Checkpoint], None]] = None,
+) -> IngestionStats:
+    """
+    Extract, split, embed and upsert a PDF as a pipeline.
+
+    Pages are extracted in a process pool, with OCR for pages that have no
+    usable text layer (app.chat.ingestion.ocr), and split one at a time
+    with a token-aware splitter (app.chat.ingestion.splitter). Chunks are encoded
+    in batches of EMBED_BATCH_SIZE and upserted in batches of
+    UPSERT_BATCH_SIZE while later pages are still being extracted, so peak
+    memory depends on the batch sizes rather than on the length of the PDF.
+    Each chunk gets the deterministic vector ID {pdf_id}:{page}:{chunk_no}.
+    With BM25_INDEX_SHARED set, the chunks are also indexed for BM25 in a
+    per-PDF inverted index on shared storage (app.chat.retrievers.bm25).
+
+    on_checkpoint is called from this thread when the run starts and before
+    each batch is handed to the upsert thread, with the pages done so far
+    and the chunk counts of every page sent, including that batch's.
+    Passing the last of those checkpoints back as resume skips embedding
+    and upserting the pages done.
+
+    :param pdf_id: The unique identifier for the PDF.
+    :param pdf_path: The file path to the PDF.
+    :param resume: A checkpoint from an interrupted run of the same PDF.
+    :param on_checkpoint: Called with a Checkpoint as pages become durable.
+
+    :return: IngestionStats with page/chunk counts and throughput
+    """
+    stats = IngestionStats()
+    started = time.perf_counter()
+    pages_total = _page_count(pdf_path)
+    if resume:
+        stats.resumed_pages = resume.pages_done
+        stats.chunks = resume.chunks
+
+    # Pages an earlier run sent chunks for stay covered, so their vectors
+    # can still be found if this run stops before reaching them
+    sent = list(resume.chunk_counts) if resume else []
+
+    def checkpoint(pages_done):
+        for page, count in enumerate(stats.chunk_counts):
+            if page < len(sent):
+                sent[page] = max(sent[page], count)
+            else:
+                sent.append(count)
+        if on_checkpoint:
+            on_checkpoint(Checkpoint(pages_done, pages_total, list(sent)))
+
+    checkpoint(stats.resumed_pages)
+    upserter = _Upserter(stats.resumed_pages)
+    # Only worth building where the web processes can read it
+    lexical_index = BM25Builder(pdf_id) if BM25_INDEX_SHARED else None
+    try:
+        for texts, metadatas, ids, pages_done in iter_batches(
+            pdf_id, iter_pages(pdf_path, stats), stats, lexical_index, resume=resume
+        ):
+            vectors = get_embeddings().embed_documents(texts)
+            # Write-ahead: the batch's IDs are recorded before it is sent
+            checkpoint(upserter.pages_done)
+            upserter.put(texts, vectors, metadatas, ids, pages_done)
+            stats.chunks += len(texts)
+    finally:
+        upserter.close()
+    persist_embeddings(pdf_id)
+    if stats.page_methods["ocr"]:
+        prune_cache()
+    # Written last, and only once every vector is in, like a commit
+    if lexical_index is not None:
+        lexical_index.write()
+    checkpoint(stats.pages)
+
+    stats.seconds = time.perf_counter() - started
+    logger.info(
+        f"Ingested PDF {pdf_id}: {stats.pages} pages, {stats.chunks} chunks in "
+        f"{stats.seconds:.2f}s ({stats.pages_per_sec:.1f} pages/s, "
+        f"{stats.chunks_per_sec:.1f} chunks/s"
+        + (f", resumed after {stats.resumed_pages} pages" if stats.resumed_pages else "")
+        + ")"
+    )
+    return stats
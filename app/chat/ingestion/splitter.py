@@ -0,0 +1,83 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.chat.tokens import count_tokens
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "128"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "25"))
+
+# Joins the text carried over from the previous page to the next one
+_PAGE_JOIN = " "
+_WORD = re.compile(r"\S+")
+
+
+@dataclass
+class Chunk:
+    page: int
+    chunk_no: int
+    text: str
+    # Offset of the chunk in its page's text. The first chunk of a page can
+    # open with the tail of the previous page, in which case it is negative.
+    start_index: int
+    token_count: int
+
+
+def _tail(text: str, tokens: int) -> str:
+    """The shortest run of whole words ending text that has at least tokens tokens"""
+    if tokens <= 0:
+        return ""
+    starts = [match.start() for match in _WORD.finditer(text)]
+    for start in reversed(starts):
+        if count_tokens(text[start:]) >= tokens:
+            return text[start:].rstrip()
+    return text.strip()
+
+
+def iter_chunks(
+    pages: Iterable[Tuple[int, str]],
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Chunk]:
+    """
+    Splits pages into chunks of at most chunk_tokens tokens, one page at a
+    time, so that only the current page and its chunks are held in memory.
+
+    Within a page consecutive chunks overlap by up to overlap_tokens tokens,
+    as the splitter does. Across pages, the tail of the previous page's last
+    chunk is carried onto the start of the next page, so a sentence broken
+    by a page break still appears whole in one chunk. Pages without text
+    yield nothing and pass the carried text on. The output depends only on
+    the page texts, so re-ingesting a PDF gives the same chunks and IDs.
+    """
+    # Not add_start_index: it steps back by chunk_overlap characters, which
+    # are tokens here, and can lose track of where a chunk is
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens,
+        chunk_overlap=overlap_tokens,
+        length_function=count_tokens,
+    )
+    carry = ""
+    for page, page_text in pages:
+        if not page_text.strip():
+            continue
+        prefix = carry + _PAGE_JOIN if carry else ""
+        text = prefix + page_text
+        chunk_no, cursor = 0, 0
+        last = None
+        for chunk in splitter.split_text(text):
+            # Chunks come in order, each starting after the previous one
+            position = text.find(chunk, cursor)
+            cursor = position + 1
+            start = position - len(prefix)
+            if start + len(chunk) <= 0:
+                # Nothing but carried text, already in the previous page's chunks
+                continue
+            last = chunk
+            yield Chunk(page, chunk_no, chunk, start, count_tokens(chunk))
+            chunk_no += 1
+        if last is not None:
+            carry = _tail(last, overlap_tokens)
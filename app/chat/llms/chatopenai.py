@@ -1,60 +1,33 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
 from langchain_core.messages import BaseMessage
 from langchain_core.outputs import ChatResult, ChatGenerationChunk
-from typing import List, Optional, Any, Iterator
-from langchain_core.callbacks import CallbackManagerForLLMRun
-import os
+from typing import List, Optional, Any, Iterator, AsyncIterator
+from langchain_core.callbacks import (
+    CallbackManagerForLLMRun,
+    AsyncCallbackManagerForLLMRun,
+)
+
+from app.chat.llms.router import get_router
 
 
 class FallbackChatModel(BaseChatModel):
-    """Chat model with automatic fallback from OpenAI to DeepSeek on quota errors."""
+    """
+    Chat model that routes each call through the process-wide provider
+    router: OpenAI first, DeepSeek when OpenAI's circuit is open or it fails
+    with a provider error, and an optional hedge when the first token is slow.
+    """
 
-    primary: Optional[ChatOpenAI] = None
-    fallback: Optional[ChatOpenAI] = None
-    use_fallback: bool = False
     streaming: bool = False
 
-    model_config = {"arbitrary_types_allowed": True}
-
     def __init__(self, streaming=False, **kwargs):
         super().__init__(streaming=streaming, **kwargs)
-        self.primary = ChatOpenAI(
-            model="gpt-4o-mini",
-            streaming=streaming,
-            max_retries=0  # Disable retries so fallback triggers immediately
-        )
-        self.streaming = streaming
-
-    def _get_fallback(self):
-        if self.fallback is None:
-            self.fallback = ChatOpenAI(
-                model="deepseek-chat",
-                openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
-                openai_api_base=os.getenv("DEEPSEEK_BASE_URL"),
-                streaming=self.streaming,
-            )
-        return self.fallback
-
-    def _handle_error(self, e, method, *args, **kwargs):
-        if "rate_limit" in str(e).lower() or "quota" in str(e).lower() or "429" in str(e):
-            print("OpenAI quota exceeded, switching to DeepSeek...")
-            self.use_fallback = True
-            return getattr(self._get_fallback(), method)(*args, **kwargs)
-        raise
 
     def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
-        if self.use_fallback:
-            return self._get_fallback()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
-        try:
-            return self.primary._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
-        except Exception as e:
-            if "rate_limit" in str(e).lower() or "quota" in str(e).lower() or "429" in str(e):
-                print("OpenAI quota exceeded, switching to DeepSeek...")
-                self.use_fallback = True
-                return self._get_fallback()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
-            else:
-                raise
+        if self.streaming:
+            return generate_from_stream(
+                self._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            )
+        return get_router().generate(messages, stop=stop, **kwargs)
 
     def _stream(
         self,
@@ -63,37 +36,45 @@ class FallbackChatModel(BaseChatModel):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> Iterator[ChatGenerationChunk]:
-        if self.use_fallback:
-            yield from self._get_fallback()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
-            return
+        # Providers run without the run manager, so a hedge that loses the
+        # race never emits tokens; only the winner's chunks are reported
+        for chunk in get_router().stream(messages, stop=stop, **kwargs):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
 
-        try:
-            # Create an iterator from the primary stream
-            stream_iter = self.primary._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
-            # Try to get the first chunk to trigger any connection errors
-            first_chunk = next(stream_iter)
-            # If successful, yield the first chunk and continue
-            yield first_chunk
-            yield from stream_iter
-        except Exception as e:
-            if "rate_limit" in str(e).lower() or "quota" in str(e).lower() or "429" in str(e):
-                print("OpenAI quota exceeded, switching to DeepSeek...")
-                self.use_fallback = True
-                yield from self._get_fallback()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
-            else:
-                raise
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        if self.streaming:
+            chunks = [
+                chunk
+                async for chunk in self._astream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+            ]
+            return generate_from_stream(iter(chunks))
+        return await get_router().agenerate(messages, stop=stop, **kwargs)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in get_router().astream(messages, stop=stop, **kwargs):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
 
     @property
     def _llm_type(self) -> str:
         return "fallback_chat_openai"
 
     def __getattr__(self, name):
-        """Delegate all other attributes to the active model."""
-        if name in ['primary', 'fallback', 'use_fallback', 'streaming']:
-            return super().__getattribute__(name)
-        if self.use_fallback:
-            return getattr(self._get_fallback(), name)
-        return getattr(self.primary, name)
+        """Delegate all other attributes to the primary provider's model."""
+        if name.startswith("_") or name == "streaming":
+            return super().__getattr__(name)
+        return getattr(get_router().primary.client, name)
 
 
 def build_llm(chat_args):
@@ -0,0 +1,480 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Optional
+
+import openai
+from langchain_openai import ChatOpenAI
+
+from app.chat import metrics
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.llms.router")
+
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Start a second provider if the first has not produced a token after this
+# many ms. "0" disables hedging, "p95" uses the rolling p95 time to first
+# token of the provider being hedged.
+LLM_HEDGE_AFTER_MS = os.getenv("LLM_HEDGE_AFTER_MS", "0")
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MAX_WORKERS = int(os.getenv("LLM_HEDGE_MAX_WORKERS", "32"))
+# "priority" tries providers in the configured order; "latency" prefers the
+# provider with the lowest rolling p50 time to first token
+LLM_ROUTING = os.getenv("LLM_ROUTING", "priority")
+
+
+class NoProviderAvailable(Exception):
+    """Raised when every provider's circuit is open or every attempt failed"""
+
+
+def is_provider_error(e: Exception) -> bool:
+    """
+    Errors that say something about the provider rather than the request:
+    timeouts, connection failures, rate limits and 5xx responses. Only these
+    trip a breaker and fail over; a 400 would fail on every provider.
+    """
+    if isinstance(e, openai.APIConnectionError):
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code in (408, 409, 429) or e.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Closed: requests flow. After failure_threshold consecutive failures the
+    circuit opens and the provider is skipped for cooldown seconds. Then it
+    is half-open: a single probe request is let through, which closes the
+    circuit on success or opens it for another cooldown on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self._opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_started = None
+            if self.state == self.HALF_OPEN:
+                # A probe that was abandoned (e.g. a cancelled hedge) never
+                # reports back, so it only holds the slot for one cooldown
+                if self._probe_started and now - self._probe_started < self.cooldown:
+                    return False
+                self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+
+
+class Provider:
+    """An OpenAI-compatible endpoint with its own breaker and latency stats"""
+
+    def __init__(self, name: str, build_client: Callable[[], ChatOpenAI]):
+        self.name = name
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+        self._build_client = build_client
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> ChatOpenAI:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build_client()
+        return self._client
+
+    def metric(self, name: str) -> str:
+        return f"llm.{self.name}.{name}"
+
+    def succeeded(self, started: float, timing: str = "latency_ms"):
+        self.breaker.record_success()
+        metrics.observe(self.metric(timing), (time.perf_counter() - started) * 1000)
+
+    def failed(self, e: Exception):
+        metrics.incr(self.metric("failures"))
+        if is_provider_error(e):
+            self.breaker.record_failure()
+            logger.warning(f"LLM provider {self.name} failed: {e!r}")
+
+    def stats(self) -> dict:
+        snapshot = metrics.snapshot()["counters"]
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "requests": snapshot.get(self.metric("requests"), 0),
+            "failures": snapshot.get(self.metric("failures"), 0),
+            "hedge_wins": snapshot.get(self.metric("hedge_wins"), 0),
+            "latency": metrics.timing_stats(self.metric("latency_ms")),
+            "ttft": metrics.timing_stats(self.metric("ttft_ms")),
+        }
+
+
+def _close(result):
+    """Releases the HTTP stream of a first-token result that lost a race"""
+    iterator = result[0] if isinstance(result, tuple) else None
+    if iterator is None:
+        return
+    try:
+        if hasattr(iterator, "aclose"):
+            asyncio.ensure_future(iterator.aclose())
+        else:
+            iterator.close()
+    except Exception:
+        pass
+
+
+class ProviderRouter:
+    """
+    Routes chat requests across providers in order, skipping any whose
+    circuit is open and failing over to the next one on provider errors.
+
+    Streams fail over only until the first token: after that the answer is
+    already on its way to the user, so a mid-stream error is raised. With
+    hedging enabled, a stream whose provider has not produced a token after
+    the hedge delay is raced against the next provider, and whichever
+    answers first is used. Hedging trades extra provider calls for tail
+    latency, so it is off by default.
+    """
+
+    def __init__(self, providers: List[Provider], hedge_after_ms: str = LLM_HEDGE_AFTER_MS):
+        self.providers = providers
+        self.hedge_after_ms = hedge_after_ms
+        self._pool = ThreadPoolExecutor(
+            max_workers=LLM_HEDGE_MAX_WORKERS, thread_name_prefix="llm-hedge"
+        )
+
+    @property
+    def primary(self) -> Provider:
+        return self.providers[0]
+
+    def _ordered(self) -> List[Provider]:
+        if LLM_ROUTING != "latency":
+            return list(self.providers)
+
+        # Providers without enough samples go first so they get measured.
+        # A provider demoted for being slow still serves hedges and
+        # failovers, which keep its numbers current.
+        def rank(item):
+            priority, provider = item
+            ttft = metrics.timing_stats(provider.metric("ttft_ms"))
+            if ttft["count"] < LLM_HEDGE_MIN_SAMPLES:
+                return (0, 0.0, priority)
+            return (1, ttft["p50_ms"], priority)
+
+        return [provider for _, provider in sorted(enumerate(self.providers), key=rank)]
+
+    def _candidates(self):
+        # Lazy, so a half-open breaker only hands out its probe slot to a
+        # provider that is actually about to be called
+        for provider in self._ordered():
+            if provider.breaker.allow():
+                yield provider
+
+    def _hedge_delay(self, provider: Provider) -> Optional[float]:
+        """Seconds to wait for a first token before hedging, or None"""
+        setting = self.hedge_after_ms
+        if setting == "p95":
+            ttft = metrics.timing_stats(provider.metric("ttft_ms"))
+            if ttft["count"] < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            return ttft["p95_ms"] / 1000
+        delay = float(setting or 0)
+        return delay / 1000 if delay > 0 else None
+
+    # -- Attempts. Each returns a result or raises, recording stats as it goes
+
+    def _generate_once(self, provider, messages, stop, kwargs):
+        metrics.incr(provider.metric("requests"))
+        started = time.perf_counter()
+        try:
+            result = provider.client._generate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            provider.failed(e)
+            raise
+        provider.succeeded(started)
+        return result
+
+    def _first_chunk(self, provider, messages, stop, kwargs):
+        metrics.incr(provider.metric("requests"))
+        started = time.perf_counter()
+        iterator = provider.client._stream(messages, stop=stop, **kwargs)
+        try:
+            first = next(iterator)
+        except StopIteration:
+            first = None
+        except Exception as e:
+            provider.failed(e)
+            raise
+        provider.succeeded(started, "ttft_ms")
+        return iterator, first, started
+
+    async def _agenerate_once(self, provider, messages, stop, kwargs):
+        metrics.incr(provider.metric("requests"))
+        started = time.perf_counter()
+        try:
+            result = await provider.client._agenerate(messages, stop=stop, **kwargs)
+        except Exception as e:
+            provider.failed(e)
+            raise
+        provider.succeeded(started)
+        return result
+
+    async def _afirst_chunk(self, provider, messages, stop, kwargs):
+        metrics.incr(provider.metric("requests"))
+        started = time.perf_counter()
+        iterator = provider.client._astream(messages, stop=stop, **kwargs)
+        try:
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except Exception as e:
+            provider.failed(e)
+            raise
+        provider.succeeded(started, "ttft_ms")
+        return iterator, first, started
+
+    # -- Racing attempts across providers
+
+    def _race(self, attempt, hedge: bool):
+        """
+        Runs attempt(provider) on the first available provider, failing over
+        on provider errors. With hedge set, attempts run on the hedge pool
+        and the next provider is started alongside a slow one.
+        """
+        candidates = self._candidates()
+        last_error = None
+
+        if not hedge:
+            for provider in candidates:
+                try:
+                    return provider, attempt(provider)
+                except Exception as e:
+                    if not is_provider_error(e):
+                        raise
+                    last_error = e
+            raise NoProviderAvailable("No LLM provider available") from last_error
+
+        pending = {}
+        hedged = False
+
+        def launch():
+            provider = next(candidates, None)
+            if provider is not None:
+                pending[self._pool.submit(attempt, provider)] = provider
+            return provider
+
+        launch()
+        try:
+            while pending:
+                delay = None
+                if len(pending) == 1:
+                    delay = self._hedge_delay(next(iter(pending.values())))
+                done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        hedged = True
+                        metrics.incr("llm.hedges")
+                    continue
+                for future in done:
+                    provider = pending.pop(future)
+                    e = future.exception()
+                    if e is None:
+                        if hedged:
+                            metrics.incr(provider.metric("hedge_wins"))
+                        return provider, future.result()
+                    if not is_provider_error(e):
+                        raise e
+                    last_error = e
+                if not pending:
+                    launch()
+        finally:
+            # Losers can't be interrupted mid-request; their streams are
+            # closed as soon as they produce a first token
+            for future in pending:
+                future.add_done_callback(
+                    lambda f: f.exception() is None and _close(f.result())
+                )
+        raise NoProviderAvailable("No LLM provider available") from last_error
+
+    async def _arace(self, attempt, hedge: bool):
+        """Async counterpart of _race; losing attempts are cancelled"""
+        candidates = self._candidates()
+        last_error = None
+
+        if not hedge:
+            for provider in candidates:
+                try:
+                    return provider, await attempt(provider)
+                except Exception as e:
+                    if not is_provider_error(e):
+                        raise
+                    last_error = e
+            raise NoProviderAvailable("No LLM provider available") from last_error
+
+        pending = {}
+        hedged = False
+
+        def launch():
+            provider = next(candidates, None)
+            if provider is not None:
+                pending[asyncio.ensure_future(attempt(provider))] = provider
+            return provider
+
+        launch()
+        try:
+            while pending:
+                delay = None
+                if len(pending) == 1:
+                    delay = self._hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if launch():
+                        hedged = True
+                        metrics.incr("llm.hedges")
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    e = task.exception()
+                    if e is None:
+                        if hedged:
+                            metrics.incr(provider.metric("hedge_wins"))
+                        return provider, task.result()
+                    if not is_provider_error(e):
+                        raise e
+                    last_error = e
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    _close(task.result())
+        raise NoProviderAvailable("No LLM provider available") from last_error
+
+    def _hedging(self) -> bool:
+        return len(self.providers) > 1 and self.hedge_after_ms not in ("", "0")
+
+    # -- Public API, mirroring the BaseChatModel hooks
+
+    def generate(self, messages, stop=None, **kwargs):
+        _, result = self._race(
+            lambda p: self._generate_once(p, messages, stop, kwargs), hedge=False
+        )
+        return result
+
+    def stream(self, messages, stop=None, **kwargs):
+        provider, (iterator, first, started) = self._race(
+            lambda p: self._first_chunk(p, messages, stop, kwargs), hedge=self._hedging()
+        )
+        try:
+            if first is not None:
+                yield first
+            for chunk in iterator:
+                yield chunk
+        except Exception as e:
+            provider.failed(e)
+            raise
+        finally:
+            iterator.close()
+        provider.succeeded(started)
+
+    async def agenerate(self, messages, stop=None, **kwargs):
+        _, result = await self._arace(
+            lambda p: self._agenerate_once(p, messages, stop, kwargs), hedge=False
+        )
+        return result
+
+    async def astream(self, messages, stop=None, **kwargs):
+        provider, (iterator, first, started) = await self._arace(
+            lambda p: self._afirst_chunk(p, messages, stop, kwargs), hedge=self._hedging()
+        )
+        try:
+            if first is not None:
+                yield first
+            async for chunk in iterator:
+                yield chunk
+        except Exception as e:
+            provider.failed(e)
+            raise
+        finally:
+            await iterator.aclose()
+        provider.succeeded(started)
+
+    def stats(self) -> dict:
+        return {provider.name: provider.stats() for provider in self.providers}
+
+
+def _openai_client():
+    return ChatOpenAI(
+        model=os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini"),
+        timeout=LLM_REQUEST_TIMEOUT,
+        # The router fails over instead of retrying against the same provider
+        max_retries=0,
+    )
+
+
+def _deepseek_client():
+    return ChatOpenAI(
+        model=os.getenv("DEEPSEEK_CHAT_MODEL", "deepseek-chat"),
+        openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
+        openai_api_base=os.getenv("DEEPSEEK_BASE_URL"),
+        timeout=LLM_REQUEST_TIMEOUT,
+        max_retries=0,
+    )
+
+
+def default_providers() -> List[Provider]:
+    providers = [Provider("openai", _openai_client)]
+    if os.getenv("DEEPSEEK_API_KEY"):
+        providers.append(Provider("deepseek", _deepseek_client))
+    return providers
+
+
+_lock = threading.Lock()
+_router = None
+_router_pid = None
+
+
+def get_router() -> ProviderRouter:
+    global _router, _router_pid
+    with _lock:
+        # Breaker state is per process; HTTP pools and hedge threads must
+        # not be shared with a forked child
+        if _router is None or _router_pid != os.getpid():
+            _router = ProviderRouter(default_providers())
+            _router_pid = os.getpid()
+        return _router
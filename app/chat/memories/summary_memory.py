@@ -0,0 +1,53 @@
+import os
+from typing import List, Optional
+
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.schema import BaseMessage, SystemMessage, get_buffer_string
+
+from app.web.api import (
+    get_messages_by_conversation_id,
+    HISTORY_MAX_MESSAGES,
+    HISTORY_TOKEN_BUDGET,
+)
+
+# "buffer" sends the recent window of messages, "summary" sends a rolling
+# summary plus the messages it doesn't cover yet. A conversation's own
+# memory column, when set, takes precedence.
+CHAT_MEMORY_MODE = os.getenv("CHAT_MEMORY_MODE", "buffer")
+# Newest messages that are always sent verbatim and never folded
+SUMMARY_RECENT_MESSAGES = int(os.getenv("SUMMARY_RECENT_MESSAGES", "4"))
+# Most messages folded into the summary by one LLM call
+SUMMARY_BATCH_MESSAGES = int(os.getenv("SUMMARY_BATCH_MESSAGES", "40"))
+
+
+def uses_summary_memory(conversation) -> bool:
+    return (conversation.memory or CHAT_MEMORY_MODE) == "summary"
+
+
+def load_summary_history(conversation) -> List[BaseMessage]:
+    """
+    Chat history for a summary-memory conversation: the rolling summary as a
+    system message, followed by the messages written since it was last
+    updated. Normally that is the last SUMMARY_RECENT_MESSAGES messages; if
+    the summarizer is behind, the usual window and token budget apply.
+    """
+    messages = get_messages_by_conversation_id(
+        conversation.id,
+        limit=HISTORY_MAX_MESSAGES,
+        token_budget=HISTORY_TOKEN_BUDGET,
+        after=conversation.summarized_until,
+    )
+    if not conversation.summary:
+        return messages
+    summary = SystemMessage(
+        content=f"Summary of the earlier conversation: {conversation.summary}"
+    )
+    return [summary, *messages]
+
+
+def fold_summary(summary: Optional[str], messages: List[BaseMessage], llm) -> str:
+    """Returns summary extended with the given messages"""
+    prompt = SUMMARY_PROMPT.format(
+        summary=summary or "", new_lines=get_buffer_string(messages)
+    )
+    return llm.invoke(prompt).content.strip()
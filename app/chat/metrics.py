@@ -0,0 +1,55 @@
+import threading
+from collections import defaultdict, deque
+
+# Timings keep a rolling window of the most recent observations per name
+TIMING_WINDOW = 1000
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = defaultdict(int)
+_timings = defaultdict(lambda: deque(maxlen=TIMING_WINDOW))
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def gauge(name: str, delta: int) -> None:
+    """Adjusts a level (e.g. active streams) up or down by delta"""
+    with _lock:
+        _gauges[name] += delta
+
+
+def observe(name: str, milliseconds: float) -> None:
+    with _lock:
+        _timings[name].append(milliseconds)
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def timing_stats(name: str) -> dict:
+    with _lock:
+        values = list(_timings.get(name, ()))
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.5), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+    }
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timing_names = list(_timings.keys())
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "timings": {name: timing_stats(name) for name in timing_names},
+    }
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -12,3 +13,7 @@ class ChatArgs(BaseModel, extra="allow"):
     pdf_id: str
     metadata: Metadata
     streaming: bool
+    # Component names stored on the Conversation; None means the default
+    llm: Optional[str] = None
+    retriever: Optional[str] = None
+    memory: Optional[str] = None
@@ -0,0 +1,108 @@
+import os
+import threading
+from typing import Callable, Dict, Tuple
+
+from langchain_core.retrievers import BaseRetriever
+
+from app.chat.models import ChatArgs
+from app.chat.vector_stores.pinecone import build_retriever
+from app.chat.retrievers.packing import build_packing_retriever
+from app.chat.retrievers.hybrid import build_hybrid_retriever
+from app.chat.llms.chatopenai import build_llm
+from app.chat.chains.retrieval import StreamingConversationalRetrievalChain
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.registry")
+
+# Component name -> builder. Names are what Conversation.llm/.retriever store.
+# LLM builders are called once per (name, streaming) and the result shared by
+# every request, so they must return thread-safe clients; retriever builders
+# are called per request because the retriever is scoped to one PDF.
+llm_map: Dict[str, Callable[[ChatArgs], object]] = {
+    "gpt-4o-mini": build_llm,
+}
+retriever_map: Dict[str, Callable[[ChatArgs], object]] = {
+    "pinecone": build_retriever,
+    # Same search, with overlapping chunks merged and packed into a budget
+    "pinecone_packed": build_packing_retriever,
+    # Dense plus BM25, fused with reciprocal-rank fusion, then packed. Needs
+    # BM25_INDEX_SHARED (see app.chat.retrievers.bm25).
+    "pinecone_hybrid": build_hybrid_retriever,
+}
+
+DEFAULT_LLM = "gpt-4o-mini"
+DEFAULT_RETRIEVER = os.getenv("DEFAULT_RETRIEVER", "pinecone_packed")
+
+_lock = threading.Lock()
+_templates: Dict[Tuple[str, bool], StreamingConversationalRetrievalChain] = {}
+
+
+def _component(component_map, name, default, kind):
+    if name in component_map:
+        return name
+    if name is not None:
+        logger.warning(f"Unknown {kind} '{name}', using '{default}'")
+    return default
+
+
+class _UnboundRetriever(BaseRetriever):
+    """Placeholder retriever of a chain template; replaced on every bind"""
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        raise RuntimeError("Chain template used without binding a retriever")
+
+
+def get_chain_template(llm_name: str, chat_args: ChatArgs):
+    """
+    Returns the shared, prebuilt chain for an LLM: the LLM client with its
+    HTTP connection pool plus the parsed condense and answer prompts. The
+    template has no retriever; bind one with bind_chain.
+    """
+    key = (llm_name, bool(chat_args.streaming))
+    template = _templates.get(key)
+    if template is None:
+        with _lock:
+            template = _templates.get(key)
+            if template is None:
+                llm = llm_map[llm_name](chat_args)
+                template = StreamingConversationalRetrievalChain.from_llm(
+                    llm=llm,
+                    retriever=_UnboundRetriever(),
+                    return_source_documents=True,
+                    return_generated_question=True,
+                )
+                _templates[key] = template
+                logger.info(f"Built chain template for {key}")
+    return template
+
+
+def bind_chain(template, retriever, chat_args: ChatArgs):
+    """
+    Per-request chain: a shallow copy of the template that shares its LLM
+    and prompt chains but uses this request's retriever and metadata.
+    Copying skips pydantic validation and prompt parsing entirely.
+    """
+    return template.model_copy(
+        update={"retriever": retriever, "metadata": chat_args.metadata.model_dump()}
+    )
+
+
+def build_chat_from_registry(chat_args: ChatArgs):
+    llm_name = _component(llm_map, chat_args.llm, DEFAULT_LLM, "llm")
+    retriever_name = _component(
+        retriever_map, chat_args.retriever, DEFAULT_RETRIEVER, "retriever"
+    )
+
+    template = get_chain_template(llm_name, chat_args)
+    retriever = retriever_map[retriever_name](chat_args)
+    return bind_chain(template, retriever, chat_args)
+
+
+def clear_registry():
+    """Drops cached templates, e.g. after changing credentials"""
+    _templates.clear()
+
+
+# HTTP connection pools must not be shared with a forked child
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=clear_registry)
@@ -0,0 +1,318 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import shutil
+import tempfile
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.chat import metrics
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.retrievers.bm25")
+
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", os.path.join("instance", "bm25_index"))
+# Indexes are written by the Celery workers and read by the web processes,
+# so BM25_INDEX_DIR must be storage they all mount (or a single host runs
+# both). Setting this says it is; without it no index is built or read.
+BM25_INDEX_SHARED = os.getenv("BM25_INDEX_SHARED", "false").lower() == "true"
+BM25_CACHE_SIZE = int(os.getenv("BM25_CACHE_SIZE", "64"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Runs of letters and digits, optionally joined by - _ . / : so that part
+# numbers (AB-1234/5), error codes (E_0x1F) and clause references (4.2.1)
+# survive as one token
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased tokens of text. A compound token is indexed both whole and
+    as its parts, so "ERR-1042" matches queries for "err-1042" and "1042".
+    """
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _PART.findall(token) if len(part) > 1)
+    return tokens
+
+
+def _index_dir(pdf_id: str, root: str = None) -> str:
+    # Same naming as the local vector store's partitions, without importing
+    # it (and faiss) into the web process
+    name = str(pdf_id)
+    if _UNSAFE_CHARS.search(name) or name in ("", ".", ".."):
+        name = hashlib.sha256(name.encode("utf-8")).hexdigest()
+    return os.path.join(root or BM25_INDEX_DIR, name)
+
+
+class BM25Builder:
+    """
+    Accumulates the chunks of one PDF during ingestion and writes them as an
+    inverted index: a sorted term list, CSR postings (document numbers and
+    term frequencies per term) and document lengths as numpy arrays, plus
+    the chunks themselves so lexical hits can be returned as Documents.
+
+    Only the vocabulary is kept in memory, while chunks are added and while
+    they are written. Chunks and postings are spooled to temporary files, and
+    write() moves the postings into term order a block at a time, straight
+    into memory-mapped output files, so the peak doesn't grow with the PDF.
+    """
+
+    # Postings buffered in memory before they are appended to the spool, and
+    # read back at once by write()
+    SPILL_POSTINGS = 65536
+
+    def __init__(self, pdf_id: str, root: str = None):
+        self.pdf_id = pdf_id
+        self.root = root or BM25_INDEX_DIR
+        self._terms = {}
+        self._lengths = array("i")
+        self._postings = (array("i"), array("i"), array("H"))
+        self._spools = tuple(tempfile.TemporaryFile() for _ in self._postings)
+        self._docs = tempfile.TemporaryFile(mode="w+")
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, doc_id: str, text: str, metadata: dict) -> None:
+        number = len(self._lengths)
+        counts = Counter(tokenize(text))
+        term_ids, doc_nos, tfs = self._postings
+        for term, tf in counts.items():
+            term_ids.append(self._terms.setdefault(term, len(self._terms)))
+            doc_nos.append(number)
+            tfs.append(min(tf, 65535))
+        self._lengths.append(sum(counts.values()))
+        metadata = {key: v for key, v in metadata.items() if key != "text"}
+        self._docs.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata}) + "\n")
+        if len(term_ids) >= self.SPILL_POSTINGS:
+            self._spill()
+
+    def _spill(self):
+        for values, spool in zip(self._postings, self._spools):
+            values.tofile(spool)
+            del values[:]
+
+    def _blocks(self, *columns: int):
+        """Reads the spooled posting columns back SPILL_POSTINGS at a time"""
+        spools = [self._spools[n] for n in columns]
+        dtypes = [np.dtype(self._postings[n].typecode) for n in columns]
+        for spool in spools:
+            spool.seek(0)
+        while True:
+            block = [
+                np.fromfile(spool, dtype=dtype, count=self.SPILL_POSTINGS)
+                for spool, dtype in zip(spools, dtypes)
+            ]
+            if not len(block[0]):
+                return
+            yield block
+
+    def _write_postings(self, directory: str, renumber: np.ndarray) -> np.ndarray:
+        """
+        Writes docs.npy and tfs.npy grouped by sorted term number and returns
+        the CSR offsets. One pass counts each term's postings; a second
+        scatters every block to its terms' next free slots. Blocks come in
+        document order, so each term's document numbers stay ascending.
+        """
+        counts = np.zeros(len(renumber), dtype=np.int64)
+        for (term_ids,) in self._blocks(0):
+            counts += np.bincount(renumber[term_ids], minlength=len(renumber))
+        offsets = np.zeros(len(renumber) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        total = int(offsets[-1])
+
+        docs = np.lib.format.open_memmap(
+            os.path.join(directory, "docs.npy"), mode="w+", dtype=np.int32, shape=(total,)
+        )
+        tfs = np.lib.format.open_memmap(
+            os.path.join(directory, "tfs.npy"), mode="w+", dtype=np.uint16, shape=(total,)
+        )
+        cursor = offsets[:-1].copy()
+        for term_ids, doc_nos, block_tfs in self._blocks(0, 1, 2):
+            term_ids = renumber[term_ids]
+            order = np.argsort(term_ids, kind="stable")
+            term_ids = term_ids[order]
+            # Rank of each posting among the block's postings of its term
+            rank = np.arange(len(term_ids)) - np.searchsorted(term_ids, term_ids)
+            slots = cursor[term_ids] + rank
+            docs[slots] = doc_nos[order]
+            tfs[slots] = block_tfs[order]
+            terms, block_counts = np.unique(term_ids, return_counts=True)
+            cursor[terms] += block_counts
+        docs.flush()
+        tfs.flush()
+        del docs, tfs
+        for spool in self._spools:
+            spool.close()
+        return offsets
+
+    def write(self) -> str:
+        self._spill()
+        terms = sorted(self._terms)
+        renumber = np.empty(len(terms), dtype=np.int32)
+        for i, term in enumerate(terms):
+            renumber[self._terms[term]] = i
+
+        os.makedirs(self.root, exist_ok=True)
+        target = _index_dir(self.pdf_id, self.root)
+        staging = f"{target}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(staging)
+        offsets = self._write_postings(staging, renumber)
+        np.savez(
+            os.path.join(staging, "index.npz"),
+            offsets=offsets,
+            lengths=np.frombuffer(self._lengths, dtype=np.int32),
+        )
+        with open(os.path.join(staging, "terms.json"), "w") as f:
+            json.dump(terms, f)
+        self._docs.seek(0)
+        with open(os.path.join(staging, "docs.jsonl"), "w") as f:
+            shutil.copyfileobj(self._docs, f)
+        self._docs.close()
+
+        # Swap the directory in; a reader that loaded the old one keeps it
+        # until it notices the new inode
+        retired = f"{target}.old-{uuid.uuid4().hex}"
+        if os.path.isdir(target):
+            os.rename(target, retired)
+        os.rename(staging, target)
+        shutil.rmtree(retired, ignore_errors=True)
+        logger.info(
+            f"Wrote BM25 index for PDF {self.pdf_id}: {len(self)} chunks, "
+            f"{len(terms)} terms"
+        )
+        return target
+
+
+class BM25Index:
+    """A loaded per-PDF index; search is a few numpy operations per term"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.inode = os.stat(directory).st_ino
+        with np.load(os.path.join(directory, "index.npz")) as arrays:
+            self.offsets = arrays["offsets"]
+            lengths = arrays["lengths"].astype(np.float32)
+            if "docs" in arrays.files:
+                # Written before the postings moved to their own files
+                docs, tfs = arrays["docs"], arrays["tfs"]
+            else:
+                docs = np.load(os.path.join(directory, "docs.npy"))
+                tfs = np.load(os.path.join(directory, "tfs.npy"))
+        self.docs = docs
+        self.tfs = tfs.astype(np.float32)
+        with open(os.path.join(directory, "terms.json")) as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(directory, "docs.jsonl")) as f:
+            self.chunks = [json.loads(line) for line in f]
+
+        count = len(lengths)
+        average = float(lengths.mean()) if count else 0.0
+        # Per-document part of the BM25 denominator, computed once
+        self.norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (average or 1.0))
+        frequencies = np.diff(self.offsets)
+        self.idf = np.log(1 + (count - frequencies + 0.5) / (frequencies + 0.5)).astype(
+            np.float32
+        )
+
+    def is_stale(self) -> bool:
+        try:
+            return os.stat(self.directory).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            docs, tfs = self.docs[start:stop], self.tfs[start:stop]
+            scores[docs] += self.idf[term_id] * tfs * (BM25_K1 + 1) / (tfs + self.norms[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(scores[matched], -k)[-k:]]
+        ranked = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(n), float(scores[n])) for n in ranked]
+
+    def documents(self, query: str, k: int) -> List[Document]:
+        results = []
+        for number, score in self.search(query, k):
+            chunk = self.chunks[number]
+            metadata = {**chunk["metadata"], "bm25_score": round(score, 4)}
+            results.append(
+                Document(id=chunk["id"], page_content=chunk["text"], metadata=metadata)
+            )
+        return results
+
+
+_lock = threading.Lock()
+_indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+
+
+def get_bm25_index(pdf_id: str) -> Optional[BM25Index]:
+    """The PDF's index from a small LRU, reloaded after a re-ingest; None if not built"""
+    directory = _index_dir(pdf_id)
+    with _lock:
+        index = _indexes.get(directory)
+        if index is not None and not index.is_stale():
+            _indexes.move_to_end(directory)
+            return index
+
+    if not os.path.isdir(directory):
+        return None
+    index = BM25Index(directory)
+    with _lock:
+        _indexes[directory] = index
+        _indexes.move_to_end(directory)
+        while len(_indexes) > BM25_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def storage_problem() -> Optional[str]:
+    """Why this process can't use BM25 indexes, or None if it can"""
+    if not BM25_INDEX_SHARED:
+        return "BM25_INDEX_SHARED is not set"
+    if not os.path.isdir(BM25_INDEX_DIR):
+        return f"BM25_INDEX_DIR {BM25_INDEX_DIR} does not exist"
+    if not os.access(BM25_INDEX_DIR, os.R_OK | os.W_OK | os.X_OK):
+        return f"BM25_INDEX_DIR {BM25_INDEX_DIR} is not readable and writable"
+    return None
+
+
+def lexical_search(pdf_id: str, query: str, k: int) -> List[Document]:
+    index = get_bm25_index(pdf_id)
+    if index is None:
+        # On shared storage a missing index means the PDF predates it or
+        # the mount isn't the one the workers write to
+        metrics.incr("retrieval.bm25_missing")
+        logger.warning(f"No BM25 index for PDF {pdf_id} in {BM25_INDEX_DIR}")
+        return []
+    return index.documents(query, k)
+
+
+def delete_bm25_index(pdf_id: str) -> bool:
+    directory = _index_dir(pdf_id)
+    with _lock:
+        _indexes.pop(directory, None)
+    if not os.path.isdir(directory):
+        return False
+    shutil.rmtree(directory)
+    return True
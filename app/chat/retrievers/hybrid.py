@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.chat import metrics
+from app.chat.retrievers.bm25 import lexical_search, storage_problem
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.retrievers.hybrid")
+
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "8"))
+HYBRID_K = int(os.getenv("HYBRID_K", "4"))
+# The k in 1 / (k + rank); larger values flatten the difference between ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_SEARCH_WORKERS = int(os.getenv("LEXICAL_SEARCH_WORKERS", "8"))
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(
+                max_workers=LEXICAL_SEARCH_WORKERS, thread_name_prefix="lexical-search"
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def chunk_id(doc: Document) -> str:
+    """The chunk's vector ID, {pdf_id}:{page}:{chunk_no}, however it was retrieved"""
+    if doc.id:
+        return doc.id
+    from app.chat.vector_stores.pinecone import vector_id
+
+    metadata = doc.metadata
+    if {"pdf_id", "page", "chunk_no"} <= metadata.keys():
+        return vector_id(metadata["pdf_id"], int(metadata["page"]), int(metadata["chunk_no"]))
+    return doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int, rrf_k: int = RRF_K):
+    """
+    Fuses ranked lists on chunk ID: each chunk scores sum(1 / (rrf_k + rank))
+    over the lists it appears in. Ranks are used rather than scores because
+    cosine similarities and BM25 scores aren't comparable.
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = chunk_id(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    fused = []
+    for key in ranked:
+        doc = documents[key]
+        fused.append(
+            Document(
+                id=key,
+                page_content=doc.page_content,
+                metadata={**doc.metadata, "rrf_score": round(scores[key], 6)},
+            )
+        )
+    return fused
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense retrieval from the vector store plus BM25 over the PDF's inverted
+    index on shared storage, run concurrently and fused with reciprocal-rank
+    fusion. Exact tokens like part numbers and error codes that embeddings
+    blur are found by the lexical leg. Without an index for the PDF
+    (ingested before the index existed) results are dense only, which is
+    counted as retrieval.bm25_missing.
+    """
+
+    vector_retriever: BaseRetriever
+    pdf_id: str
+    k: int = HYBRID_K
+    candidates: int = HYBRID_CANDIDATES
+
+    def _lexical(self, query: str) -> List[Document]:
+        started = time.perf_counter()
+        try:
+            return lexical_search(self.pdf_id, query, self.candidates)
+        except Exception as e:
+            metrics.incr("retrieval.lexical_errors")
+            logger.warning(f"Lexical search failed for PDF {self.pdf_id}: {e}")
+            return []
+        finally:
+            metrics.observe(
+                "retrieval.lexical_ms", (time.perf_counter() - started) * 1000
+            )
+
+    def _fuse(self, dense, lexical):
+        if not lexical:
+            metrics.incr("retrieval.dense_only")
+        return reciprocal_rank_fusion([dense, lexical], self.k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # The lexical leg is local and fast; run it beside the network-bound
+        # dense search rather than after it
+        lexical = _get_pool().submit(contextvars.copy_context().run, self._lexical, query)
+        started = time.perf_counter()
+        dense = self.vector_retriever.invoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        metrics.observe("retrieval.dense_ms", (time.perf_counter() - started) * 1000)
+        return self._fuse(dense, lexical.result())
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        async def dense_search():
+            started = time.perf_counter()
+            try:
+                return await self.vector_retriever.ainvoke(
+                    query, config={"callbacks": run_manager.get_child()}
+                )
+            finally:
+                metrics.observe(
+                    "retrieval.dense_ms", (time.perf_counter() - started) * 1000
+                )
+
+        dense, lexical = await asyncio.gather(
+            dense_search(), asyncio.to_thread(self._lexical, query)
+        )
+        return self._fuse(dense, lexical)
+
+
+def build_hybrid_retriever(chat_args):
+    from app.chat.vector_stores.pinecone import get_vector_store
+    from app.chat.retrievers.packing import (
+        ContextPackingRetriever,
+        build_packing_retriever,
+    )
+    from app.chat.retrievers.rerank import candidate_count, maybe_rerank
+
+    problem = storage_problem()
+    if problem:
+        # Said loudly rather than quietly searching an index that isn't there
+        metrics.incr("retrieval.hybrid_unavailable")
+        logger.warning(f"Hybrid retrieval unavailable ({problem}), using dense retrieval")
+        return build_packing_retriever(chat_args)
+
+    k = candidate_count(HYBRID_K)
+    candidates = max(HYBRID_CANDIDATES, k)
+    search_kwargs = {"filter": {"pdf_id": chat_args.pdf_id}, "k": candidates}
+    hybrid = HybridRetriever(
+        vector_retriever=get_vector_store().as_retriever(search_kwargs=search_kwargs),
+        pdf_id=str(chat_args.pdf_id),
+        k=k,
+        candidates=candidates,
+    )
+    return ContextPackingRetriever(retriever=maybe_rerank(hybrid))
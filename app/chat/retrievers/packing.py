@@ -0,0 +1,162 @@
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.chat import metrics
+from app.chat.tokens import count_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "4"))
+
+
+def _token_count(doc: Document) -> int:
+    # Precomputed at ingestion; chunks ingested before that are counted now
+    tokens = doc.metadata.get("token_count")
+    return int(tokens) if tokens is not None else count_tokens(doc.page_content)
+
+
+@dataclass
+class _Span:
+    """A run of text from one page, built from one or more chunks"""
+
+    key: tuple
+    id: Optional[str]
+    start: Optional[int]
+    text: str
+    tokens: int
+    rank: int
+    metadata: dict
+    chunk_nos: List[int] = field(default_factory=list)
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+    def absorb(self, doc: Document, start: int, tokens: int, rank: int):
+        """Appends the part of doc that goes past the end of this span"""
+        new_text = doc.page_content[max(0, self.end - start) :]
+        if new_text:
+            # Only the new characters add tokens; prorate the chunk's count
+            self.tokens += round(tokens * len(new_text) / len(doc.page_content))
+            self.text += new_text
+        self.rank = min(self.rank, rank)
+        if "chunk_no" in doc.metadata:
+            self.chunk_nos.append(doc.metadata["chunk_no"])
+
+
+def merge_chunks(docs: List[Document]) -> List[_Span]:
+    """
+    Merges chunks from the same page whose text overlaps or touches, using
+    the start_index stored at ingestion, and drops repeated text. Spans keep
+    the rank of their best chunk and come back in rank order.
+    """
+    spans, seen = [], set()
+    positioned = {}
+    for rank, doc in enumerate(docs):
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        metadata = doc.metadata
+        key = (metadata.get("pdf_id"), metadata.get("page"))
+        start = metadata.get("start_index")
+        tokens = _token_count(doc)
+        if start is None or metadata.get("page") is None:
+            spans.append(
+                _Span(key, doc.id, None, doc.page_content, tokens, rank, metadata)
+            )
+            continue
+        positioned.setdefault(key, []).append((int(start), rank, doc, tokens))
+
+    for key, chunks in positioned.items():
+        chunks.sort(key=lambda chunk: chunk[0])
+        span = None
+        for start, rank, doc, tokens in chunks:
+            if span is not None and start <= span.end:
+                span.absorb(doc, start, tokens, rank)
+                continue
+            span = _Span(
+                key,
+                doc.id,
+                start,
+                doc.page_content,
+                tokens,
+                rank,
+                doc.metadata,
+                [doc.metadata["chunk_no"]] if "chunk_no" in doc.metadata else [],
+            )
+            spans.append(span)
+
+    spans.sort(key=lambda span: span.rank)
+    return spans
+
+
+def pack_context(docs: List[Document], token_budget: int) -> List[Document]:
+    """
+    Returns the merged spans of docs, most relevant first, that fit in
+    token_budget tokens. The best span is always kept, even if it alone is
+    over budget; after that, spans that don't fit are skipped so a smaller,
+    less relevant one can still use the remaining room.
+    """
+    packed, used = [], 0
+    for span in merge_chunks(docs):
+        if packed and used + span.tokens > token_budget:
+            continue
+        used += span.tokens
+        metadata = {**span.metadata, "token_count": span.tokens}
+        if span.start is not None:
+            metadata["start_index"] = span.start
+        if len(span.chunk_nos) > 1:
+            metadata["chunk_nos"] = span.chunk_nos
+        # A merged passage keeps the ID of its first chunk
+        packed.append(Document(id=span.id, page_content=span.text, metadata=metadata))
+
+    metrics.incr("context.chunks_in", len(docs))
+    metrics.incr("context.chunks_out", len(packed))
+    metrics.incr("context.tokens_in", sum(_token_count(doc) for doc in docs))
+    metrics.incr("context.tokens_out", used)
+    return packed
+
+
+class ContextPackingRetriever(BaseRetriever):
+    """
+    Wraps a retriever so the stuff-documents step gets deduplicated context
+    within a token budget: overlapping chunks of a page are merged into one
+    passage and the passages are packed most relevant first.
+    """
+
+    retriever: BaseRetriever
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return pack_context(docs, self.token_budget)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = await self.retriever.ainvoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        return pack_context(docs, self.token_budget)
+
+
+def build_packing_retriever(chat_args):
+    from app.chat.vector_stores.pinecone import get_vector_store
+    from app.chat.retrievers.rerank import candidate_count, maybe_rerank
+
+    search_kwargs = {
+        "filter": {"pdf_id": chat_args.pdf_id},
+        "k": candidate_count(CONTEXT_CANDIDATES),
+    }
+    return ContextPackingRetriever(
+        retriever=maybe_rerank(get_vector_store().as_retriever(search_kwargs=search_kwargs))
+    )
@@ -0,0 +1,241 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.chat import metrics
+from app.chat.embeddings.cache import cache_key
+from app.chat.retrievers.hybrid import chunk_id
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.retrievers.rerank")
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Fetch this many candidates, send the best RERANK_TOP_N to the prompt
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "4"))
+# Wall-clock budget for scoring; past it the retrieval order is used instead
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "2"))
+
+_lock = threading.Lock()
+_model = None
+_pool = None
+_pool_pid = None
+# One per pool worker. A batch is only submitted when it can start right
+# away: forward passes that overran their budget keep running, and queueing
+# behind them would only make later requests time out too.
+_slots = threading.BoundedSemaphore(RERANK_WORKERS)
+
+
+def get_cross_encoder():
+    """Loads the cross-encoder on first use, like the embedding model"""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+
+                _model = CrossEncoder(RERANK_MODEL, max_length=RERANK_MAX_LENGTH, device="cpu")
+    return _model
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool, _pool_pid, _slots
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=RERANK_WORKERS, thread_name_prefix="rerank")
+            _slots = threading.BoundedSemaphore(RERANK_WORKERS)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+class ScoreCache:
+    """Bounded LRU of cross-encoder scores keyed by (query hash, chunk id)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, query_key: str, chunk_ids: List[str]) -> List[Optional[float]]:
+        scores = []
+        with self._lock:
+            for chunk in chunk_ids:
+                score = self._scores.get((query_key, chunk))
+                if score is not None:
+                    self._scores.move_to_end((query_key, chunk))
+                scores.append(score)
+        return scores
+
+    def set_many(self, query_key: str, chunk_ids: List[str], scores: List[float]) -> None:
+        with self._lock:
+            for chunk, score in zip(chunk_ids, scores):
+                self._scores[(query_key, chunk)] = score
+                self._scores.move_to_end((query_key, chunk))
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+    def __len__(self):
+        return len(self._scores)
+
+
+_cache = ScoreCache(RERANK_CACHE_SIZE)
+# Rolling cost of scoring one pair, used to keep a batch inside the budget
+_pair_ms = None
+
+
+def _score(slots, query_key: str, query: str, chunk_ids: List[str], texts: List[str]):
+    """Runs on the rerank pool: one batched forward pass over every pair"""
+    global _pair_ms
+    try:
+        # Loaded before the clock starts, so a cold load doesn't skew _pair_ms
+        model = get_cross_encoder()
+        started = time.perf_counter()
+        scores = model.predict(
+            [(query, text) for text in texts], batch_size=len(texts), show_progress_bar=False
+        )
+        scores = [float(score) for score in scores]
+        elapsed = (time.perf_counter() - started) * 1000
+        per_pair = elapsed / len(texts)
+        _pair_ms = per_pair if _pair_ms is None else 0.8 * _pair_ms + 0.2 * per_pair
+        metrics.observe("rerank.forward_ms", elapsed)
+        _cache.set_many(query_key, chunk_ids, scores)
+        return scores
+    finally:
+        slots.release()
+
+
+def rerank(
+    query: str,
+    docs: List[Document],
+    top_n: int = RERANK_TOP_N,
+    budget_ms: float = RERANK_BUDGET_MS,
+) -> List[Document]:
+    """
+    Returns the top_n of docs by cross-encoder score, most relevant first.
+
+    Cached (query, chunk) scores are reused. The rest are scored in one
+    batch, cut to the number of pairs the rolling per-pair cost says fit in
+    budget_ms, best-retrieved first. If scoring still overruns the budget,
+    the request goes on with whatever is cached plus retrieval order; the
+    batch finishes in the background and fills the cache for next time.
+    While every worker is busy with such batches nothing new is scored.
+    """
+    if len(docs) <= 1:
+        return docs[:top_n]
+
+    started = time.perf_counter()
+    query_key = cache_key(query, RERANK_MODEL)
+    ids = [chunk_id(doc) for doc in docs]
+    scores = _cache.get_many(query_key, ids)
+    missing = [i for i, score in enumerate(scores) if score is None]
+    metrics.incr("rerank.cache_hits", len(docs) - len(missing))
+    metrics.incr("rerank.cache_misses", len(missing))
+
+    if missing:
+        if _pair_ms:
+            affordable = max(top_n, int(budget_ms / _pair_ms))
+            if affordable < len(missing):
+                metrics.incr("rerank.truncated")
+                missing = missing[:affordable]
+        pool = _get_pool()
+        slots = _slots
+        if not slots.acquire(blocking=False):
+            metrics.incr("rerank.busy")
+            logger.debug("Rerank workers busy, using retrieval order")
+            missing = []
+    if missing:
+        try:
+            future = pool.submit(
+                _score,
+                slots,
+                query_key,
+                query,
+                [ids[i] for i in missing],
+                [docs[i].page_content for i in missing],
+            )
+        except Exception:
+            slots.release()
+            raise
+        try:
+            computed = future.result(timeout=budget_ms / 1000)
+            for i, score in zip(missing, computed):
+                scores[i] = score
+        except TimeoutError:
+            metrics.incr("rerank.timeouts")
+            logger.debug(f"Rerank over budget ({budget_ms} ms), using retrieval order")
+        except Exception as e:
+            metrics.incr("rerank.errors")
+            logger.warning(f"Rerank failed, using retrieval order: {e}")
+
+    # Scored candidates by score, then unscored ones in retrieval order
+    order = sorted(
+        range(len(docs)),
+        key=lambda i: (scores[i] is None, -(scores[i] or 0.0), i),
+    )
+    reranked = []
+    for i in order[:top_n]:
+        doc = docs[i]
+        metadata = dict(doc.metadata)
+        if scores[i] is not None:
+            metadata["rerank_score"] = round(scores[i], 4)
+        reranked.append(Document(id=doc.id, page_content=doc.page_content, metadata=metadata))
+
+    metrics.observe("rerank.ms", (time.perf_counter() - started) * 1000)
+    return reranked
+
+
+class RerankRetriever(BaseRetriever):
+    """
+    Over-fetches from the wrapped retriever and keeps the top_n candidates
+    by cross-encoder score, so the prompt gets few but well-chosen chunks.
+    """
+
+    retriever: BaseRetriever
+    top_n: int = RERANK_TOP_N
+    budget_ms: float = RERANK_BUDGET_MS
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return rerank(query, docs, self.top_n, self.budget_ms)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = await self.retriever.ainvoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        return await asyncio.to_thread(rerank, query, docs, self.top_n, self.budget_ms)
+
+
+def candidate_count(k: int) -> int:
+    """How many chunks a retriever should fetch: more when reranking follows"""
+    return max(k, RERANK_CANDIDATES) if RERANK_ENABLED else k
+
+
+def maybe_rerank(retriever: BaseRetriever) -> BaseRetriever:
+    return RerankRetriever(retriever=retriever) if RERANK_ENABLED else retriever
+
+
+def get_rerank_stats():
+    return {
+        "enabled": RERANK_ENABLED,
+        "cache_size": len(_cache),
+        "pair_ms": round(_pair_ms, 3) if _pair_ms else None,
+    }
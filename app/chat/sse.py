@@ -0,0 +1,78 @@
+import os
+import time
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+SSE_FLUSH_MS = int(os.getenv("SSE_FLUSH_MS", "50"))
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "512"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop nginx from buffering the response, which would undo the flushing
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """Formats one Server-Sent Events frame; newlines become extra data lines"""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def coalesce(
+    tokens: Iterable[Optional[str]],
+    flush_ms: int = SSE_FLUSH_MS,
+    flush_bytes: int = SSE_FLUSH_BYTES,
+) -> Iterator[str]:
+    """
+    Joins tokens into SSE frames, emitting a frame once flush_bytes have been
+    buffered or flush_ms have passed since the last frame. The source may
+    yield None when nothing arrived for a while, so that a pending buffer is
+    still flushed on time while the LLM is slow.
+    """
+    buffer = []
+    size = 0
+    last_flush = time.perf_counter()
+
+    for token in tokens:
+        if token:
+            buffer.append(token)
+            size += len(token)
+        if not buffer:
+            continue
+        now = time.perf_counter()
+        if size >= flush_bytes or (now - last_flush) * 1000 >= flush_ms:
+            yield sse_event("".join(buffer))
+            buffer.clear()
+            size = 0
+            last_flush = now
+
+    if buffer:
+        yield sse_event("".join(buffer))
+
+
+async def acoalesce(
+    tokens: AsyncIterable[Optional[str]],
+    flush_ms: int = SSE_FLUSH_MS,
+    flush_bytes: int = SSE_FLUSH_BYTES,
+) -> AsyncIterator[str]:
+    """Async version of coalesce"""
+    buffer = []
+    size = 0
+    last_flush = time.perf_counter()
+
+    async for token in tokens:
+        if token:
+            buffer.append(token)
+            size += len(token)
+        if not buffer:
+            continue
+        now = time.perf_counter()
+        if size >= flush_bytes or (now - last_flush) * 1000 >= flush_ms:
+            yield sse_event("".join(buffer))
+            buffer.clear()
+            size = 0
+            last_flush = now
+
+    if buffer:
+        yield sse_event("".join(buffer))
@@ -0,0 +1,49 @@
+import os
+import threading
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.tokens")
+
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+_lock = threading.Lock()
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception as e:
+                    # tiktoken downloads its BPE files on first use, which
+                    # fails on machines without internet access
+                    logger.warning(f"tiktoken unavailable, estimating tokens: {e}")
+                    _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text, or an estimate of ~4 chars per token"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The last max_tokens tokens of text, or all of it if it fits"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text if len(text) <= max_tokens * 4 else text[-max_tokens * 4 :]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[-max_tokens:])
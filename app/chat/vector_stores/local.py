@@ -0,0 +1,527 @@
+import os
+import re
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.vector_stores.local")
+
+LOCAL_INDEX_DIR = os.getenv(
+    "LOCAL_INDEX_DIR", os.path.join("instance", "vector_index")
+)
+LOCAL_INDEX_CACHE_BYTES = int(
+    os.getenv("LOCAL_INDEX_CACHE_BYTES", str(256 * 1024 * 1024))
+)
+# Partitions smaller than this are searched exactly over the memory-mapped
+# vectors; an HNSW graph only pays off once a PDF has a few hundred chunks.
+HNSW_MIN_VECTORS = int(os.getenv("LOCAL_INDEX_HNSW_MIN_VECTORS", "256"))
+HNSW_M = int(os.getenv("LOCAL_INDEX_HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("LOCAL_INDEX_HNSW_EF_SEARCH", "64"))
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+# Suffixes of a partition being rewritten and of the one it replaces
+_STAGING = ".tmp-"
+_RETIRED = ".old-"
+
+
+def _partition_name(pdf_id: str) -> str:
+    name = str(pdf_id)
+    if _UNSAFE_CHARS.search(name) or name in ("", ".", ".."):
+        return hashlib.sha256(name.encode("utf-8")).hexdigest()
+    return name
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _pdf_id_from_filter(filter: Optional[dict]) -> Optional[str]:
+    if not filter or "pdf_id" not in filter:
+        return None
+    value = filter["pdf_id"]
+    if isinstance(value, dict):
+        return value.get("$eq")
+    return value
+
+
+class _Partition:
+    """
+    The on-disk index of a single PDF.
+
+    Files in the partition directory:
+        vectors.f32  - normalized float32 vectors, appended and memory-mapped
+        docs.jsonl   - one {"id", "text", "metadata"} record per vector
+        offsets.i64  - byte offset of each record in docs.jsonl
+        hnsw.faiss   - HNSW graph over the vectors (large partitions only),
+                       written by persist() rather than on every add, and
+                       rebuilt on load if it doesn't cover every vector
+        meta.json    - {"count", "dim"}; written last, so it marks a commit
+
+    Records are upserted by id: adding an id that is already stored drops
+    the old record first. Dropping records rewrites the partition without
+    them, which is fine for the retries and resumes that cause it.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.count = 0
+        self.dim = None
+        self.mtime = None
+        self.vectors = None
+        self.offsets = None
+        self.index = None
+        # Whether self.index has vectors hnsw.faiss doesn't
+        self.dirty = False
+        self._ids = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path("meta.json"))
+
+    def is_stale(self) -> bool:
+        try:
+            return os.stat(self._path("meta.json")).st_mtime_ns != self.mtime
+        except FileNotFoundError:
+            return self.mtime is not None
+
+    def load(self) -> "_Partition":
+        with self.lock:
+            self.index = None
+            self.dirty = False
+            self._ids = None
+            self._map()
+            if self.count >= HNSW_MIN_VECTORS:
+                if os.path.exists(self._path("hnsw.faiss")):
+                    self.index = faiss.read_index(self._path("hnsw.faiss"))
+                if self.index is None or self.index.ntotal != self.count:
+                    self._build_index()
+            return self
+
+    def _map(self):
+        """Read the committed record count and memory-map vectors and offsets"""
+        if not self.exists():
+            self.count, self.dim, self.mtime = 0, None, None
+            self.vectors = self.offsets = None
+            return
+
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        self.mtime = os.stat(self._path("meta.json")).st_mtime_ns
+        self.count, self.dim = meta["count"], meta["dim"]
+
+        self.vectors = np.memmap(
+            self._path("vectors.f32"),
+            dtype=np.float32,
+            mode="r",
+            shape=(self.count, self.dim),
+        )
+        self.offsets = np.memmap(
+            self._path("offsets.i64"), dtype=np.int64, mode="r", shape=(self.count,)
+        )
+
+    def _build_index(self):
+        index = faiss.IndexHNSWFlat(self.dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        for start in range(0, self.count, 10000):
+            index.add(np.ascontiguousarray(self.vectors[start : start + 10000]))
+        self._write_index(index)
+        self.index = index
+
+    def _write_index(self, index):
+        # Unique, since another process may be rebuilding the same graph
+        tmp_path = self._path(f"hnsw.faiss.tmp-{uuid.uuid4().hex}")
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self._path("hnsw.faiss"))
+
+    def persist(self) -> None:
+        """Writes the HNSW graph if vectors were added since it was last written"""
+        with self.lock:
+            if self.dirty and self.index is not None and not self.is_stale():
+                self._write_index(self.index)
+            self.dirty = False
+
+    def positions(self) -> dict:
+        """Position of every stored record by id, read once per load"""
+        with self.lock:
+            if self._ids is None:
+                self._ids = {}
+                if self.count:
+                    with open(self._path("docs.jsonl"), "rb") as f:
+                        f.seek(int(self.offsets[0]))
+                        for position in range(self.count):
+                            self._ids[json.loads(f.readline())["id"]] = position
+            return self._ids
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """Drops the records with these ids; returns how many there were"""
+        with self.lock:
+            if self.is_stale():
+                self.load()
+            positions = self.positions()
+            drop = {positions[id] for id in ids if id in positions}
+            if not drop:
+                return 0
+            keep = [position for position in range(self.count) if position not in drop]
+            self._rewrite(keep)
+            return len(drop)
+
+    def _rewrite(self, keep: List[int]) -> None:
+        """
+        Replaces the partition with one holding only the records at keep,
+        swapped in as a new directory like a commit. The HNSW graph is left
+        out and rebuilt when next needed.
+        """
+        if not keep:
+            shutil.rmtree(self.directory)
+            self.load()
+            return
+
+        staging = f"{self.directory}{_STAGING}{uuid.uuid4().hex}"
+        os.makedirs(staging)
+        offsets = []
+        position = 0
+        with open(os.path.join(staging, "vectors.f32"), "wb") as vectors, open(
+            os.path.join(staging, "docs.jsonl"), "wb"
+        ) as docs, open(self._path("docs.jsonl"), "rb") as source:
+            for start in range(0, len(keep), 10000):
+                block = keep[start : start + 10000]
+                vectors.write(np.ascontiguousarray(self.vectors[block]).tobytes())
+                for old in block:
+                    source.seek(int(self.offsets[old]))
+                    line = source.readline()
+                    offsets.append(position)
+                    docs.write(line)
+                    position += len(line)
+        np.asarray(offsets, dtype=np.int64).tofile(os.path.join(staging, "offsets.i64"))
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"count": len(keep), "dim": self.dim}, f)
+
+        retired = f"{self.directory}{_RETIRED}{uuid.uuid4().hex}"
+        os.rename(self.directory, retired)
+        os.rename(staging, self.directory)
+        shutil.rmtree(retired, ignore_errors=True)
+        self.load()
+
+    def add(self, vectors: np.ndarray, records: List[dict]) -> None:
+        with self.lock:
+            if self.is_stale():
+                self.load()
+
+            vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+            dim = vectors.shape[1]
+            if self.dim is not None and dim != self.dim:
+                raise ValueError(
+                    f"Vector dimension {dim} does not match index dimension {self.dim}"
+                )
+
+            # Upsert: the last record of an id in the batch wins, and one
+            # already stored is dropped first (a retried or resumed batch)
+            latest = {record["id"]: i for i, record in enumerate(records)}
+            if len(latest) < len(records):
+                batch = sorted(latest.values())
+                vectors = vectors[batch]
+                records = [records[i] for i in batch]
+            if self.count:
+                self.remove(latest)
+            # Created after the removal: removing every stored id deletes it
+            os.makedirs(self.directory, exist_ok=True)
+
+            # Truncate anything past the last committed record (crashed writer)
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.truncate(self.count * dim * 4)
+                f.write(vectors.tobytes())
+
+            offsets = []
+            position = self._docs_end() if self.count else 0
+            with open(self._path("docs.jsonl"), "ab") as f:
+                f.truncate(position)
+                for record in records:
+                    line = (json.dumps(record) + "\n").encode("utf-8")
+                    offsets.append(position)
+                    f.write(line)
+                    position += len(line)
+
+            with open(self._path("offsets.i64"), "ab") as f:
+                f.truncate(self.count * 8)
+                f.write(np.asarray(offsets, dtype=np.int64).tobytes())
+
+            new_count = self.count + len(records)
+            if new_count >= HNSW_MIN_VECTORS:
+                if self.index is None:
+                    self.index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+                    if self.count:
+                        self.index.add(np.ascontiguousarray(self.vectors))
+                self.index.add(vectors)
+                self.dirty = True
+
+            tmp_meta = self._path("meta.json.tmp")
+            with open(tmp_meta, "w") as f:
+                json.dump({"count": new_count, "dim": dim}, f)
+            os.replace(tmp_meta, self._path("meta.json"))
+            ids = self.positions()
+            for position, record in enumerate(records, start=self.count):
+                ids[record["id"]] = position
+            self._map()
+
+    def _docs_end(self) -> int:
+        """Byte position just past the last committed docs.jsonl record"""
+        last_offset = int(self.offsets[self.count - 1])
+        with open(self._path("docs.jsonl"), "rb") as f:
+            f.seek(last_offset)
+            return last_offset + len(f.readline())
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if not self.count:
+            return []
+        k = min(k, self.count)
+        query = _normalize(np.asarray([vector], dtype=np.float32))
+
+        if self.index is not None:
+            self.index.hnsw.efSearch = max(HNSW_EF_SEARCH, k)
+            scores, positions = self.index.search(query, k)
+            return [
+                (int(position), float(score))
+                for position, score in zip(positions[0], scores[0])
+                if position >= 0
+            ]
+
+        scores = np.asarray(self.vectors @ query[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(position), float(scores[position])) for position in top]
+
+    def records(self, positions: List[int]) -> List[dict]:
+        if not positions:
+            return []
+        records = []
+        with open(self._path("docs.jsonl"), "rb") as f:
+            for position in positions:
+                f.seek(int(self.offsets[position]))
+                records.append(json.loads(f.readline()))
+        return records
+
+    @property
+    def nbytes(self) -> int:
+        if not self.count:
+            return 0
+        # Flat HNSW storage plus ~2*M neighbour links per vector
+        index_bytes = self.count * (self.dim * 4 + HNSW_M * 2 * 4) if self.index else 0
+        return self.count * 8 + index_bytes
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Persistent vector store with one on-disk index per pdf_id.
+
+    Vectors live in memory-mapped files, so only the HNSW graphs of recently
+    used PDFs take up process memory; those are kept in an LRU bounded by
+    max_bytes and loaded lazily on first use. Adding chunks is incremental and
+    deleting a PDF removes its directory, independent of the size of the rest
+    of the store. A {"pdf_id": ...} filter selects a single partition instead
+    of post-filtering over every stored vector.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        directory: str = LOCAL_INDEX_DIR,
+        max_bytes: int = LOCAL_INDEX_CACHE_BYTES,
+    ):
+        self._embedding = embedding
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._partitions = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _partition(self, pdf_id: str) -> _Partition:
+        name = _partition_name(pdf_id)
+        with self._lock:
+            partition = self._partitions.get(name)
+            if partition is not None:
+                self._partitions.move_to_end(name)
+        if partition is None:
+            partition = _Partition(os.path.join(self.directory, name)).load()
+            with self._lock:
+                partition = self._partitions.setdefault(name, partition)
+                self._partitions.move_to_end(name)
+                self._evict()
+        elif partition.is_stale():
+            partition.load()
+        return partition
+
+    def _evict(self):
+        total = sum(p.nbytes for p in self._partitions.values())
+        while total > self.max_bytes and len(self._partitions) > 1:
+            name, partition = self._partitions.popitem(last=False)
+            partition.persist()
+            total -= partition.nbytes
+            logger.debug(f"Evicted local index partition {name} from memory")
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_embeddings(list(zip(texts, vectors)), metadatas, ids)
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        text_embeddings = list(text_embeddings)
+        metadatas = metadatas or [{} for _ in text_embeddings]
+        ids = ids or [str(uuid.uuid4()) for _ in text_embeddings]
+
+        groups = {}
+        for (text, vector), metadata, id in zip(text_embeddings, metadatas, ids):
+            metadata = {k: v for k, v in metadata.items() if k != "text"}
+            group = groups.setdefault(str(metadata.get("pdf_id", "")), ([], []))
+            group[0].append(vector)
+            group[1].append({"id": id, "text": text, "metadata": metadata})
+
+        for pdf_id, (vectors, records) in groups.items():
+            self._partition(pdf_id).add(np.asarray(vectors, dtype=np.float32), records)
+
+        return ids
+
+    def _partitions_for(self, filter: Optional[dict]) -> List[_Partition]:
+        pdf_id = _pdf_id_from_filter(filter)
+        if pdf_id is not None:
+            return [self._partition(pdf_id)]
+        if not os.path.isdir(self.directory):
+            return []
+        return [
+            self._partition(name)
+            for name in sorted(os.listdir(self.directory))
+            if _STAGING not in name and _RETIRED not in name
+        ]
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        extra_filter = {key: v for key, v in (filter or {}).items() if key != "pdf_id"}
+        # Over-fetch when non-partition filters are applied after the search
+        fetch_k = k * 4 if extra_filter else k
+
+        results = []
+        for partition in self._partitions_for(filter):
+            matches = partition.search(embedding, fetch_k)
+            records = partition.records([position for position, _ in matches])
+            for record, (_, score) in zip(records, matches):
+                metadata = record["metadata"]
+                if any(metadata.get(key) != v for key, v in extra_filter.items()):
+                    continue
+                document = Document(
+                    id=record["id"], page_content=record["text"], metadata=metadata
+                )
+                results.append((document, score))
+
+        results.sort(key=lambda result: result[1], reverse=True)
+        return results[:k]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k, filter)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        results = self.similarity_search_by_vector_with_score(embedding, k, filter)
+        return [document for document, _ in results]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        results = self.similarity_search_with_score(query, k, filter)
+        return [document for document, _ in results]
+
+    def _select_relevance_score_fn(self):
+        # Vectors are normalized, so scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def delete_pdf(self, pdf_id: str) -> bool:
+        """Drop every vector of a PDF by removing its partition"""
+        name = _partition_name(pdf_id)
+        with self._lock:
+            self._partitions.pop(name, None)
+        directory = os.path.join(self.directory, name)
+        if not os.path.isdir(directory):
+            return False
+        shutil.rmtree(directory)
+        return True
+
+    def persist(self, pdf_id: Optional[str] = None) -> None:
+        """
+        Writes the HNSW graphs that vectors were added to since they were
+        last written: the PDF's, or every loaded one. Ingestion calls this
+        once at the end, so adding a batch doesn't rewrite the whole graph.
+        """
+        if pdf_id is not None:
+            self._partition(pdf_id).persist()
+            return
+        with self._lock:
+            partitions = list(self._partitions.values())
+        for partition in partitions:
+            partition.persist()
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Deletes records by id, within one PDF if a pdf_id (or filter) is
+        given and otherwise wherever they are; without ids, the whole PDF.
+        """
+        pdf_id = kwargs.get("pdf_id") or _pdf_id_from_filter(kwargs.get("filter"))
+        if not ids:
+            if pdf_id is None:
+                raise ValueError("Pass ids, a pdf_id or a pdf_id filter to delete")
+            return self.delete_pdf(pdf_id)
+        ids = set(ids)
+        filter = {"pdf_id": pdf_id} if pdf_id is not None else None
+        removed = sum(partition.remove(ids) for partition in self._partitions_for(filter))
+        return removed > 0
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        ids = kwargs.pop("ids", None)
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
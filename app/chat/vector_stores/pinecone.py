@@ -1,7 +1,8 @@
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
+import threading
+import time
 import os
-from app.chat.embeddings.openai import embeddings
+from typing import Iterator, List, Optional
+from app.chat.embeddings.openai import get_embeddings
 from app.logging import get_module_logger
 from dotenv import load_dotenv
 
@@ -16,41 +17,129 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENV_NAME", "us-east-1")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "docs")
 
+# Optional: the index host, which skips the control-plane lookup entirely
+PINECONE_HOST = os.getenv("PINECONE_HOST")
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "4"))
+PINECONE_CONNECTION_POOL_MAXSIZE = int(
+    os.getenv("PINECONE_CONNECTION_POOL_MAXSIZE", "16")
+)
+PINECONE_INDEX_METADATA_TTL = int(os.getenv("PINECONE_INDEX_METADATA_TTL", "300"))
+
+# "pinecone" (default) or "local" for air-gapped and test deployments
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+
+_client_lock = threading.RLock()
+_client = None
+_index = None
+_index_metadata = None
+_index_metadata_at = 0.0
+
+
+def _reset_client():
+    # Connection pools must not be shared with a forked child (Celery
+    # prefork, gunicorn), so every process builds its own on first use
+    global _client, _index, _index_metadata, _index_metadata_at, _vector_store
+    _client = None
+    _vector_store = None
+    _index = None
+    _index_metadata = None
+    _index_metadata_at = 0.0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_client)
+
+
+def get_pinecone_client():
+    """Returns the process-wide Pinecone client"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from pinecone import Pinecone
+
+            if not PINECONE_API_KEY:
+                raise ValueError("PINECONE_API_KEY environment variable not set")
+            _client = Pinecone(
+                api_key=PINECONE_API_KEY, pool_threads=PINECONE_POOL_THREADS
+            )
+        return _client
+
+
+def describe_index() -> Optional[dict]:
+    """
+    Returns {"name", "dimension", "host"} of the configured index, or None if
+    it doesn't exist. Cached for PINECONE_INDEX_METADATA_TTL seconds so that
+    data-plane calls don't each pay for a control-plane round trip.
+    """
+    global _index_metadata, _index_metadata_at
+    with _client_lock:
+        if time.monotonic() - _index_metadata_at < PINECONE_INDEX_METADATA_TTL:
+            return _index_metadata
+
+        from pinecone.exceptions import NotFoundException
+
+        try:
+            description = get_pinecone_client().describe_index(PINECONE_INDEX_NAME)
+            _index_metadata = {
+                "name": PINECONE_INDEX_NAME,
+                "dimension": description.dimension,
+                "host": description.host,
+            }
+        except NotFoundException:
+            _index_metadata = None
+        _index_metadata_at = time.monotonic()
+        return _index_metadata
+
+
+def get_index():
+    """
+    Returns the process-wide Index handle, whose keep-alive connection pool
+    (PINECONE_CONNECTION_POOL_MAXSIZE) is shared by every operation.
+    Returns None if the index doesn't exist.
+    """
+    global _index
+    with _client_lock:
+        if _index is None:
+            host = PINECONE_HOST
+            if not host:
+                metadata = describe_index()
+                if metadata is None:
+                    return None
+                host = metadata["host"]
+            _index = get_pinecone_client().Index(
+                host=host,
+                pool_threads=PINECONE_POOL_THREADS,
+                connection_pool_maxsize=PINECONE_CONNECTION_POOL_MAXSIZE,
+            )
+        return _index
+
 
 def create_fallback_vector_store():
-    """Create a simple in-memory vector store as fallback"""
-    from langchain.vectorstores import FAISS
-    from langchain.schema import Document
+    """Create the persistent local vector store, partitioned per PDF"""
+    from app.chat.vector_stores.local import LocalVectorStore
 
-    # Create a dummy document for initialization
-    docs = [Document(page_content="Fallback store initialized", metadata={})]
-    return FAISS.from_documents(docs, embeddings)
+    logger.info("Using local vector store")
+    return LocalVectorStore(get_embeddings())
 
 
 def initialize_pinecone():
     """Initialize Pinecone client and return the vector store"""
+    if VECTOR_STORE_BACKEND == "local":
+        return create_fallback_vector_store()
+
     try:
-        if not PINECONE_API_KEY:
-            raise ValueError("PINECONE_API_KEY environment variable not set")
+        from langchain_pinecone import PineconeVectorStore
 
         logger.info(f"Initializing Pinecone with environment: {PINECONE_ENVIRONMENT}")
-        pc = Pinecone(api_key=PINECONE_API_KEY)
 
-        # List existing indexes
-        indexes = pc.list_indexes()
-        index_names = [index_info["name"] for index_info in indexes]
-        logger.info(f"Available Pinecone indexes: {index_names}")
-
-        # Check if index exists
-        if PINECONE_INDEX_NAME not in index_names:
+        # Get the index
+        index = get_index()
+        if index is None:
             logger.error(f"Pinecone index '{PINECONE_INDEX_NAME}' does not exist")
             return create_fallback_vector_store()
 
-        # Get the index
-        index = pc.Index(PINECONE_INDEX_NAME)
-
         # Initialize the vector store
-        vector_store = PineconeVectorStore(index=index, embedding=embeddings)
+        vector_store = PineconeVectorStore(index=index, embedding=get_embeddings())
 
         logger.info("Successfully connected to Pinecone index")
         return vector_store
@@ -60,87 +149,88 @@ def initialize_pinecone():
         return create_fallback_vector_store()
 
 
-def delete_embeddings_for_pdf(pdf_id: str):
-    """Delete all embeddings associated with a specific PDF ID"""
+DELETE_BATCH_SIZE = 1000
+
+
+class VectorStoreUnavailable(Exception):
+    """Pinecone is configured but this process fell back to the local store"""
+
+
+def vector_id(pdf_id: str, page: int, chunk_no: int) -> str:
+    """Deterministic ID of the chunk_no-th chunk of a page of a PDF"""
+    return f"{pdf_id}:{page}:{chunk_no}"
+
+
+def vector_ids(pdf_id: str, chunk_counts: List[int]) -> Iterator[str]:
+    """All vector IDs of a PDF, given its number of chunks on each page"""
+    for page, count in enumerate(chunk_counts):
+        for chunk_no in range(count):
+            yield vector_id(pdf_id, page, chunk_no)
+
+
+def delete_embeddings_for_pdf(
+    pdf_id: str, chunk_counts: Optional[List[int]] = None, raise_errors: bool = False
+):
+    """
+    Delete all embeddings associated with a specific PDF ID
+
+    :param pdf_id: The id of the PDF
+    :param chunk_counts: The number of chunks ingested per page, as recorded
+        on the Pdf at ingestion time. When given, vectors are deleted by their
+        deterministic IDs; otherwise by a pdf_id metadata filter, which only
+        works for vectors ingested before IDs were deterministic.
+    :param raise_errors: Re-raise Pinecone errors instead of logging them and
+        returning False, so that a task can retry. This includes Pinecone
+        being configured but unreachable, when only the local fallback
+        store could be cleaned.
+    """
+    global _vector_store
+    vector_store = get_vector_store()
+    if _is_local(vector_store):
+        logger.info(f"Deleting local index partition for PDF ID: {pdf_id}")
+        deleted = vector_store.delete_pdf(pdf_id)
+        if raise_errors and VECTOR_STORE_BACKEND != "local":
+            # The PDF's vectors are in Pinecone, which couldn't be reached.
+            # Drop the fallback so the retry connects again.
+            with _lock:
+                _vector_store = None
+            raise VectorStoreUnavailable(
+                f"Pinecone unavailable, vectors of PDF {pdf_id} not deleted"
+            )
+        return deleted
+
     try:
         if not PINECONE_API_KEY:
             logger.warning("PINECONE_API_KEY not set, skipping Pinecone cleanup")
             return False
 
         logger.info(f"Starting Pinecone cleanup for PDF ID: {pdf_id}")
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-
-        # Check if index exists
-        indexes = pc.list_indexes()
-        index_names = [index_info["name"] for index_info in indexes]
-        logger.info(f"Available indexes: {index_names}")
 
-        if PINECONE_INDEX_NAME not in index_names:
+        index = get_index()
+        if index is None:
             logger.warning(
                 f"Pinecone index '{PINECONE_INDEX_NAME}' does not exist, skipping cleanup"
             )
             return False
 
-        index = pc.Index(PINECONE_INDEX_NAME)
-
-        # Check index stats before deletion
-        stats_before = index.describe_index_stats()
-        logger.info(f"Index stats before deletion: {stats_before}")
-
-        # Try multiple deletion approaches since metadata filtering can be tricky
-
-        # Approach 1: Direct metadata filter (what we tried before)
-        try:
-            delete_response = index.delete(filter={"pdf_id": pdf_id})
-            logger.info(f"Delete response with simple filter: {delete_response}")
-        except Exception as e:
-            logger.warning(f"Simple filter deletion failed: {e}")
-
-        # Approach 2: Try with explicit equality operator
-        try:
-            delete_response = index.delete(filter={"pdf_id": {"$eq": pdf_id}})
-            logger.info(f"Delete response with $eq filter: {delete_response}")
-        except Exception as e:
-            logger.warning(f"$eq filter deletion failed: {e}")
-
-        # Approach 3: Delete all vectors and recreate (if needed)
-        # This is more aggressive but ensures cleanup
-        try:
-            # First query to get vector IDs with this pdf_id
-            query_response = index.query(
-                vector=[0.01] * 1536,  # Small non-zero vector
-                filter={"pdf_id": pdf_id},
-                top_k=10000,  # Large number to get all matches
-                include_metadata=True,
-            )
-
-            if query_response.matches:
-                vector_ids = [match.id for match in query_response.matches]
-                logger.info(
-                    f"Found {len(vector_ids)} vectors to delete for pdf_id={pdf_id}"
-                )
-
-                # Log sample metadata for debugging
-                for i, match in enumerate(query_response.matches[:3]):
-                    logger.info(
-                        f"Sample vector {i}: ID={match.id}, metadata={match.metadata}"
-                    )
-
-                # Delete by IDs
-                if vector_ids:
-                    delete_response = index.delete(ids=vector_ids)
-                    logger.info(f"Delete by IDs response: {delete_response}")
-            else:
-                logger.warning(f"No vectors found with pdf_id={pdf_id} during query")
-
-        except Exception as e:
-            logger.error(f"Query and delete by IDs failed: {e}")
-
-        # Check stats after deletion
-        stats_after = index.describe_index_stats()
-        logger.info(f"Index stats after deletion: {stats_after}")
-
-        logger.info(f"Completed Pinecone cleanup attempt for PDF {pdf_id}")
+        if chunk_counts is None:
+            index.delete(filter={"pdf_id": {"$eq": pdf_id}})
+            logger.info(f"Deleted vectors for PDF {pdf_id} by metadata filter")
+            return True
+
+        deleted = 0
+        batch = []
+        for id in vector_ids(pdf_id, chunk_counts):
+            batch.append(id)
+            if len(batch) == DELETE_BATCH_SIZE:
+                index.delete(ids=batch)
+                deleted += len(batch)
+                batch = []
+        if batch:
+            index.delete(ids=batch)
+            deleted += len(batch)
+
+        logger.info(f"Deleted {deleted} vectors for PDF {pdf_id} by ID")
         return True
 
     except Exception as e:
@@ -148,13 +238,79 @@ def delete_embeddings_for_pdf(pdf_id: str):
             f"Error deleting embeddings for PDF {pdf_id} from Pinecone: {str(e)}",
             exc_info=True,
         )
+        if raise_errors:
+            raise
         return False
 
 
-# Initialize the vector store
-vector_store = initialize_pinecone()
+_lock = threading.Lock()
+_vector_store = None
+
+
+def get_vector_store():
+    """
+    Returns the process-wide vector store, connecting on first use instead of
+    at import time so that CLI commands and offline processes start quickly.
+    """
+    global _vector_store
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                _vector_store = initialize_pinecone()
+    return _vector_store
+
+
+def _is_local(vector_store) -> bool:
+    from app.chat.vector_stores.local import LocalVectorStore
+
+    return isinstance(vector_store, LocalVectorStore)
+
+
+def add_embeddings(texts, vectors, metadatas, ids):
+    """Upsert already-computed embeddings into the active vector store"""
+    vector_store = get_vector_store()
+    if _is_local(vector_store):
+        vector_store.add_embeddings(
+            list(zip(texts, vectors)), metadatas=metadatas, ids=ids
+        )
+    else:
+        # Pinecone returns the chunk text from its metadata, so it is added
+        # only here, for the records actually being sent
+        records = [
+            (id, vector, {**metadata, "text": text})
+            for id, vector, metadata, text in zip(ids, vectors, metadatas, texts)
+        ]
+        vector_store.index.upsert(vectors=records)
+
+
+def persist_embeddings(pdf_id: str):
+    """
+    Makes a PDF's upserted embeddings durable in full. Pinecone already is;
+    the local store writes the HNSW graph it has been extending in memory.
+    """
+    vector_store = get_vector_store()
+    if _is_local(vector_store):
+        vector_store.persist(pdf_id)
 
 
 def build_retriever(chat_args):
     search_kwargs = {"filter": {"pdf_id": chat_args.pdf_id}}
-    return vector_store.as_retriever(search_kwargs=search_kwargs)
+    return get_vector_store().as_retriever(search_kwargs=search_kwargs)
+
+
+async def open_async_vector_store():
+    """
+    Keeps the vector store's async Pinecone session open for the running
+    event loop, so async searches reuse one aiohttp connection pool instead
+    of opening a session per query. The local store searches in a thread.
+    """
+    import asyncio
+
+    vector_store = await asyncio.to_thread(get_vector_store)
+    if not _is_local(vector_store):
+        await vector_store.__aenter__()
+
+
+async def close_async_vector_store():
+    if _vector_store is not None and not _is_local(_vector_store):
+        await _vector_store.aclose()
@@ -0,0 +1,70 @@
+import time
+import threading
+
+from app.chat.embeddings.openai import get_embedding_model, get_embeddings
+from app.chat.retrievers.rerank import RERANK_ENABLED, get_cross_encoder
+from app.chat.vector_stores.pinecone import get_vector_store
+from app.logging import get_module_logger
+
+logger = get_module_logger("chat.warmup")
+
+_lock = threading.Lock()
+_started = False
+_ready = threading.Event()
+_state = {"error": None, "steps": {}}
+
+
+def warm_up():
+    """
+    Loads the embedding model, runs a dummy encode and opens the vector store,
+    so the first chat request doesn't pay for any of it.
+
+    Safe to call more than once; only the first call does the work, unless
+    it failed, in which case the next call tries again.
+    """
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    steps = [
+        ("load_model", get_embedding_model),
+        # Straight through the model: the caches would answer a repeat encode
+        ("dummy_encode", lambda: get_embedding_model().embed_query("warm up")),
+        ("build_embeddings", get_embeddings),
+        ("open_vector_store", get_vector_store),
+    ]
+    if RERANK_ENABLED:
+        steps.append(("load_reranker", get_cross_encoder))
+        steps.append(
+            ("dummy_rerank", lambda: get_cross_encoder().predict([("warm up", "warm up")]))
+        )
+
+    try:
+        for name, step in steps:
+            started = time.perf_counter()
+            step()
+            _state["steps"][name] = round(time.perf_counter() - started, 3)
+        _ready.set()
+        logger.info(f"Warm-up complete: {_state['steps']}")
+    except Exception as e:
+        _state["error"] = str(e)
+        logger.error(f"Warm-up failed: {e}", exc_info=True)
+        with _lock:
+            _started = False
+
+
+def start_warm_up():
+    """Runs warm_up in a background thread"""
+    if not _started:
+        threading.Thread(target=warm_up, daemon=True).start()
+
+
+def readiness():
+    return {
+        "ready": _ready.is_set(),
+        "started": _started,
+        "error": _state["error"],
+        "steps": dict(_state["steps"]),
+    }
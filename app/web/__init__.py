@@ -12,6 +12,7 @@ from app.web.views import (
     score_views,
     client_views,
     conversation_views,
+    health_views,
 )
 from app.logging.flask_setup import init_app_logging
 
@@ -29,6 +30,10 @@ def create_app():
     register_blueprints(app)
     if Config.CELERY["broker_url"]:
         celery_init_app(app)
+    if Config.WARMUP_ON_START:
+        from app.chat.warmup import start_warm_up
+
+        start_warm_up()
 
     return app
 
@@ -43,6 +48,7 @@ def register_blueprints(app):
     app.register_blueprint(pdf_views.bp)
     app.register_blueprint(score_views.bp)
     app.register_blueprint(conversation_views.bp)
+    app.register_blueprint(health_views.bp)
     app.register_blueprint(client_views.bp)
 
 
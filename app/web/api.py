@@ -1,26 +1,127 @@
-from typing import Dict
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
 from langchain.schema.messages import AIMessage, HumanMessage, SystemMessage
 from app.web.db import db
 from app.web.db.models import Message
 from app.web.db.models.conversation import Conversation
+from app.chat.tokens import count_tokens, truncate_tokens
+
+# How much history the chain sees on each turn
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Rows fetched per round trip while walking back through the history
+HISTORY_FETCH_SIZE = 32
 
 
 def get_messages_by_conversation_id(
     conversation_id: str,
-) -> AIMessage | HumanMessage | SystemMessage:
+    limit: Optional[int] = None,
+    token_budget: Optional[int] = None,
+    after: Optional[datetime] = None,
+) -> List[AIMessage | HumanMessage | SystemMessage]:
     """
-    Finds all messages that belong to the given conversation_id
+    Finds the most recent messages that belong to the given conversation_id
+
+    Messages are read newest first, straight off the
+    (conversation_id, created_on) index, and reading stops once limit
+    messages have been read or the next message would push the total past
+    token_budget. The newest message is always returned, cut to its last
+    token_budget tokens if it alone is over, so a follow-up never looks
+    like the first turn. Only the role and content columns are loaded.
 
     :param conversation_id: The id of the conversation
+    :param limit: The maximum number of messages to return, or None for all
+    :param token_budget: The maximum number of tokens the returned messages
+        may add up to, or None for no budget
+    :param after: Only return messages created after this time, e.g. the
+        end of the conversation's summary
 
-    :return: A list of messages
+    :return: A list of messages in chronological order
     """
-    messages = (
-        db.session.query(Message)
+    query = (
+        db.session.query(Message.role, Message.content)
         .filter_by(conversation_id=conversation_id)
         .order_by(Message.created_on.desc())
     )
-    return [message.as_lc_message() for message in messages]
+    if after is not None:
+        query = query.filter(Message.created_on > after)
+    if limit is not None:
+        query = query.limit(limit)
+
+    rows = []
+    used = 0
+    for role, content in query.yield_per(HISTORY_FETCH_SIZE):
+        if token_budget is not None:
+            used += count_tokens(content)
+            if used > token_budget:
+                if not rows:
+                    rows.append((role, truncate_tokens(content, token_budget)))
+                break
+        rows.append((role, content))
+
+    rows.reverse()
+    return [Message.to_lc_message(role, content) for role, content in rows]
+
+
+def get_messages_to_summarize(
+    conversation_id: str, after: Optional[datetime], keep_recent: int, limit: int
+) -> List[Message]:
+    """
+    Finds the messages that a conversation's summary doesn't cover yet,
+    leaving out the newest keep_recent messages, which are sent verbatim
+
+    :param conversation_id: The id of the conversation
+    :param after: The end of the current summary, or None if there is none
+    :param keep_recent: The number of newest messages to leave out
+    :param limit: The maximum number of messages to return
+
+    :return: A list of messages in chronological order
+    """
+    query = db.session.query(Message).filter_by(conversation_id=conversation_id)
+    if after is not None:
+        query = query.filter(Message.created_on > after)
+
+    if keep_recent > 0:
+        oldest_recent = (
+            db.session.query(Message.created_on)
+            .filter_by(conversation_id=conversation_id)
+            .order_by(Message.created_on.desc())
+            .offset(keep_recent - 1)
+            .limit(1)
+            .scalar()
+        )
+        if oldest_recent is None:
+            return []
+        query = query.filter(Message.created_on < oldest_recent)
+
+    return query.order_by(Message.created_on).limit(limit).all()
+
+
+def update_conversation_summary(
+    conversation_id: str,
+    summary: str,
+    summarized_until: datetime,
+    previous_until: Optional[datetime],
+) -> bool:
+    """
+    Stores a new summary, unless another worker has already moved the
+    summary on from previous_until
+
+    :return: True if the summary was stored
+    """
+    current = (
+        Conversation.summarized_until.is_(None)
+        if previous_until is None
+        else Conversation.summarized_until == previous_until
+    )
+    result = db.session.execute(
+        db.update(Conversation)
+        .where(Conversation.id == conversation_id, current)
+        .values(summary=summary, summarized_until=summarized_until)
+    )
+    db.session.commit()
+    return result.rowcount == 1
 
 
 def add_message_to_conversation(
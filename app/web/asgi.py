@@ -0,0 +1,326 @@
+import os
+import re
+import json
+import asyncio
+from io import BytesIO
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import g, request
+from sqlalchemy.exc import NoResultFound
+
+from app.web import create_app
+from app.web.db.models import Conversation
+from app.web.hooks import is_tombstoned
+from app.chat import metrics, store_answer, stream_cached_answer
+from app.chat.chains.streamable import StreamFailed
+from app.chat.sse import acoalesce, coalesce, SSE_FLUSH_MS, SSE_HEADERS
+from app.chat.vector_stores.pinecone import (
+    open_async_vector_store,
+    close_async_vector_store,
+)
+from app.logging import get_module_logger
+
+logger = get_module_logger("web.asgi")
+
+# Streams are coroutines rather than threads here, so the cap is much higher
+# than STREAM_MAX_WORKERS; it only guards against unbounded memory growth
+ASYNC_STREAM_MAX_CONCURRENCY = int(os.getenv("ASYNC_STREAM_MAX_CONCURRENCY", "2000"))
+
+MESSAGES_PATH = re.compile(r"/api/conversations/(?P<conversation_id>[^/]+)/messages/?")
+
+
+def _wsgi_environ(scope, body: bytes) -> dict:
+    """Minimal WSGI environ for running Flask request hooks on an ASGI request"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": BytesIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+@dataclass
+class _Reply:
+    """A complete JSON response decided while preparing the request"""
+
+    status: int
+    body: Any
+
+
+@dataclass
+class _PreparedChat:
+    chat: Any
+    chat_history: List = field(default_factory=list)
+    cached_answer: Optional[str] = None
+    input: str = ""
+    conversation_id: str = ""
+    pdf_id: str = ""
+
+
+class ChatASGIApp:
+    """
+    ASGI entry point that serves the message endpoint natively on the event
+    loop and hands every other request to the Flask app.
+
+    Authentication, loading the conversation and building the chain reuse
+    the Flask code in a worker thread, but the chain itself runs through
+    ainvoke/astream with the async OpenAI and Pinecone clients, so a stream
+    costs a coroutine instead of a thread for its whole lifetime.
+
+    Run with: uvicorn --factory app.web.asgi:create_asgi_app
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.active_streams = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+
+        if scope["type"] == "http" and scope["method"] == "POST":
+            match = MESSAGES_PATH.fullmatch(scope["path"])
+            if match:
+                return await self._create_message(
+                    match["conversation_id"], scope, receive, send
+                )
+
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await open_async_vector_store()
+                except Exception as e:
+                    logger.warning(f"Could not open async vector store session: {e}")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_vector_store()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _prepare(self, environ, conversation_id, streaming):
+        """Runs in a worker thread, inside a Flask request context"""
+        from app.web.views.conversation_views import prepare_chat
+
+        with self.flask_app.request_context(environ):
+            self.flask_app.preprocess_request()
+            if g.user is None:
+                return _Reply(401, {"message": "Unauthorized"})
+
+            try:
+                conversation = Conversation.find_by(id=conversation_id)
+            except NoResultFound:
+                return _Reply(404, {"message": "Not found"})
+            if is_tombstoned(conversation):
+                return _Reply(404, {"message": "Not found"})
+            if conversation.user_id != g.user.id:
+                return _Reply(401, {"message": "You are not authorized to view this."})
+
+            input = request.json.get("input")
+            chat, chat_history, cached_answer = prepare_chat(
+                conversation, input, streaming
+            )
+            return _PreparedChat(
+                chat=chat,
+                chat_history=chat_history,
+                cached_answer=cached_answer,
+                input=input,
+                conversation_id=conversation.id,
+                pdf_id=conversation.pdf_id,
+            )
+
+    def _save_exchange(self, conversation_id, input, answer):
+        from app.web.views.conversation_views import save_exchange
+
+        with self.flask_app.app_context():
+            conversation = Conversation.find_by(id=conversation_id)
+            save_exchange(conversation, input, answer)
+
+    async def _create_message(self, conversation_id, scope, receive, send):
+        body = await self._read_body(receive)
+        environ = _wsgi_environ(scope, body)
+        # Same truthiness as request.args.get("stream") in the Flask view
+        query = parse_qs(environ.get("QUERY_STRING", ""), keep_blank_values=True)
+        streaming = bool(query.get("stream", [""])[0])
+
+        try:
+            prepared = await asyncio.to_thread(
+                self._prepare, environ, conversation_id, streaming
+            )
+        except Exception:
+            logger.exception("Failed to prepare chat")
+            prepared = _Reply(500, {"message": "Internal server error"})
+
+        if isinstance(prepared, _Reply):
+            return await self._send_json(send, prepared.status, prepared.body)
+
+        if not streaming:
+            return await self._answer(prepared, send)
+
+        if self.active_streams >= ASYNC_STREAM_MAX_CONCURRENCY:
+            metrics.incr("streams.rejected")
+            return await self._send_json(
+                send, 503, {"message": "Too many concurrent chats, try again shortly"}
+            )
+
+        self.active_streams += 1
+        try:
+            await self._stream_until_disconnect(prepared, receive, send)
+        finally:
+            self.active_streams -= 1
+
+    async def _answer(self, prepared: _PreparedChat, send):
+        if prepared.cached_answer:
+            answer = prepared.cached_answer
+        else:
+            result = await prepared.chat.ainvoke(
+                {"question": prepared.input, "chat_history": prepared.chat_history}
+            )
+            answer = result["answer"]
+            await asyncio.to_thread(
+                store_answer,
+                prepared.pdf_id,
+                result.get("generated_question") or prepared.input,
+                answer,
+            )
+
+        await asyncio.to_thread(
+            self._save_exchange, prepared.conversation_id, prepared.input, answer
+        )
+        await self._send_json(send, 200, {"role": "assistant", "content": answer})
+
+    async def _stream_until_disconnect(self, prepared: _PreparedChat, receive, send):
+        # The client going away cancels the stream, which cancels the chain
+        # task and with it the in-flight OpenAI request
+        streaming = asyncio.ensure_future(self._stream(prepared, send))
+        disconnect = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            await asyncio.wait(
+                {streaming, disconnect}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            for task in (streaming, disconnect):
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(streaming, disconnect, return_exceptions=True)
+
+        # Only a stream that ran to completion is stored; the client hanging
+        # up afterwards no longer cancels this
+        if streaming.cancelled():
+            return
+        if streaming.exception():
+            logger.error("Streaming response failed", exc_info=streaming.exception())
+            return
+        answer = streaming.result()
+        if not answer:
+            return
+        await asyncio.to_thread(
+            self._save_exchange, prepared.conversation_id, prepared.input, answer
+        )
+        if not prepared.chat_history and not prepared.cached_answer:
+            await asyncio.to_thread(store_answer, prepared.pdf_id, prepared.input, answer)
+
+    async def _stream(self, prepared: _PreparedChat, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": self._headers("text/event-stream", SSE_HEADERS),
+            }
+        )
+
+        if prepared.cached_answer:
+            for frame in coalesce(stream_cached_answer(prepared.cached_answer)):
+                await self._send_body(send, frame)
+            await self._send_body(send, "", more_body=False)
+            return prepared.cached_answer
+
+        tokens = []
+
+        async def collect():
+            async for token in prepared.chat.astream(
+                {"question": prepared.input, "chat_history": prepared.chat_history},
+                poll_interval=SSE_FLUSH_MS / 1000,
+            ):
+                if token:
+                    tokens.append(token)
+                yield token
+
+        try:
+            async for frame in acoalesce(collect()):
+                await self._send_body(send, frame)
+        except StreamFailed:
+            # End the response normally, but don't store the partial answer
+            await self._send_body(send, "", more_body=False)
+            return None
+        await self._send_body(send, "", more_body=False)
+        return "".join(tokens)
+
+    async def _read_body(self, receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        return b"".join(chunks)
+
+    async def _wait_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    def _headers(self, content_type, extra=None):
+        headers = {"Content-Type": content_type, "Cache-Control": "no-cache"}
+        headers.update(extra or {})
+        return [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+
+    async def _send_body(self, send, text, more_body=True):
+        await send(
+            {"type": "http.response.body", "body": text.encode(), "more_body": more_body}
+        )
+
+    async def _send_json(self, send, status, body):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": self._headers("application/json"),
+            }
+        )
+        await self._send_body(send, json.dumps(body), more_body=False)
+
+
+def create_asgi_app():
+    return ChatASGIApp(create_app())
@@ -9,8 +9,18 @@ class Config:
     SECRET_KEY = os.environ["SECRET_KEY"]
     SQLALCHEMY_DATABASE_URI = os.environ["SQLALCHEMY_DATABASE_URI"]
     UPLOAD_URL = os.environ["UPLOAD_URL"]
+    # Load the embedding model and open the vector store in the background as
+    # soon as the app is created; off by default so `flask init-db` stays fast
+    WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "false").lower() == "true"
     CELERY = {
         "broker_url": os.environ.get("REDIS_URI", False),
         "task_ignore_result": True,
         "broker_connection_retry_on_startup": False,
+        # Tasks are acked late, so Redis redelivers one still unacked after
+        # this long; it must outlast the longest ingestion
+        "broker_transport_options": {
+            "visibility_timeout": int(
+                os.environ.get("CELERY_VISIBILITY_TIMEOUT", str(12 * 3600))
+            )
+        },
     }
@@ -1,16 +1,25 @@
 import uuid
+from datetime import datetime
 from app.web.db import db
 from .base import BaseModel
 
 
 class Conversation(BaseModel):
     id: str = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    created_on = db.Column(db.DateTime, server_default=db.func.now())
+    # Set in Python for sub-second precision, which keyset pagination needs
+    created_on = db.Column(
+        db.DateTime, default=datetime.utcnow, server_default=db.func.now()
+    )
 
     retriever: str = db.Column(db.String)
     memory: str = db.Column(db.String)
     llm: str = db.Column(db.String)
 
+    # Rolling summary of every message up to and including summarized_until,
+    # maintained in the background when the conversation uses summary memory
+    summary: str = db.Column(db.Text)
+    summarized_until = db.Column(db.DateTime)
+
     pdf_id: int = db.Column(db.Integer, db.ForeignKey("pdf.id"), nullable=False)
     pdf = db.relationship("Pdf", back_populates="conversations")
 
@@ -21,6 +30,18 @@ class Conversation(BaseModel):
         "Message", back_populates="conversation", order_by="Message.created_on"
     )
 
+    def as_summary(self, message_count: int, last_role=None, last_preview=None):
+        """List entry of the conversation, without its messages"""
+        return {
+            "id": self.id,
+            "pdf_id": self.pdf_id,
+            "created_on": self.created_on.isoformat() if self.created_on else None,
+            "message_count": message_count,
+            "last_message": (
+                {"role": last_role, "content": last_preview} if last_role else None
+            ),
+        }
+
     def as_dict(self):
         return {
             "id": self.id,
@@ -1,14 +1,24 @@
 import uuid
+from datetime import datetime
 from app.web.db import db
 from langchain.schema.messages import AIMessage, HumanMessage, SystemMessage
 from .base import BaseModel
 
 
 class Message(BaseModel):
+    # Chat history is read as "the last N messages of a conversation"
+    __table_args__ = (
+        db.Index("ix_message_conversation_id_created_on", "conversation_id", "created_on"),
+    )
+
     id: str = db.Column(
         db.String(), primary_key=True, default=lambda: str(uuid.uuid4())
     )
-    created_on = db.Column(db.DateTime, server_default=db.func.now())
+    # Set in Python so that a question and its answer, stored within the same
+    # second, still sort correctly (SQLite's now() has 1s resolution)
+    created_on = db.Column(
+        db.DateTime, default=datetime.utcnow, server_default=db.func.now()
+    )
     role: str = db.Column(db.String(), nullable=False)
     content: str = db.Column(db.String(), nullable=False)
 
@@ -21,11 +31,15 @@ class Message(BaseModel):
         return {"id": self.id, "role": self.role, "content": self.content}
 
     def as_lc_message(self) -> HumanMessage | AIMessage | SystemMessage:
-        if self.role == "human":
-            return HumanMessage(content=self.content)
-        elif self.role == "ai":
-            return AIMessage(content=self.content)
-        elif self.role == "system":
-            return SystemMessage(content=self.content)
+        return self.to_lc_message(self.role, self.content)
+
+    @staticmethod
+    def to_lc_message(role: str, content: str) -> HumanMessage | AIMessage | SystemMessage:
+        if role == "human":
+            return HumanMessage(content=content)
+        elif role == "ai":
+            return AIMessage(content=content)
+        elif role == "system":
+            return SystemMessage(content=content)
         else:
-            raise Exception(f"Unknown message role: {self.role}")
+            raise Exception(f"Unknown message role: {role}")
@@ -11,6 +11,32 @@ class Pdf(BaseModel):
     user_id: int = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     user = db.relationship("User", back_populates="pdfs")
 
+    # Vector registry: chunks per page, from which the deterministic vector
+    # IDs ({pdf_id}:{page}:{chunk_no}) can be regenerated for deletion
+    vector_count: int = db.Column(db.Integer, nullable=False, default=0)
+    # Deferred: thousands of entries for a long PDF, and only the ingestion
+    # and deletion tasks read it
+    vector_chunk_counts = db.deferred(db.Column(db.JSON))
+
+    # Ingestion state. status goes pending -> processing -> ready, or to
+    # failed with ingest_error set. pages_done is the checkpoint: every
+    # chunk of those pages is upserted, so a retry resumes there.
+    # vector_chunk_counts can run past it, covering batches that were sent
+    # but may not have landed.
+    status: str = db.Column(db.String(20), nullable=False, default="pending")
+    pages_total: int = db.Column(db.Integer)
+    pages_done: int = db.Column(db.Integer, nullable=False, default=0)
+    ingest_started_on = db.Column(db.DateTime)
+    ingest_finished_on = db.Column(db.DateTime)
+    ingest_error = db.Column(db.Text)
+    # The run currently ingesting the PDF, and when it last checkpointed
+    ingest_claim = db.Column(db.String(32))
+    ingest_heartbeat_on = db.Column(db.DateTime)
+
+    # Set when the user deletes the PDF; the row is hidden from then on and
+    # removed by the delete_pdf task once vectors and file are gone
+    deleted_on = db.Column(db.DateTime)
+
     conversations = db.relationship(
         "Conversation",
         back_populates="pdf",
@@ -22,4 +48,18 @@ class Pdf(BaseModel):
             "id": self.id,
             "name": self.name,
             "user_id": self.user_id,
+            "status": self.status,
+        }
+
+    def progress_dict(self):
+        started_on, finished_on = self.ingest_started_on, self.ingest_finished_on
+        return {
+            "id": self.id,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "chunks_written": self.vector_count,
+            "started_on": started_on.isoformat() if started_on else None,
+            "finished_on": finished_on.isoformat() if finished_on else None,
+            "error": self.ingest_error,
         }
@@ -9,6 +9,16 @@ from werkzeug.exceptions import Unauthorized, BadRequest
 from app.web.db.models import User, Model
 
 
+def is_tombstoned(instance) -> bool:
+    """
+    Whether a row, or the PDF it belongs to, is waiting for background
+    deletion
+    """
+    if getattr(instance, "deleted_on", None) is not None:
+        return True
+    return getattr(getattr(instance, "pdf", None), "deleted_on", None) is not None
+
+
 def load_model(Model: Model, extract_id_lambda=None):
     def decorator(view):
         @functools.wraps(view)
@@ -25,6 +35,9 @@ def load_model(Model: Model, extract_id_lambda=None):
 
             instance = Model.find_by(id=model_id)
 
+            if is_tombstoned(instance):
+                raise NoResultFound(f"{Model.__name__} {model_id} was deleted")
+
             if instance.user_id != g.user.id:
                 raise Unauthorized("You are not authorized to view this.")
 
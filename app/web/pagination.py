@@ -0,0 +1,64 @@
+import json
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from flask import request
+from werkzeug.exceptions import BadRequest
+from app.web.db import db
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def page_size() -> int:
+    """The ?limit= of the current request, clamped to MAX_PAGE_SIZE"""
+    try:
+        limit = int(request.args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(created_on: datetime, id: str) -> str:
+    payload = json.dumps([created_on.isoformat(), id]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    """The (created_on, id) position of the ?cursor= of the current request"""
+    if not cursor:
+        return None
+    try:
+        created_on, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_on), id
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor")
+
+
+def before(model, cursor: Optional[Tuple[datetime, str]]):
+    """
+    Filter for rows that come after the cursor when ordering by
+    (created_on desc, id desc), i.e. rows older than the cursor
+    """
+    if cursor is None:
+        return db.true()
+    created_on, id = cursor
+    return db.or_(
+        model.created_on < created_on,
+        db.and_(model.created_on == created_on, model.id < id),
+    )
+
+
+def paginate(query, model, limit: int):
+    """
+    Runs a select whose first column is the model, ordered newest first, and
+    returns (rows, next_cursor), where next_cursor is None on the last page
+    """
+    rows = db.session.execute(
+        query.order_by(model.created_on.desc(), model.id.desc()).limit(limit + 1)
+    ).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1][0]
+    return rows, encode_cursor(last.created_on, last.id)
@@ -0,0 +1,57 @@
+from celery import shared_task
+from app.logging import get_module_logger
+
+from app.web.db import db
+from app.web.db.models import Pdf, Conversation, Message
+from app.web import files
+from app.chat import invalidate_answers
+from app.chat.vector_stores.pinecone import delete_embeddings_for_pdf
+from app.chat.retrievers.bm25 import delete_bm25_index
+
+logger = get_module_logger("celery.tasks.deletion")
+
+
+class FileDeleteError(Exception):
+    pass
+
+
+@shared_task(
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    max_retries=8,
+)
+def delete_pdf(pdf_id: str):
+    """
+    Removes a tombstoned PDF: its vectors and lexical index, the stored
+    file, and then its messages, conversations and row with set-based DELETE
+    statements. Every step is idempotent, so a retry after a partial failure
+    is safe.
+    """
+    pdf = db.session.get(Pdf, pdf_id)
+    if pdf is None:
+        logger.info(f"PDF {pdf_id} already deleted")
+        return
+
+    delete_embeddings_for_pdf(pdf.id, pdf.vector_chunk_counts, raise_errors=True)
+    delete_bm25_index(pdf.id)
+    invalidate_answers(pdf.id)
+
+    res, status_code = files.delete(pdf.id)
+    if status_code >= 400 and status_code != 404:
+        raise FileDeleteError(f"Upload service returned {status_code}: {res}")
+
+    conversation_ids = db.select(Conversation.id).where(Conversation.pdf_id == pdf.id)
+    messages = db.session.execute(
+        db.delete(Message).where(Message.conversation_id.in_(conversation_ids))
+    ).rowcount
+    conversations = db.session.execute(
+        db.delete(Conversation).where(Conversation.pdf_id == pdf.id)
+    ).rowcount
+    db.session.execute(db.delete(Pdf).where(Pdf.id == pdf.id))
+    db.session.commit()
+
+    logger.info(
+        f"Deleted PDF {pdf_id} with {conversations} conversations and "
+        f"{messages} messages"
+    )
@@ -1,31 +1,173 @@
+import os
+import uuid
+from datetime import datetime, timedelta
 from celery import shared_task
 from app.logging import get_module_logger
 
+from app.web.db import db
 from app.web.db.models import Pdf
 from app.web.files import download
 from app.chat import create_embeddings_for_pdf
+from app.chat.ingestion.pipeline import Checkpoint, CheckpointMismatch
+from app.chat.vector_stores.pinecone import delete_embeddings_for_pdf
 
 # Get a logger for embeddings tasks
 logger = get_module_logger("celery.tasks.embeddings")
 
+# A run that hasn't checkpointed for this long is presumed dead, and a
+# redelivered task may take the PDF over
+INGEST_CLAIM_TIMEOUT = int(os.getenv("INGEST_CLAIM_TIMEOUT", "900"))
 
-@shared_task()
-def process_document(pdf_id: int):
+
+class IngestionSuperseded(Exception):
+    """Another run of the task has taken the PDF over"""
+
+
+def _claim(pdf: Pdf):
+    """
+    Makes this run the one ingesting the PDF: compare-and-set on the claim
+    token last seen on the row, so of two runs racing for it only one
+    wins. Returns the new token, or None if another run got there first.
+    """
+    token = uuid.uuid4().hex
+    claimed = db.session.execute(
+        db.update(Pdf)
+        .where(Pdf.id == pdf.id, Pdf.ingest_claim.is_not_distinct_from(pdf.ingest_claim))
+        .values(ingest_claim=token, ingest_heartbeat_on=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return token if claimed else None
+
+
+def _update_claimed(pdf: Pdf, token: str, **values):
+    """Updates the PDF if this run still holds its claim, and heartbeats it"""
+    updated = db.session.execute(
+        db.update(Pdf)
+        .where(Pdf.id == pdf.id, Pdf.ingest_claim == token)
+        .values(ingest_heartbeat_on=datetime.utcnow(), **values)
+    ).rowcount
+    db.session.commit()
+    if not updated:
+        raise IngestionSuperseded(f"PDF {pdf.id} was taken over by another run")
+
+
+def _reset_vectors(pdf: Pdf, token: str):
+    """
+    Drops the PDF's vectors so ingestion starts from the first page.
+    vector_chunk_counts covers every batch ever sent, not only the pages
+    done, so vectors of batches in flight when a run stopped go too.
+    """
+    if pdf.vector_chunk_counts:
+        delete_embeddings_for_pdf(pdf.id, pdf.vector_chunk_counts)
+    _update_claimed(pdf, token, vector_count=0, vector_chunk_counts=None, pages_done=0)
+
+
+@shared_task(
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    max_retries=5,
+    # A worker killed mid-PDF gets the task redelivered, and it resumes
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def process_document(pdf_id: str):
+    """
+    Ingests a PDF, checkpointing on the Pdf row after each upserted batch.
+
+    A run that finds the PDF still processing, or failed, with pages done
+    resumes after those pages instead of embedding them again. Any other
+    run (a re-ingest) drops the previous vectors and starts over.
+
+    Each run claims the row first, and every checkpoint checks the claim,
+    so a redelivered copy of the task never ingests alongside a live run.
+    """
     logger.info(f"Starting to process document with PDF ID: {pdf_id}")
 
-    try:
-        pdf = Pdf.find_by(id=pdf_id)
-        if not pdf:
-            logger.error(f"PDF with ID {pdf_id} not found")
-            return
+    pdf = db.session.get(Pdf, pdf_id)
+    if pdf is None:
+        logger.error(f"PDF with ID {pdf_id} not found")
+        return
+
+    if pdf.deleted_on is not None:
+        logger.info(f"PDF {pdf_id} was deleted, skipping")
+        return
+
+    logger.info(f"Found PDF: {pdf.name}")
+
+    # With acks_late, a task outliving the broker's visibility timeout is
+    # delivered again while the first run is still going
+    heartbeat = pdf.ingest_heartbeat_on
+    if (
+        pdf.status == "processing"
+        and heartbeat is not None
+        and datetime.utcnow() - heartbeat < timedelta(seconds=INGEST_CLAIM_TIMEOUT)
+    ):
+        logger.info(f"PDF {pdf_id} is being ingested by another run, skipping")
+        return
+    previous_status = pdf.status
+    token = _claim(pdf)
+    if token is None:
+        logger.info(f"PDF {pdf_id} was claimed by another run, skipping")
+        return
+
+    resume = None
+    if previous_status in ("processing", "failed") and pdf.pages_done and pdf.vector_chunk_counts:
+        resume = Checkpoint(
+            pages_done=pdf.pages_done,
+            pages_total=pdf.pages_total or 0,
+            chunk_counts=list(pdf.vector_chunk_counts),
+        )
+        logger.info(f"Resuming PDF {pdf_id} after page {pdf.pages_done}")
+    else:
+        # Re-ingesting: drop the previous vectors, the page layout may differ
+        _reset_vectors(pdf, token)
 
-        logger.info(f"Found PDF: {pdf.name}")
+    _update_claimed(
+        pdf,
+        token,
+        status="processing",
+        ingest_started_on=pdf.ingest_started_on if resume else datetime.utcnow(),
+        ingest_finished_on=None,
+        ingest_error=None,
+    )
 
+    def save_checkpoint(checkpoint: Checkpoint):
+        _update_claimed(
+            pdf,
+            token,
+            pages_total=checkpoint.pages_total,
+            pages_done=checkpoint.pages_done,
+            vector_count=checkpoint.chunks,
+            vector_chunk_counts=checkpoint.chunk_counts,
+        )
+
+    try:
         with download(pdf.id) as pdf_path:
             logger.debug(f"Downloaded PDF to: {pdf_path}")
-            create_embeddings_for_pdf(pdf.id, pdf_path)
-            logger.info(f"Successfully processed embeddings for PDF: {pdf.name}")
+            try:
+                stats = create_embeddings_for_pdf(pdf.id, pdf_path, resume, save_checkpoint)
+            except CheckpointMismatch as e:
+                logger.warning(f"{e}; ingesting it from the start")
+                _reset_vectors(pdf, token)
+                stats = create_embeddings_for_pdf(pdf.id, pdf_path, None, save_checkpoint)
+
+        _update_claimed(pdf, token, status="ready", ingest_finished_on=datetime.utcnow())
+        logger.info(
+            f"Successfully processed embeddings for PDF: {pdf.name} "
+            f"({stats.as_dict()})"
+        )
+
+    except IngestionSuperseded as e:
+        db.session.rollback()
+        logger.warning(f"{e}, stopping this run")
 
     except Exception as e:
         logger.error(f"Failed to process document {pdf_id}: {str(e)}", exc_info=True)
+        db.session.rollback()
+        # The checkpoint stays, so the retry picks up where this run stopped
+        try:
+            _update_claimed(pdf, token, status="failed", ingest_error=str(e)[:2000])
+        except IngestionSuperseded:
+            return
         raise
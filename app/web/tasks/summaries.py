@@ -0,0 +1,67 @@
+from celery import shared_task
+from app.logging import get_module_logger
+
+from app.web.db.models import Conversation
+from app.web.api import get_messages_to_summarize, update_conversation_summary
+from app.chat.memories.summary_memory import (
+    fold_summary,
+    SUMMARY_RECENT_MESSAGES,
+    SUMMARY_BATCH_MESSAGES,
+)
+
+logger = get_module_logger("celery.tasks.summaries")
+
+# Don't spend an LLM call on less than one question and answer
+SUMMARY_MIN_NEW_MESSAGES = 2
+
+
+@shared_task()
+def update_summary(conversation_id: str):
+    """
+    Folds the messages that fell out of the recent window into the
+    conversation's rolling summary. Only messages newer than
+    summarized_until are sent to the LLM, so each turn costs one small call
+    no matter how long the conversation is.
+    """
+    conversation = Conversation.find_by(id=conversation_id)
+    previous_until = conversation.summarized_until
+
+    messages = get_messages_to_summarize(
+        conversation_id,
+        after=previous_until,
+        keep_recent=SUMMARY_RECENT_MESSAGES,
+        limit=SUMMARY_BATCH_MESSAGES,
+    )
+    if len(messages) < SUMMARY_MIN_NEW_MESSAGES:
+        return
+
+    from app.chat.llms.chatopenai import FallbackChatModel
+
+    summary = fold_summary(
+        conversation.summary,
+        [message.as_lc_message() for message in messages],
+        FallbackChatModel(streaming=False),
+    )
+
+    stored = update_conversation_summary(
+        conversation_id, summary, messages[-1].created_on, previous_until
+    )
+    if not stored:
+        logger.info(f"Summary of conversation {conversation_id} moved on, discarding")
+        return
+
+    logger.info(
+        f"Folded {len(messages)} messages into the summary of conversation "
+        f"{conversation_id}"
+    )
+    # A backlog longer than one batch is worked off in follow-up tasks
+    if len(messages) == SUMMARY_BATCH_MESSAGES:
+        update_summary.delay(conversation_id)
+
+
+def schedule_summary_update(conversation_id: str):
+    try:
+        update_summary.delay(conversation_id)
+    except Exception as e:
+        # The summary catches up on a later turn
+        logger.warning(f"Could not schedule summary update: {e}")
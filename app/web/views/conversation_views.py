@@ -1,16 +1,71 @@
 from flask import Blueprint, g, request, Response, jsonify, stream_with_context
 from app.web.hooks import login_required, load_model
-from app.web.db.models import Pdf, Conversation
-from app.chat import build_chat, ChatArgs
+from app.web.db import db
+from app.web.db.models import Pdf, Conversation, Message
+from app.web.pagination import page_size, decode_cursor, before, paginate
+from app.chat import (
+    build_chat,
+    ChatArgs,
+    lookup_answer,
+    store_answer,
+    stream_cached_answer,
+    StreamRejected,
+)
+from app.chat.sse import coalesce, SSE_FLUSH_MS, SSE_HEADERS
 
 bp = Blueprint("conversation", __name__, url_prefix="/api/conversations")
 
+# Characters of the last message shown in the conversation list
+MESSAGE_PREVIEW_LENGTH = 120
+
 
 @bp.route("/", methods=["GET"])
 @login_required
 @load_model(Pdf, lambda r: r.args.get("pdf_id"))
 def list_conversations(pdf):
-    return [c.as_dict() for c in pdf.conversations]
+    """
+    Newest conversations of a PDF first, one summary row each. Pass the
+    returned next_cursor as ?cursor= to get the next page.
+    """
+    limit = page_size()
+    cursor = decode_cursor(request.args.get("cursor"))
+
+    # Correlated subqueries, each answered from the message index, instead of
+    # loading every message of every conversation
+    message_count = (
+        db.select(db.func.count(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    last_message = (
+        db.select(Message.id)
+        .where(Message.conversation_id == Conversation.id)
+        .order_by(Message.created_on.desc())
+        .limit(1)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    query = (
+        db.select(
+            Conversation,
+            message_count,
+            Message.role,
+            db.func.substr(Message.content, 1, MESSAGE_PREVIEW_LENGTH),
+        )
+        .outerjoin(Message, Message.id == last_message)
+        .where(
+            Conversation.pdf_id == pdf.id,
+            Conversation.user_id == g.user.id,
+            before(Conversation, cursor),
+        )
+    )
+    rows, next_cursor = paginate(query, Conversation, limit)
+
+    return {
+        "items": [c.as_summary(count, role, preview) for c, count, role, preview in rows],
+        "next_cursor": next_cursor,
+    }
 
 
 @bp.route("/", methods=["POST"])
@@ -22,13 +77,13 @@ def create_conversation(pdf):
     return conversation.as_dict()
 
 
-@bp.route("/<string:conversation_id>/messages", methods=["POST"])
-@login_required
-@load_model(Conversation)
-def create_message(conversation):
-    input = request.json.get("input")
-    streaming = request.args.get("stream", False)
+def prepare_chat(conversation, input, streaming):
+    """
+    Builds the chain for a new message in the conversation and loads what it
+    needs from the database. Shared with the async endpoint in app.web.asgi.
 
+    :return: (chat, chat_history, cached_answer)
+    """
     pdf = conversation.pdf
 
     chat_args = ChatArgs(
@@ -40,36 +95,139 @@ def create_message(conversation):
             "user_id": g.user.id,
             "pdf_id": pdf.id,
         },
+        llm=conversation.llm,
+        retriever=conversation.retriever,
+        memory=conversation.memory,
     )
 
-    from app.chat.memories.sql_memory import SqlMessageHistory
-    from app.web.api import get_messages_by_conversation_id
+    from app.web.api import (
+        get_messages_by_conversation_id,
+        HISTORY_MAX_MESSAGES,
+        HISTORY_TOKEN_BUDGET,
+    )
+    from app.chat.memories.summary_memory import (
+        uses_summary_memory,
+        load_summary_history,
+    )
 
     chat = build_chat(chat_args)
+
+    if uses_summary_memory(conversation):
+        chat_history = load_summary_history(conversation)
+    else:
+        # Only the most recent window of the conversation is sent to the LLM
+        chat_history = get_messages_by_conversation_id(
+            conversation.id,
+            limit=HISTORY_MAX_MESSAGES,
+            token_budget=HISTORY_TOKEN_BUDGET,
+        )
+
+    # Without history the input already is the standalone question, so a
+    # near-identical question about this PDF can be answered from the cache
+    cached_answer = None if chat_history else lookup_answer(pdf.id, input)
+
+    return chat, chat_history, cached_answer
+
+
+def save_exchange(conversation, input, answer):
+    """Stores a question and its answer, then updates the summary if used"""
+    from langchain.schema import HumanMessage, AIMessage
+    from app.chat.memories.sql_memory import SqlMessageHistory
+    from app.chat.memories.summary_memory import uses_summary_memory
+    from app.web.tasks.summaries import schedule_summary_update
+
     sql_memory = SqlMessageHistory(conversation_id=conversation.id)
+    sql_memory.add_message(HumanMessage(content=input))
+    sql_memory.add_message(AIMessage(content=answer))
+
+    if uses_summary_memory(conversation):
+        schedule_summary_update(conversation.id)
+
+
+@bp.route("/<string:conversation_id>/messages", methods=["GET"])
+@login_required
+@load_model(Conversation)
+def list_messages(conversation):
+    """
+    A page of a conversation's messages in chronological order, starting
+    with the newest. Pass the returned next_cursor as ?cursor= to get the
+    page of older messages before it.
+    """
+    limit = page_size()
+    cursor = decode_cursor(request.args.get("cursor"))
+
+    query = db.select(Message).where(
+        Message.conversation_id == conversation.id, before(Message, cursor)
+    )
+    rows, next_cursor = paginate(query, Message, limit)
+
+    return {
+        "items": [message.as_dict() for (message,) in reversed(rows)],
+        "next_cursor": next_cursor,
+    }
+
+
+@bp.route("/<string:conversation_id>/messages", methods=["POST"])
+@login_required
+@load_model(Conversation)
+def create_message(conversation):
+    input = request.json.get("input")
+    streaming = request.args.get("stream", False)
+
+    pdf = conversation.pdf
+
+    chat, chat_history, cached_answer = prepare_chat(conversation, input, streaming)
 
     if not chat:
         return "Chat not yet implemented!"
 
-    # Get chat history for the chain - directly from the API
-    chat_history = get_messages_by_conversation_id(conversation.id)
-
     if streaming:
+        if cached_answer:
+            save_exchange(conversation, input, cached_answer)
+            return Response(
+                coalesce(stream_cached_answer(cached_answer)),
+                mimetype="text/event-stream",
+                headers=SSE_HEADERS,
+            )
+
+        try:
+            # Submitting eagerly lets a saturated executor surface as a 503
+            # before the response has started
+            token_stream = chat.stream({"question": input, "chat_history": chat_history})
+        except StreamRejected:
+            return {"message": "Too many concurrent chats, try again shortly"}, 503
+
+        def stream():
+            tokens = []
+            try:
+                for token in token_stream.poll(SSE_FLUSH_MS / 1000):
+                    if token:
+                        tokens.append(token)
+                    yield token
+            finally:
+                token_stream.close()
+            answer = "".join(tokens)
+            # A run that failed midway leaves a partial answer; don't keep it
+            if not answer or token_stream.failed:
+                return
+            save_exchange(conversation, input, answer)
+            if not chat_history:
+                store_answer(pdf.id, input, answer)
+
         return Response(
-            stream_with_context(chat.stream({"question": input, "chat_history": chat_history})), mimetype="text/event-stream"
+            stream_with_context(coalesce(stream())),
+            mimetype="text/event-stream",
+            headers=SSE_HEADERS,
         )
     else:
-        # Simple approach: just run the chain
-        from langchain.schema import HumanMessage, AIMessage
-
-        # Add user message to memory
-        sql_memory.add_message(HumanMessage(content=input))
-
-        # Run chain with the question and chat history
-        result = chat.invoke({"question": input, "chat_history": chat_history})
-        answer = result["answer"]
-
-        # Add AI response to memory
-        sql_memory.add_message(AIMessage(content=answer))
+        if cached_answer:
+            answer = cached_answer
+        else:
+            # Run chain with the question and chat history
+            result = chat.invoke({"question": input, "chat_history": chat_history})
+            answer = result["answer"]
+            store_answer(pdf.id, result.get("generated_question") or input, answer)
+
+        save_exchange(conversation, input, answer)
 
         return jsonify({"role": "assistant", "content": answer})
@@ -0,0 +1,34 @@
+from flask import Blueprint
+from app.chat import metrics
+from app.chat.warmup import readiness, start_warm_up
+
+bp = Blueprint("health", __name__, url_prefix="/health")
+
+
+@bp.route("/live", methods=["GET"])
+def live():
+    return {"status": "ok"}
+
+
+@bp.route("/ready", methods=["GET"])
+def ready():
+    # A probe is usually the first request a worker sees, so let it kick off
+    # warm-up rather than waiting for the first chat message to do so
+    start_warm_up()
+
+    state = readiness()
+    return state, 200 if state["ready"] else 503
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_snapshot():
+    from app.chat.embeddings.openai import get_cache_stats
+    from app.chat.llms.router import get_router
+    from app.chat.retrievers.rerank import get_rerank_stats
+
+    return {
+        **metrics.snapshot(),
+        "embedding_cache": get_cache_stats(),
+        "llm_providers": get_router().stats(),
+        "rerank": get_rerank_stats(),
+    }
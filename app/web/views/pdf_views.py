@@ -1,11 +1,11 @@
+import logging
+from datetime import datetime
 from flask import Blueprint, g, jsonify
 from werkzeug.exceptions import Unauthorized
 from app.web.hooks import login_required, handle_file_upload, load_model
 from app.web.db.models import Pdf
-from app.web.db.models.conversation import Conversation
-from app.web.db.models.message import Message
 from app.web.tasks.embeddings import process_document
-from app.chat.vector_stores.pinecone import delete_embeddings_for_pdf
+from app.web.tasks.deletion import delete_pdf
 from app.web import files
 
 bp = Blueprint("pdf", __name__, url_prefix="/api/pdfs")
@@ -14,7 +14,7 @@ bp = Blueprint("pdf", __name__, url_prefix="/api/pdfs")
 @bp.route("/", methods=["GET"])
 @login_required
 def list():
-    pdfs = Pdf.where(user_id=g.user.id)
+    pdfs = Pdf.where(user_id=g.user.id, deleted_on=None)
 
     return Pdf.as_dicts(pdfs)
 
@@ -47,40 +47,26 @@ def show(pdf):
     )
 
 
+@bp.route("/<string:pdf_id>/progress", methods=["GET"])
+@login_required
+@load_model(Pdf)
+def progress(pdf):
+    # Polled while a PDF is ingesting; only reads the Pdf row
+    return pdf.progress_dict()
+
+
 @bp.route("/<string:pdf_id>", methods=["DELETE"])
 @login_required
 @load_model(Pdf)
 def delete(pdf):
+    # Tombstone the PDF and leave the actual work to the worker, so the
+    # request costs the same however many conversations the PDF has
+    pdf.update(deleted_on=datetime.utcnow())
     try:
-        # Delete the file from storage
-        res, status_code = files.delete(pdf.id)
-        if status_code >= 400:
-            # Log but don't fail the operation if file deletion fails
-            pass
-
-        # Delete embeddings from Pinecone vector store
-        delete_embeddings_for_pdf(pdf.id)
-
-        # Delete all conversations and their messages associated with this PDF
-        conversations = Conversation.where(pdf_id=pdf.id)
-        for conversation in conversations:
-            # Delete all messages in this conversation
-            messages = Message.where(conversation_id=conversation.id)
-            for message in messages:
-                message.delete(commit=False)
-
-            # Delete the conversation
-            conversation.delete(commit=False)
-
-        # Delete the PDF record from database
-        pdf.delete(commit=False)
-
-        # Commit all deletions together
-        from app.web.db import db
-        db.session.commit()
-
-        return {"message": "PDF deleted successfully"}, 200
+        delete_pdf.delay(pdf.id)
     except Exception as e:
-        from app.web.db import db
-        db.session.rollback()
+        logging.error(f"Could not schedule deletion of PDF {pdf.id}: {e}")
+        pdf.update(deleted_on=None)
         return {"error": f"Failed to delete PDF: {str(e)}"}, 500
+
+    return {"id": pdf.id, "status": "deleting"}, 202
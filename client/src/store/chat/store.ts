@@ -11,8 +11,19 @@ export interface Message {
 export interface Conversation {
 	id: number;
 	messages: Message[];
+	messagesLoaded?: boolean;
+	message_count?: number;
+	last_message?: Message | null;
 }
 
+export interface Page<T> {
+	items: T[];
+	next_cursor: string | null;
+}
+
+// Messages fetched when a conversation is opened; older ones stay on the server
+const MESSAGE_PAGE_SIZE = 100;
+
 export interface MessageOpts {
 	useStreaming?: boolean;
 	documentId?: string;
@@ -111,14 +122,31 @@ const scoreConversation = async (score: number) => {
 	return api.post(`/scores?conversation_id=${conversationId}`, { score });
 };
 
+const fetchMessages = async (conversationId: number) => {
+	const { data } = await api.get<Page<Message>>(
+		`/conversations/${conversationId}/messages?limit=${MESSAGE_PAGE_SIZE}`
+	);
+
+	store.update((s) => {
+		const conv = s.conversations.find((c) => c.id === conversationId);
+		if (!conv) {
+			return;
+		}
+		conv.messages = data.items;
+		conv.messagesLoaded = true;
+	});
+};
+
 const fetchConversations = async (documentId: number) => {
-	const { data } = await api.get<Conversation[]>(`/conversations?pdf_id=${documentId}`);
+	// The list only carries summary rows; messages are loaded per conversation
+	const { data } = await api.get<Page<Conversation>>(`/conversations?pdf_id=${documentId}`);
 
-	if (data.length) {
+	if (data.items.length) {
 		set({
-			conversations: data,
-			activeConversationId: data[0].id
+			conversations: data.items.map((c) => ({ ...c, messages: [] })),
+			activeConversationId: data.items[0].id
 		});
+		await fetchMessages(data.items[0].id);
 	} else {
 		await createConversation(documentId);
 	}
@@ -129,7 +157,7 @@ const createConversation = async (documentId: number) => {
 
 	set({
 		activeConversationId: data.id,
-		conversations: [data, ...get(store).conversations]
+		conversations: [{ ...data, messagesLoaded: true }, ...get(store).conversations]
 	});
 
 	return data;
@@ -137,6 +165,11 @@ const createConversation = async (documentId: number) => {
 
 const setActiveConversationId = (id: number) => {
 	set({ activeConversationId: id });
+
+	const conversation = getActiveConversation();
+	if (conversation && !conversation.messagesLoaded) {
+		fetchMessages(id);
+	}
 };
 
 const resetAll = () => {
@@ -153,6 +186,7 @@ export {
 	setActiveConversationId,
 	getRawMessages,
 	fetchConversations,
+	fetchMessages,
 	resetAll,
 	resetError,
 	createConversation,
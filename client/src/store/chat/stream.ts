@@ -67,10 +67,25 @@ export const sendMessage = async (userMessage: Message) => {
 	}
 };
 
+// Extracts the payload of one Server-Sent Events frame. Multiple data lines
+// are joined with newlines; a single space after the colon is not part of it.
+const _parseEvent = (frame: string) => {
+	const data: string[] = [];
+	for (const line of frame.split('\n')) {
+		if (line.startsWith('data:')) {
+			const value = line.slice(5);
+			data.push(value.startsWith(' ') ? value.slice(1) : value);
+		}
+	}
+	return data.length ? data.join('\n') : null;
+};
+
 const readResponse = async (
 	reader: ReadableStreamDefaultReader<Uint8Array>,
 	responseMessage: Message
 ) => {
+	const decoder = new TextDecoder();
+	let buffer = '';
 	let inProgress = true;
 
 	while (inProgress) {
@@ -79,10 +94,19 @@ const readResponse = async (
 			inProgress = false;
 			break;
 		}
-		const text = new TextDecoder().decode(value);
+		buffer += decoder.decode(value, { stream: true });
+
+		// A network chunk can end in the middle of a frame, so only complete
+		// frames are consumed and the remainder waits for the next read
+		let boundary = buffer.indexOf('\n\n');
+		while (boundary !== -1) {
+			const text = _parseEvent(buffer.slice(0, boundary));
+			buffer = buffer.slice(boundary + 2);
+			boundary = buffer.indexOf('\n\n');
 
-		if (responseMessage.id) {
-			_appendResponse(responseMessage.id, text);
+			if (text !== null && responseMessage.id) {
+				_appendResponse(responseMessage.id, text);
+			}
 		}
 	}
 };
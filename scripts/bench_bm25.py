@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark the lexical leg of hybrid retrieval.
+
+Builds a BM25 index for a synthetic PDF of N chunks (2,000 by default,
+roughly a 250-page technical manual) sprinkled with part numbers, error
+codes and clause references, then reports:
+
+    build     - time to tokenize and write the index, and its size on disk
+    load      - time to load it into the per-process cache (first query)
+    search    - p50/p95/max per query, warm, for identifier and prose queries
+    fusion    - reciprocal-rank fusion of two candidate lists
+    accuracy  - share of identifier queries whose first result contains the
+                identifier (identifiers may repeat across chunks)
+
+Usage:
+    python scripts/bench_bm25.py [chunks] [queries]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ["BM25_INDEX_DIR"] = tempfile.mkdtemp(prefix="bench_bm25_")
+
+from langchain_core.documents import Document
+
+from app.chat.retrievers import bm25
+from app.chat.retrievers.hybrid import reciprocal_rank_fusion
+
+PDF_ID = "bench"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def corpus(count, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choices(letters, k=rng.randint(3, 9))) for _ in range(8000)]
+    chunks, identifiers = [], []
+    for n in range(count):
+        identifier = rng.choice(
+            [
+                f"PN-{rng.randint(1000, 9999)}-{rng.choice('ABCDEF')}",
+                f"E_{rng.randint(0, 0xFFFF):04X}",
+                f"clause {rng.randint(1, 12)}.{rng.randint(1, 9)}.{rng.randint(1, 9)}",
+            ]
+        )
+        text = " ".join(rng.choice(words) for _ in range(80))
+        position = rng.randint(0, len(text))
+        chunks.append(f"{text[:position]} {identifier} {text[position:]}")
+        identifiers.append((n, identifier))
+    return chunks, identifiers, words
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(0)
+    chunks, identifiers, words = corpus(count, rng)
+
+    def build():
+        builder = bm25.BM25Builder(PDF_ID)
+        for n, text in enumerate(chunks):
+            builder.add(f"{PDF_ID}:{n // 8}:{n % 8}", text, {"page": n // 8, "chunk_no": n % 8})
+        return builder.write()
+
+    directory, build_ms = timed(build)
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    _, load_ms = timed(lambda: bm25.lexical_search(PDF_ID, "warm up", 8))
+
+    print(f"{count} chunks")
+    print(f"  build:  {build_ms:8.1f} ms, {size / 1024:.0f} KiB on disk")
+    print(f"  load:   {load_ms:8.1f} ms (first query after start or re-ingest)")
+
+    cases = {
+        "identifier": [rng.choice(identifiers) for _ in range(queries)],
+        "prose": [
+            (None, " ".join(rng.choice(words) for _ in range(rng.randint(5, 15))))
+            for _ in range(queries)
+        ],
+    }
+    hits = 0
+    for name, samples in cases.items():
+        latencies = []
+        for expected, identifier in samples:
+            query = f"What does {identifier} mean?" if expected is not None else identifier
+            results, ms = timed(lambda: bm25.lexical_search(PDF_ID, query, 8))
+            latencies.append(ms)
+            if expected is not None and results and identifier in results[0].page_content:
+                hits += 1
+        print(
+            f"  search ({name:>10}): p50 {statistics.median(latencies):6.3f} ms  "
+            f"p95 {percentile(latencies, 0.95):6.3f} ms  max {max(latencies):6.3f} ms"
+        )
+
+    dense = [Document(id=f"d{n}", page_content=str(n)) for n in range(8)]
+    lexical = [Document(id=f"d{n}", page_content=str(n)) for n in range(4, 12)]
+    fusion = [timed(lambda: reciprocal_rank_fusion([dense, lexical], 4))[1] for _ in range(1000)]
+    print(f"  fusion: p50 {statistics.median(fusion):6.3f} ms")
+    print(f"  accuracy: {hits / queries:.1%} of identifier queries find it first")
+
+    shutil.rmtree(os.environ["BM25_INDEX_DIR"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
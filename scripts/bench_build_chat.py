@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of per-message chain construction.
+
+Compares building the chain from scratch on every message (a new
+FallbackChatModel/ChatOpenAI client, retriever and from_llm prompt
+parsing) with build_chat, which binds a retriever to a cached template
+from app.chat.registry. No LLM or vector store requests are made; the
+local vector store backend is used so no Pinecone credentials are needed.
+
+Usage:
+    python scripts/bench_build_chat.py [iterations]
+"""
+import os
+import sys
+import time
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("VECTOR_STORE_BACKEND", "local")
+
+
+def measure(fn, iterations):
+    fn()  # first call builds shared state (vector store, templates)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), statistics.quantiles(samples, n=20)[-1]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    from app.chat import build_chat, ChatArgs
+    from app.chat.llms.chatopenai import build_llm
+    from app.chat.vector_stores.pinecone import build_retriever
+    from app.chat.chains.retrieval import StreamingConversationalRetrievalChain
+
+    chat_args = ChatArgs(
+        conversation_id="bench",
+        pdf_id="bench",
+        streaming=True,
+        metadata={"conversation_id": "bench", "user_id": "bench", "pdf_id": "bench"},
+    )
+
+    def from_scratch():
+        return StreamingConversationalRetrievalChain.from_llm(
+            llm=build_llm(chat_args),
+            retriever=build_retriever(chat_args),
+            return_source_documents=True,
+            return_generated_question=True,
+        )
+
+    def from_registry():
+        return build_chat(chat_args)
+
+    print(f"{iterations} chain constructions each\n")
+    for name, fn in (("from scratch", from_scratch), ("registry", from_registry)):
+        median, p95 = measure(fn, iterations)
+        print(f"{name:>12}: median {median:7.3f} ms  p95 {p95:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
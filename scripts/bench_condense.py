@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Compare time to first answer token of the retrieval chain by condense mode.
+
+Runs StreamingConversationalRetrievalChain against local stub LLM servers
+(see stub_openai_server.py) and a retriever that sleeps to stand in for the
+vector store. Three kinds of turns are measured:
+
+    first turn       - no chat history
+    self-contained   - follow-up that needs no rewriting
+    dependent        - follow-up that refers back ("it"); the condensing stub
+                       answers with a close rewrite, so in fast mode the
+                       speculatively retrieved documents are reused
+
+with CONDENSE_MODE=always (condense, then retrieve) and fast.
+
+Usage:
+    python scripts/bench_condense.py [runs] [llm_ttft_ms] [retrieval_ms]
+"""
+import os
+import sys
+import time
+import logging
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_openai import ChatOpenAI
+
+from stub_openai_server import StubConfig, serve
+from app.chat import metrics
+from app.chat.callbacks.stream import AnswerRunTracker, _chain_name
+from app.chat.chains.retrieval import StreamingConversationalRetrievalChain
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+HISTORY = [
+    ("human", "What does the annual report cover?"),
+    ("ai", "It covers the company's results, strategy and risks for 2023."),
+]
+TURNS = {
+    "first turn": ("What does the annual report say about revenue growth in 2023?", []),
+    "self-contained": (
+        "What does the annual report say about revenue growth in 2023?",
+        HISTORY,
+    ),
+    "dependent": ("What does it say about revenue growth in 2023?", HISTORY),
+}
+CONDENSED = "What does the report say about revenue growth in 2023?"
+
+
+class SleepyRetriever(BaseRetriever):
+    delay: float = 0.15
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        time.sleep(self.delay)
+        return [Document(page_content=f"Revenue grew 12% in 2023. ({query})")]
+
+
+class FirstAnswerToken(BaseCallbackHandler):
+    def __init__(self):
+        self.runs = AnswerRunTracker()
+        self.started = time.perf_counter()
+        self.ttft = None
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self.runs.track(run_id, parent_run_id, _chain_name(serialized, kwargs))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self.runs.track(run_id, parent_run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if self.ttft is None and self.runs.is_answer(run_id):
+            self.ttft = (time.perf_counter() - self.started) * 1000
+
+
+def stub_llm(server):
+    return ChatOpenAI(
+        model="stub",
+        openai_api_key="stub",
+        openai_api_base=f"http://127.0.0.1:{server.server_port}/v1",
+        streaming=True,
+        max_retries=0,
+    )
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    llm_ttft_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 300
+    retrieval_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 150
+
+    answer_server = serve(0, StubConfig(ttft_ms=llm_ttft_ms), True)
+    condense_server = serve(
+        0, StubConfig(ttft_ms=llm_ttft_ms, token_ms=1, answer=CONDENSED), True
+    )
+
+    print(
+        f"{runs} runs per case, LLM time to first token {llm_ttft_ms:.0f} ms, "
+        f"retrieval {retrieval_ms:.0f} ms\n"
+    )
+    print(f"{'turn':>15} {'mode':>7} {'median ttft':>12} {'max':>9}  path")
+    for turn, (question, history) in TURNS.items():
+        for mode in ("always", "fast"):
+            chain = StreamingConversationalRetrievalChain.from_llm(
+                llm=stub_llm(answer_server),
+                condense_question_llm=stub_llm(condense_server),
+                retriever=SleepyRetriever(delay=retrieval_ms / 1000),
+                condense_mode=mode,
+            )
+            before = metrics.snapshot()["counters"]
+            samples = []
+            for _ in range(runs):
+                timer = FirstAnswerToken()
+                chain.invoke(
+                    {"question": question, "chat_history": history},
+                    config={"callbacks": [timer]},
+                )
+                samples.append(timer.ttft)
+            after = metrics.snapshot()["counters"]
+            paths = [
+                name.rsplit(".", 1)[-1]
+                for name in after
+                if name.startswith("chain.condense.")
+                and after[name] != before.get(name, 0)
+            ]
+            print(
+                f"{turn:>15} {mode:>7} {statistics.median(samples):9.1f} ms "
+                f"{max(samples):6.1f} ms  {', '.join(paths)}"
+            )
+
+    answer_server.shutdown()
+    condense_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Measure how many prompt tokens the context packer saves.
+
+Splits a PDF (or generated text) exactly like ingestion does, then for a
+number of queries takes the top-k chunks by word overlap with a passage of
+the text (a stand-in for vector search, which likewise tends to return the
+neighbouring chunks of the passage a question is about) and compares the tokens handed to the answer
+prompt without and with pack_context.
+
+Usage:
+    python scripts/bench_context_packing.py [pdf_path] [queries] [k]
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from app.chat.tokens import count_tokens
+from app.chat.ingestion.splitter import iter_chunks
+from app.chat.retrievers.packing import CONTEXT_TOKEN_BUDGET, pack_context
+
+
+def generated_pages(count=20):
+    rng = random.Random(0)
+    # A large vocabulary, so that only chunks of the same passage share words
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choices(letters, k=rng.randint(3, 9))) for _ in range(5000)]
+    pages = []
+    for _ in range(count):
+        sentences = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + "."
+            for _ in range(40)
+        ]
+        pages.append(" ".join(sentences))
+    return pages
+
+
+def pdf_pages(path):
+    from pypdf import PdfReader
+
+    return [page.extract_text() or "" for page in PdfReader(path).pages]
+
+
+def chunk(pages):
+    return [
+        Document(
+            page_content=chunk.text,
+            metadata={
+                "page": chunk.page,
+                "chunk_no": chunk.chunk_no,
+                "pdf_id": "bench",
+                "start_index": chunk.start_index,
+                "token_count": chunk.token_count,
+            },
+        )
+        for chunk in iter_chunks(enumerate(pages))
+    ]
+
+
+def top_k(docs, query, k):
+    query_words = set(query.lower().split())
+    scored = sorted(
+        docs,
+        key=lambda doc: len(query_words & set(doc.page_content.lower().split())),
+        reverse=True,
+    )
+    return [Document(page_content=d.page_content, metadata=dict(d.metadata)) for d in scored[:k]]
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] != "-" else None
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    pages = pdf_pages(path) if path else generated_pages()
+    docs = chunk(pages)
+    rng = random.Random(1)
+
+    before, after, chunks_out, pack_ms = [], [], [], []
+    for _ in range(queries):
+        # Ask about a passage of about one chunk anywhere on a page, so the
+        # best matches are the chunks covering it, as with vector search
+        words = rng.choice(pages).split()
+        start = rng.randint(0, max(0, len(words) - 80))
+        retrieved = top_k(docs, " ".join(words[start : start + 80]), k)
+
+        started = time.perf_counter()
+        packed = pack_context(retrieved, CONTEXT_TOKEN_BUDGET)
+        pack_ms.append((time.perf_counter() - started) * 1000)
+
+        before.append(sum(count_tokens(doc.page_content) for doc in retrieved))
+        after.append(sum(count_tokens(doc.page_content) for doc in packed))
+        chunks_out.append(len(packed))
+
+    saved = 1 - sum(after) / sum(before)
+    print(f"{len(docs)} chunks from {len(pages)} pages, {queries} queries, top {k}")
+    print(f"  context tokens, raw:    mean {statistics.mean(before):7.1f}")
+    print(f"  context tokens, packed: mean {statistics.mean(after):7.1f}  ({saved:.1%} fewer)")
+    print(f"  passages per answer:    mean {statistics.mean(chunks_out):7.2f} (from {k} chunks)")
+    print(f"  pack_context:           median {statistics.median(pack_ms):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark chat history loading on long conversations.
+
+Creates a throwaway SQLite database with one conversation of N messages
+(10,000 by default) and times, per turn:
+
+    all       - every message, like history loading used to work
+    window    - the last HISTORY_MAX_MESSAGES messages
+    budget    - the newest messages that fit in HISTORY_TOKEN_BUDGET tokens
+
+It also prints SQLite's query plan for the windowed query, which should
+use ix_message_conversation_id_created_on rather than a scan and sort.
+
+Usage:
+    python scripts/bench_history.py [messages] [runs]
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_history.sqlite3")
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("UPLOAD_URL", "http://localhost")
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples), max(samples)
+
+
+def seed(db, models, message_count):
+    user = models.User.create(email="bench@example.com", password="x")
+    pdf = models.Pdf.create(name="bench.pdf", user_id=user.id)
+    conversation = models.Conversation.create(user_id=user.id, pdf_id=pdf.id)
+
+    started = datetime.utcnow() - timedelta(seconds=message_count)
+    rows = [
+        {
+            "conversation_id": conversation.id,
+            "role": "human" if n % 2 == 0 else "ai",
+            "content": f"Message {n}: " + "lorem ipsum dolor sit amet " * 8,
+            "created_on": started + timedelta(seconds=n),
+        }
+        for n in range(message_count)
+    ]
+    db.session.execute(db.insert(models.Message), rows)
+    db.session.commit()
+    return conversation.id
+
+
+def main():
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    from app.web import create_app
+    from app.web.db import db, models
+    from app.web.api import (
+        get_messages_by_conversation_id,
+        HISTORY_MAX_MESSAGES,
+        HISTORY_TOKEN_BUDGET,
+    )
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        conversation_id = seed(db, models, message_count)
+        print(f"Conversation with {message_count} messages, {runs} runs each\n")
+
+        cases = {
+            "all": lambda: get_messages_by_conversation_id(conversation_id),
+            "window": lambda: get_messages_by_conversation_id(
+                conversation_id, limit=HISTORY_MAX_MESSAGES
+            ),
+            "budget": lambda: get_messages_by_conversation_id(
+                conversation_id,
+                limit=HISTORY_MAX_MESSAGES,
+                token_budget=HISTORY_TOKEN_BUDGET,
+            ),
+        }
+        for name, fn in cases.items():
+            messages, median, worst = timed(fn, runs)
+            print(
+                f"{name:>7}: {len(messages):>6} messages  "
+                f"median {median:8.2f} ms  max {worst:8.2f} ms"
+            )
+
+        plan = db.session.execute(
+            db.text(
+                "EXPLAIN QUERY PLAN SELECT role, content FROM message "
+                "WHERE conversation_id = :id ORDER BY created_on DESC LIMIT 20"
+            ),
+            {"id": conversation_id},
+        ).fetchall()
+        print("\nQuery plan (window):")
+        for row in plan:
+            print(f"  {row[-1]}")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Measure peak Python memory of ingestion against the length of the PDF.
+
+Generates OCR-sized pages (~3,000 characters each) on the fly and runs,
+under tracemalloc, for each page count:
+
+    materialized - the old approach: every page's text, then every chunk
+                   as a Document with its text copied into metadata, held
+                   at once before embedding (what load_and_split does)
+    streaming    - iter_batches from the ingestion pipeline, embedding each
+                   batch into fake 1536-float vectors and dropping it, as
+                   the upsert thread would
+    + bm25       - the same with the BM25 builder fed and then written, as
+                   run_ingestion does; its postings are spooled to disk and
+                   written out in term order a block at a time
+
+Embedding and upserts are not called, so the numbers are the memory the
+pipeline itself holds. Both streaming peaks should stay flat as pages grow.
+
+Usage:
+    python scripts/bench_ingest_memory.py [page_counts] [batch_size]
+    python scripts/bench_ingest_memory.py 500,1500,3000 64
+"""
+import os
+import sys
+import random
+import shutil
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.chat.ingestion.pipeline import IngestionStats, iter_batches
+from app.chat.ingestion.splitter import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS
+from app.chat.retrievers.bm25 import BM25Builder
+from app.chat.tokens import count_tokens
+
+DIMENSIONS = 1536
+
+
+def generated_pages(count, seed=0):
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choices(letters, k=rng.randint(3, 9))) for _ in range(20000)]
+    for page in range(count):
+        lines = [" ".join(rng.choice(words) for _ in range(12)) for _ in range(40)]
+        yield page, "\n".join(lines)
+
+
+def materialized(count, batch_size):
+    pages = list(generated_pages(count))
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS, length_function=count_tokens
+    )
+    docs = []
+    for page, text in pages:
+        for doc in splitter.create_documents([text], metadatas=[{"page": page}]):
+            doc.metadata["text"] = doc.page_content
+            docs.append(doc)
+    for i in range(0, len(docs), batch_size):
+        vectors = [[0.0] * DIMENSIONS for _ in docs[i : i + batch_size]]
+        del vectors
+    return len(docs)
+
+
+def streaming(count, batch_size, builder=None):
+    stats = IngestionStats()
+    chunks = 0
+    for texts, metadatas, ids, _ in iter_batches(
+        "bench", generated_pages(count), stats, builder, batch_size=batch_size
+    ):
+        vectors = [[0.0] * DIMENSIONS for _ in texts]
+        chunks += len(vectors)
+        del vectors
+    if builder is not None:
+        builder.write()
+    return chunks
+
+
+def streaming_bm25(count, batch_size):
+    root = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        return streaming(count, batch_size, BM25Builder("bench", root))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def measure(fn, count, batch_size):
+    tracemalloc.start()
+    chunks = fn(count, batch_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return chunks, peak / 2**20
+
+
+def main():
+    counts = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "500,1500,3000").split(",")]
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    count_tokens("warm up")
+
+    print(f"{CHUNK_TOKENS}-token chunks, {CHUNK_OVERLAP_TOKENS} overlap, batches of {batch_size}")
+    for count in counts:
+        for name, fn in (
+            ("materialized", materialized),
+            ("streaming", streaming),
+            ("+ bm25", streaming_bm25),
+        ):
+            chunks, peak = measure(fn, count, batch_size)
+            print(f"  {count:5d} pages  {name:>12}: {chunks:6d} chunks  peak {peak:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Exercise the LLM provider router against two local stub servers.
+
+    tail     - the primary answers in 50 ms but 10% of requests take 1.5 s
+               to a first token; the secondary always takes 150 ms. Reports
+               time to first token with hedging off and with a 300 ms hedge.
+    outage   - the primary starts failing with 429s. Shows the breaker
+               opening, requests going straight to the secondary while it is
+               open, and the half-open probe closing it again once the
+               primary recovers.
+
+Usage:
+    python scripts/bench_llm_router.py [requests]
+"""
+import os
+import sys
+import time
+import logging
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+from stub_openai_server import StubConfig, serve
+from app.chat.llms.router import CircuitBreaker, Provider, ProviderRouter
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+MESSAGES = [HumanMessage(content="What is in the document?")]
+
+
+def stub_provider(name, server, cooldown=30.0):
+    port = server.server_port
+    provider = Provider(
+        name,
+        lambda: ChatOpenAI(
+            model=name,
+            openai_api_key="stub",
+            openai_api_base=f"http://127.0.0.1:{port}/v1",
+            timeout=10,
+            max_retries=0,
+        ),
+    )
+    provider.breaker = CircuitBreaker(3, cooldown)
+    return provider
+
+
+def time_to_first_token(router):
+    started = time.perf_counter()
+    stream = router.stream(MESSAGES)
+    next(stream)
+    ttft = (time.perf_counter() - started) * 1000
+    for _ in stream:
+        pass
+    return ttft
+
+
+def tail(requests):
+    primary = serve(0, StubConfig(ttft_ms=50, slow_rate=0.1, slow_ms=1500), True)
+    secondary = serve(0, StubConfig(ttft_ms=150), True)
+
+    print(f"tail: {requests} streamed requests per mode")
+    for label, hedge_after_ms in (("no hedge", "0"), ("hedge 300 ms", "300")):
+        router = ProviderRouter(
+            [stub_provider("primary", primary), stub_provider("secondary", secondary)],
+            hedge_after_ms=hedge_after_ms,
+        )
+        samples = sorted(time_to_first_token(router) for _ in range(requests))
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(
+            f"  {label:>12}: ttft p50 {statistics.median(samples):7.1f} ms  "
+            f"p95 {p95:7.1f} ms  max {samples[-1]:7.1f} ms  "
+            f"hedge wins {router.stats()['secondary']['hedge_wins']}"
+        )
+
+    primary.shutdown()
+    secondary.shutdown()
+
+
+def outage():
+    primary_config = StubConfig(ttft_ms=20, fail_rate=1.0, fail_status=429)
+    primary = serve(0, primary_config, True)
+    secondary = serve(0, StubConfig(ttft_ms=20), True)
+    router = ProviderRouter(
+        [
+            stub_provider("primary", primary, cooldown=1.0),
+            stub_provider("secondary", secondary),
+        ]
+    )
+
+    print("\noutage: primary returns 429s, breaker cooldown 1 s")
+    for n in range(6):
+        router.generate(MESSAGES)
+        print(
+            f"  request {n + 1}: primary {router.stats()['primary']['state']:>9}, "
+            f"primary calls so far {primary_config.requests}"
+        )
+
+    primary_config.fail_rate = 0.0
+    time.sleep(1.1)
+    router.generate(MESSAGES)
+    print(
+        f"  after cooldown, primary recovered: {router.stats()['primary']['state']}, "
+        f"primary calls so far {primary_config.requests}"
+    )
+
+    primary.shutdown()
+    secondary.shutdown()
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    tail(requests)
+    outage()
+
+
+if __name__ == "__main__":
+    main()
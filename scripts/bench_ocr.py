@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Show where extraction time goes for a PDF, page by page.
+
+Runs the ingestion pipeline's page extraction (text layer, then OCR for
+pages without a usable one) twice and reports for each run:
+
+    wall       - elapsed time for all pages
+    methods    - pages per method: text, ocr, ocr_cached, ocr_empty,
+                 blank, ocr_unavailable
+    extract    - summed time in the text layer, over all workers
+    ocr        - summed render + OCR time
+    slowest    - the slowest pages
+
+The second run shows the effect of the page-image OCR cache (a retry or
+re-ingest of the same PDF). Pass --cold to use an empty cache directory
+for the first run.
+
+Usage:
+    python scripts/bench_ocr.py path/to/file.pdf [--cold]
+"""
+import os
+import sys
+import time
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if "--cold" in sys.argv:
+    os.environ["OCR_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_ocr_")
+
+from app.chat.ingestion.pipeline import IngestionStats, iter_pages
+
+
+def run(path):
+    stats = IngestionStats()
+    started = time.perf_counter()
+    for _ in iter_pages(path, stats):
+        stats.pages += 1
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def main():
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+
+    for label in ("first run", "second run"):
+        stats = run(paths[0]).as_dict()
+        print(f"{label}: {stats['pages']} pages")
+        print(f"  wall:    {stats['seconds']:8.2f} s")
+        print(f"  methods: {stats['page_methods']}")
+        print(f"  extract: {stats['extract_seconds']:8.2f} s summed over pages")
+        print(f"  ocr:     {stats['ocr_seconds']:8.2f} s summed over pages")
+        for page in stats["slowest_pages"]:
+            print(f"  slowest: page {page['page']:5d}  {page['ms']:8.1f} ms  {page['method']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-operation Pinecone latency with and without the pooled client.
+
+"fresh" reproduces the old behaviour of delete_embeddings_for_pdf: a new
+Pinecone client, a list_indexes() call and a new Index handle for every
+operation. "pooled" reuses the process-wide Index handle from
+app.chat.vector_stores.pinecone. The operation itself is a fetch of a
+non-existent ID, so the benchmark doesn't modify the index.
+
+Usage:
+    PINECONE_API_KEY=... PINECONE_INDEX_NAME=... python scripts/bench_pinecone.py [runs]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pinecone import Pinecone
+from app.chat.vector_stores.pinecone import (
+    PINECONE_API_KEY,
+    PINECONE_INDEX_NAME,
+    get_index,
+)
+
+PROBE_ID = "bench:does-not-exist"
+
+
+def fresh_operation():
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    index_names = [index_info["name"] for index_info in pc.list_indexes()]
+    assert PINECONE_INDEX_NAME in index_names
+    pc.Index(PINECONE_INDEX_NAME).fetch(ids=[PROBE_ID])
+
+
+def pooled_operation():
+    get_index().fetch(ids=[PROBE_ID])
+
+
+def measure(operation, runs):
+    operation()  # connection set-up is not what we are measuring
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        operation()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "mean": statistics.mean(timings),
+    }
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for name, operation in (("fresh", fresh_operation), ("pooled", pooled_operation)):
+        result = measure(operation, runs)
+        print(
+            f"{name:>6}: p50 {result['p50']:7.1f} ms  p95 {result['p95']:7.1f} ms  "
+            f"mean {result['mean']:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cross-encoder rerank stage on CPU.
+
+Scores a synthetic candidate list (30 chunks of ~120 words by default) for
+a set of queries and reports:
+
+    load     - time to load the cross-encoder
+    cold     - p50/p95 of rerank() with nothing cached (one batched forward)
+    cached   - p50/p95 of the same queries again, answered from the cache
+    budget   - how many cold calls overran RERANK_BUDGET_MS
+    tokens   - prompt tokens for all candidates vs the top_n sent on
+
+Needs sentence-transformers; the model is downloaded on first run.
+
+Usage:
+    python scripts/bench_rerank.py [candidates] [queries] [top_n]
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain_core.documents import Document
+
+from app.chat import metrics
+from app.chat.retrievers import rerank
+from app.chat.tokens import count_tokens
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    top_n = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choices(letters, k=rng.randint(3, 9))) for _ in range(5000)]
+
+    _, load_ms = timed(rerank.get_cross_encoder)
+    # The first forward pass allocates; keep it out of the numbers
+    rerank.get_cross_encoder().predict([("warm up", "warm up")])
+
+    cases = []
+    for q in range(queries):
+        docs = [
+            Document(
+                id=f"bench:{q}:{n}",
+                page_content=" ".join(rng.choice(words) for _ in range(120)),
+            )
+            for n in range(count)
+        ]
+        query = " ".join(rng.choice(words) for _ in range(rng.randint(5, 12)))
+        cases.append((query, docs))
+
+    # No budget for the cold pass, so every call measures a full forward
+    cold = [timed(lambda: rerank.rerank(q, d, top_n, budget_ms=60000))[1] for q, d in cases]
+    cached = [timed(lambda: rerank.rerank(q, d, top_n))[1] for q, d in cases]
+    over = sum(ms > rerank.RERANK_BUDGET_MS for ms in cold)
+
+    tokens_all = statistics.mean(sum(count_tokens(d.page_content) for d in docs) for _, docs in cases)
+    tokens_top = statistics.mean(
+        sum(count_tokens(d.page_content) for d in docs[:top_n]) for _, docs in cases
+    )
+
+    print(f"{rerank.RERANK_MODEL}, {count} candidates -> {top_n}, {queries} queries")
+    print(f"  load:   {load_ms:8.1f} ms")
+    print(
+        f"  cold:   p50 {statistics.median(cold):7.1f} ms  p95 {percentile(cold, 0.95):7.1f} ms"
+    )
+    print(
+        f"  cached: p50 {statistics.median(cached):7.3f} ms  p95 {percentile(cached, 0.95):7.3f} ms"
+    )
+    print(f"  budget: {over}/{queries} cold calls over {rerank.RERANK_BUDGET_MS:.0f} ms")
+    print(f"  tokens: {tokens_all:.0f} for all candidates, {tokens_top:.0f} sent on")
+    print(f"  counters: {metrics.snapshot()['counters']}")
+
+
+if __name__ == "__main__":
+    main()
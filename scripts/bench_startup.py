@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark the startup cost of the web app.
+
+Each run uses a fresh interpreter and reports how long importing
+app.web takes and how long create_app() takes afterwards. Neither should
+load the embedding model or touch the network; run with WARMUP_ON_START
+unset to measure that.
+
+Usage:
+    python scripts/bench_startup.py [runs]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app.web import create_app
+imported = time.perf_counter()
+create_app()
+created = time.perf_counter()
+print(json.dumps({"import": imported - started, "create_app": created - imported}))
+"""
+
+
+def run_once():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [run_once() for _ in range(runs)]
+
+    for key in ("import", "create_app"):
+        values = [r[key] for r in results]
+        print(
+            f"{key:>10}: median {statistics.median(values) * 1000:8.1f} ms  "
+            f"min {min(values) * 1000:8.1f} ms  max {max(values) * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible chat completions server for exercising the LLM
+router without real providers.
+
+Serves POST /v1/chat/completions, streaming and non-streaming, with a
+configurable time to first token, per-token delay, share of slow requests
+and share of failed requests. Point a provider at it through its base URL:
+
+    python scripts/stub_openai_server.py --port 9001 --fail-rate 0.5 &
+    python scripts/stub_openai_server.py --port 9002 --ttft-ms 200 &
+    OPENAI_BASE_URL=http://localhost:9001/v1 OPENAI_API_KEY=stub \\
+    DEEPSEEK_BASE_URL=http://localhost:9002/v1 DEEPSEEK_API_KEY=stub \\
+    inv dev
+
+Usage:
+    python scripts/stub_openai_server.py [--port 9001] [--ttft-ms 50]
+        [--token-ms 5] [--slow-rate 0] [--slow-ms 2000]
+        [--fail-rate 0] [--fail-status 429] [--answer TEXT]
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = "This is a stub answer from a local OpenAI-compatible server."
+
+
+class StubConfig:
+    def __init__(
+        self,
+        ttft_ms=50,
+        token_ms=5,
+        slow_rate=0.0,
+        slow_ms=2000,
+        fail_rate=0.0,
+        fail_status=429,
+        answer=DEFAULT_ANSWER,
+    ):
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.answer = answer
+        self.requests = 0
+
+
+def _make_handler(config: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            config.requests += 1
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._json(404, {"error": {"message": "Not found"}})
+
+            if random.random() < config.fail_rate:
+                return self._json(
+                    config.fail_status,
+                    {"error": {"message": "Stub failure", "type": "stub_error"}},
+                )
+
+            payload = json.loads(body or b"{}")
+            ttft = config.ttft_ms
+            if random.random() < config.slow_rate:
+                ttft = config.slow_ms
+            time.sleep(ttft / 1000)
+
+            model = payload.get("model", "stub")
+            tokens = [f"{word} " for word in config.answer.split()]
+            if payload.get("stream"):
+                return self._stream(model, tokens)
+
+            time.sleep(config.token_ms * len(tokens) / 1000)
+            self._json(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": len(tokens), "total_tokens": len(tokens) + 1},
+                },
+            )
+
+        def _stream(self, model, tokens):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            try:
+                for n, token in enumerate(tokens):
+                    if n:
+                        time.sleep(config.token_ms / 1000)
+                    delta = {"content": token}
+                    if n == 0:
+                        delta["role"] = "assistant"
+                    self._event(completion_id, model, delta, None)
+                self._event(completion_id, model, {}, "stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            self.close_connection = True
+
+        def _event(self, completion_id, model, delta, finish_reason):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        def _json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def serve(port: int, config: StubConfig, background: bool = False):
+    """Starts a stub server; with background set, returns it once listening"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(config))
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"Stub OpenAI server on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return server
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--ttft-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--fail-status", type=int, default=429)
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    args = parser.parse_args(argv)
+
+    serve(
+        args.port,
+        StubConfig(
+            ttft_ms=args.ttft_ms,
+            token_ms=args.token_ms,
+            slow_rate=args.slow_rate,
+            slow_ms=args.slow_ms,
+            fail_rate=args.fail_rate,
+            fail_status=args.fail_status,
+            answer=args.answer,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -11,6 +11,15 @@ def dev(ctx):
     )
 
 
+@task
+def devasgi(ctx):
+    ctx.run(
+        "uvicorn --factory app.web.asgi:create_asgi_app --reload --port 8000",
+        pty=os.name != "nt",
+        env={"APP_ENV": "development"},
+    )
+
+
 @task
 def devworker(ctx):
     ctx.run(
@@ -18,3 +27,12 @@ def devworker(ctx):
         pty=os.name != "nt",
         env={"APP_ENV": "development"},
     )
+
+
+@task
+def embedserver(ctx):
+    ctx.run(
+        "python -m app.chat.embeddings.server",
+        pty=os.name != "nt",
+        env={"APP_ENV": "development"},
+    )
@@ -0,0 +1,75 @@
+import tempfile
+
+from langchain_core.documents import Document
+
+from app.chat.retrievers.bm25 import BM25Builder, BM25Index, tokenize
+from app.chat.retrievers.hybrid import reciprocal_rank_fusion
+
+
+def test_tokenize_keeps_compounds_whole_and_in_parts():
+    assert tokenize("Error ERR-1042 in clause 4.2.1") == [
+        "error", "err-1042", "err", "1042", "in", "clause", "4.2.1",
+    ]
+    # Single-character parts aren't indexed on their own
+    assert tokenize("v1.2") == ["v1.2", "v1"]
+
+
+def build_index(root, texts):
+    builder = BM25Builder("pdf", root=root)
+    for n, text in enumerate(texts):
+        builder.add(f"pdf:0:{n}", text, {"pdf_id": "pdf", "page": 0, "chunk_no": n})
+    return BM25Index(builder.write())
+
+
+def test_search_ranks_matching_chunks():
+    with tempfile.TemporaryDirectory() as root:
+        index = build_index(
+            root,
+            [
+                "the pump reports ERR-1042 when the valve sticks",
+                "routine maintenance of the pump",
+                "nothing relevant here",
+                "ERR-1042 ERR-1042 means the valve is stuck",
+            ],
+        )
+        results = index.search("err-1042 valve", k=10)
+        assert [n for n, _ in results][:2] == [3, 0]
+        assert all(score > 0 for _, score in results)
+        # A part of a compound token matches too
+        assert {n for n, _ in index.search("1042", k=10)} == {0, 3}
+        assert index.search("unknown words", k=10) == []
+        assert len(index.search("the", k=1)) == 1
+
+        docs = index.documents("maintenance", k=1)
+        assert docs[0].id == "pdf:0:1"
+        assert docs[0].metadata["chunk_no"] == 1
+        assert "bm25_score" in docs[0].metadata
+
+
+def doc(n):
+    return Document(id=f"pdf:0:{n}", page_content=f"chunk {n}", metadata={})
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = [doc(1), doc(2), doc(3)]
+    lexical = [doc(3), doc(4)]
+    fused = reciprocal_rank_fusion([dense, lexical], k=3, rrf_k=60)
+    # 2 and 4 tie at rank 2 of one list; the first seen comes first
+    assert [d.id for d in fused] == ["pdf:0:3", "pdf:0:1", "pdf:0:2"]
+    assert fused[0].metadata["rrf_score"] == round(1 / 63 + 1 / 61, 6)
+
+
+def test_reciprocal_rank_fusion_matches_chunks_without_ids():
+    by_metadata = Document(
+        page_content="chunk 1", metadata={"pdf_id": "pdf", "page": 0, "chunk_no": 1}
+    )
+    fused = reciprocal_rank_fusion([[doc(1)], [by_metadata]], k=5)
+    assert len(fused) == 1
+    assert fused[0].id == "pdf:0:1"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,53 @@
+from app.chat.ingestion.splitter import iter_chunks
+
+PAGES = [
+    (0, " ".join(f"first{n}" for n in range(60)) + " the sentence breaks"),
+    (1, ""),
+    (2, "across the page. " + " ".join(f"second{n}" for n in range(60))),
+]
+
+
+def test_start_index_points_into_the_page():
+    texts = dict(PAGES)
+    chunks = list(iter_chunks(PAGES, chunk_tokens=40, overlap_tokens=8))
+    assert len(chunks) > 2
+    for chunk in chunks:
+        page_text = texts[chunk.page]
+        if chunk.start_index >= 0:
+            assert page_text[chunk.start_index :].startswith(chunk.text)
+        else:
+            # Opens with carried text; the rest is the start of the page
+            own = chunk.text[-chunk.start_index :].lstrip()
+            assert page_text.startswith(own)
+        assert chunk.token_count > 0
+
+
+def test_tail_of_previous_page_is_carried_over_blank_pages():
+    chunks = list(iter_chunks(PAGES, chunk_tokens=40, overlap_tokens=8))
+    assert not [chunk for chunk in chunks if chunk.page == 1]
+    last_of_first = [chunk for chunk in chunks if chunk.page == 0][-1]
+    first_of_third = [chunk for chunk in chunks if chunk.page == 2][0]
+    assert first_of_third.start_index < 0
+    assert "the sentence breaks across the page." in first_of_third.text
+    carried = first_of_third.text[: -first_of_third.start_index].strip()
+    assert last_of_first.text.endswith(carried)
+
+
+def test_chunk_numbers_restart_per_page_and_output_is_stable():
+    chunks = list(iter_chunks(PAGES, chunk_tokens=40, overlap_tokens=8))
+    for page in (0, 2):
+        numbers = [chunk.chunk_no for chunk in chunks if chunk.page == page]
+        assert numbers == list(range(len(numbers)))
+    assert list(iter_chunks(PAGES, chunk_tokens=40, overlap_tokens=8)) == chunks
+
+
+def test_no_overlap_carries_nothing():
+    chunks = list(iter_chunks(PAGES, chunk_tokens=40, overlap_tokens=0))
+    assert all(chunk.start_index >= 0 for chunk in chunks)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
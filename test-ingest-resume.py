@@ -0,0 +1,87 @@
+from app.chat.ingestion.pipeline import (
+    Checkpoint,
+    CheckpointMismatch,
+    IngestionStats,
+    iter_batches,
+)
+
+# Page 2 is blank
+PAGES = [
+    (page, "" if page == 2 else " ".join(f"page{page}word{n}" for n in range(150)))
+    for page in range(5)
+]
+
+
+def run(pages, resume=None):
+    stats = IngestionStats()
+    batches = list(iter_batches("pdf", pages, stats, batch_size=5, resume=resume))
+    return stats, batches
+
+
+def ids_of(batches):
+    return [id for _, _, ids, _ in batches for id in ids]
+
+
+def test_batches_report_pages_done():
+    stats, batches = run(PAGES)
+    assert stats.pages == len(PAGES)
+    assert len(stats.chunk_counts) == len(PAGES)
+    assert stats.chunk_counts[2] == 0
+    done = [pages_done for _, _, _, pages_done in batches]
+    assert done == sorted(done)
+    # The run's own final checkpoint covers pages finished by a full batch
+    assert done[-1] <= len(PAGES)
+    for texts, metadatas, ids, pages_done in batches:
+        assert len(texts) == len(metadatas) == len(ids) <= 5
+        # Every page before pages_done is complete by this batch
+        assert all(metadata["page"] >= pages_done - 1 for metadata in metadatas)
+
+
+def test_resume_yields_only_the_remaining_pages():
+    stats, batches = run(PAGES)
+    full = ids_of(batches)
+    checkpoint = Checkpoint(pages_done=3, pages_total=len(PAGES), chunk_counts=stats.chunk_counts)
+    resumed_stats, resumed = run(PAGES, resume=checkpoint)
+    skipped = checkpoint.chunks
+    assert skipped == sum(stats.chunk_counts[:3])
+    assert ids_of(resumed) == full[skipped:]
+    assert resumed_stats.chunk_counts == stats.chunk_counts
+
+
+def test_checkpoint_extent_can_run_past_pages_done():
+    stats, _ = run(PAGES)
+    checkpoint = Checkpoint(pages_done=1, chunk_counts=stats.chunk_counts)
+    assert checkpoint.chunks == stats.chunk_counts[0]
+
+
+def test_changed_pdf_raises_checkpoint_mismatch():
+    stats, _ = run(PAGES)
+    checkpoint = Checkpoint(pages_done=2, chunk_counts=stats.chunk_counts)
+    changed = list(PAGES)
+    changed[0] = (0, "a much shorter first page")
+    try:
+        run(changed, resume=checkpoint)
+    except CheckpointMismatch:
+        pass
+    else:
+        raise AssertionError("CheckpointMismatch not raised")
+
+
+def test_mismatch_detected_when_every_page_was_done():
+    stats, _ = run(PAGES)
+    checkpoint = Checkpoint(pages_done=len(PAGES), chunk_counts=stats.chunk_counts)
+    _, batches = run(PAGES, resume=checkpoint)
+    assert batches == []
+    try:
+        run(PAGES[:-1], resume=checkpoint)
+    except CheckpointMismatch:
+        pass
+    else:
+        raise AssertionError("CheckpointMismatch not raised")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,59 @@
+import tempfile
+
+import numpy as np
+
+from app.chat.vector_stores import local
+from app.chat.vector_stores.local import _Partition
+
+
+def batch(count, seed=0):
+    vectors = np.random.default_rng(seed).random((count, 8), dtype=np.float32)
+    records = [
+        {"id": f"pdf:0:{n}", "text": f"chunk {n}", "metadata": {"pdf_id": "pdf"}}
+        for n in range(count)
+    ]
+    return vectors, records
+
+
+def check_readding_the_same_batch(count):
+    vectors, records = batch(count)
+    with tempfile.TemporaryDirectory() as root:
+        partition = _Partition(f"{root}/pdf").load()
+        partition.add(vectors, records)
+        before = partition.search(vectors[3], k=3)
+        # A retried batch re-upserts every id already stored
+        partition.add(vectors, records)
+        assert partition.count == count
+        assert partition.search(vectors[3], k=3)[0][0] == before[0][0] == 3
+        assert partition.records([3])[0]["id"] == "pdf:0:3"
+
+        reloaded = _Partition(f"{root}/pdf").load()
+        assert reloaded.count == count
+        assert sorted(reloaded.positions()) == sorted(r["id"] for r in records)
+
+
+def test_readding_the_same_records_is_an_upsert():
+    check_readding_the_same_batch(10)
+
+
+def test_readding_the_same_records_with_an_hnsw_graph():
+    check_readding_the_same_batch(local.HNSW_MIN_VECTORS)
+
+
+def test_overlapping_batch_replaces_stored_records():
+    vectors, records = batch(10)
+    with tempfile.TemporaryDirectory() as root:
+        partition = _Partition(f"{root}/pdf").load()
+        partition.add(vectors[:6], records[:6])
+        partition.add(vectors[4:], records[4:])
+        assert partition.count == 10
+        assert sorted(partition.positions()) == sorted(r["id"] for r in records)
+        for n in (0, 5, 9):
+            assert partition.search(vectors[n], k=1)[0][0] == partition.positions()[f"pdf:0:{n}"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,43 @@
+from app.chat.ingestion.ocr import needs_ocr
+
+
+def never_called():
+    raise AssertionError("has_text_objects called for a page with text")
+
+
+def test_page_without_text_objects_is_empty():
+    assert needs_ocr("", lambda: False) == "empty"
+    assert needs_ocr("  \n ", lambda: False) == "empty"
+
+
+def test_text_objects_that_extract_to_nothing_are_garbage():
+    assert needs_ocr("", lambda: True) == "garbage"
+
+
+def test_born_digital_text_is_kept():
+    text = "The quick brown fox jumps over the lazy dog. " * 3
+    assert needs_ocr(text, never_called) is None
+
+
+def test_short_text_is_kept():
+    # A title or figure page with a few words
+    assert needs_ocr("Figure 3", never_called) is None
+    assert needs_ocr("§ ¶ †", never_called) is None
+
+
+def test_unmapped_glyphs_are_garbage():
+    text = "(cid:12)(cid:7)(cid:33) " * 10
+    assert needs_ocr(text, never_called) == "garbage"
+    assert needs_ocr("#$%&*@!^ ~=+<>|{}" * 3, never_called) == "garbage"
+
+
+def test_leader_dots_dont_count_against_the_text():
+    text = "Introduction ........................................ 1\n" * 3
+    assert needs_ocr(text, never_called) is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,80 @@
+from langchain_core.documents import Document
+
+from app.chat.retrievers.packing import merge_chunks, pack_context
+
+
+def chunk(page, chunk_no, start, text, tokens=None):
+    return Document(
+        id=f"pdf:{page}:{chunk_no}",
+        page_content=text,
+        metadata={
+            "pdf_id": "pdf",
+            "page": page,
+            "chunk_no": chunk_no,
+            "start_index": start,
+            "token_count": tokens if tokens is not None else len(text.split()),
+        },
+    )
+
+
+def test_merges_overlapping_chunks_of_a_page():
+    page = "alpha beta gamma delta epsilon zeta"
+    first = chunk(0, 0, 0, page[:16])  # "alpha beta gamma"
+    second = chunk(0, 1, 11, page[11:])  # "gamma delta epsilon zeta"
+    spans = merge_chunks([second, first])
+    assert len(spans) == 1
+    assert spans[0].text == page
+    assert spans[0].chunk_nos == [0, 1]
+    # Keeps the rank of its best chunk
+    assert spans[0].rank == 0
+
+
+def test_keeps_separate_pages_and_gaps_apart():
+    a = chunk(0, 0, 0, "one two")
+    b = chunk(0, 1, 50, "three four")
+    c = chunk(1, 0, 0, "five six")
+    spans = merge_chunks([c, a, b])
+    assert [span.text for span in spans] == ["five six", "one two", "three four"]
+
+
+def test_drops_repeated_text_and_keeps_unpositioned_chunks():
+    a = chunk(0, 0, 0, "same text")
+    b = chunk(3, 0, 0, "same text")
+    loose = Document(page_content="no position", metadata={"token_count": 2})
+    spans = merge_chunks([a, b, loose])
+    assert [span.text for span in spans] == ["same text", "no position"]
+    assert spans[1].start is None
+
+
+def test_packs_most_relevant_first_within_budget():
+    big = chunk(0, 0, 0, "big " * 10, tokens=10)
+    large = chunk(1, 0, 0, "large " * 8, tokens=8)
+    small = chunk(2, 0, 0, "small", tokens=1)
+    packed = pack_context([big, large, small], token_budget=12)
+    # large doesn't fit after big, the smaller, less relevant chunk does
+    assert [doc.id for doc in packed] == ["pdf:0:0", "pdf:2:0"]
+    assert sum(doc.metadata["token_count"] for doc in packed) == 11
+
+
+def test_always_keeps_the_best_span():
+    big = chunk(0, 0, 0, "big " * 10, tokens=10)
+    packed = pack_context([big], token_budget=3)
+    assert len(packed) == 1
+
+
+def test_merged_passage_keeps_first_chunk_id():
+    first = chunk(0, 0, 0, "alpha beta gamma", tokens=3)
+    second = chunk(0, 1, 11, "gamma delta", tokens=2)
+    packed = pack_context([second, first], token_budget=100)
+    assert len(packed) == 1
+    assert packed[0].id == "pdf:0:0"
+    assert packed[0].metadata["chunk_nos"] == [0, 1]
+    assert packed[0].metadata["start_index"] == 0
+    assert packed[0].page_content == "alpha beta gamma delta"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")